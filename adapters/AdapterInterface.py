@@ -10,6 +10,10 @@ from models.VO import VO
 
 
 class AdapterInterface(metaclass=abc.ABCMeta):
+    # interface methods the adapter always rejects with AdapterSkipException,
+    # AdaptersManager does not route them to the adapter at all
+    UNSUPPORTED_METHODS: frozenset[str] = frozenset()
+
     @classmethod
     def __subclasshook__(cls, subclass):
         return (
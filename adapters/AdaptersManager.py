@@ -1,5 +1,9 @@
+import functools
 import inspect
-from typing import List, Union, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from types import MappingProxyType
+from typing import List, Optional
 
 from adapters.PerunRpcAdapter import PerunRpcAdapter
 from adapters.LdapAdapter import LdapAdapter
@@ -7,20 +11,52 @@ from adapters.LdapAdapter import AdapterSkipException
 from utils.Logger import Logger
 
 from adapters.AdapterInterface import AdapterInterface
-from models.Facility import Facility
-from models.Group import Group
-from models.User import User
-from models.UserExtSource import UserExtSource
-from models.VO import VO
+from models.LoginContext import LoginContext
 from perun_openapi import ApiException
+from utils.CircuitBreaker import CircuitBreaker
 from utils.ConfigStore import ConfigStore
+from utils.HedgingPolicy import HedgingPolicy
+from utils.SingleFlight import SingleFlight
+from utils.VoCache import VoCache
+
+
+def _delegate_by_priority(method_name: str):
+    """Creates method delegating the call to adapters by their priority,
+    the name of the called method is bound once, when the class is created"""
+
+    interface_method = getattr(AdapterInterface, method_name)
+    signature = inspect.signature(interface_method)
+
+    def delegate(self, *args, **kwargs):
+        if kwargs:
+            # adapters get all arguments positionally, as they did from the
+            # methods written out for each interface method
+            bound_arguments = signature.bind(self, *args, **kwargs)
+            bound_arguments.apply_defaults()
+            args = bound_arguments.args[1:]
+        return self._execute_method_by_priority(method_name, *args)
+
+    # copy name, signature and docs of the interface method, but not its
+    # abstract flag stored in __dict__
+    return functools.update_wrapper(delegate, interface_method, updated=())
 
 
 class AdaptersManager(AdapterInterface):
+    _READ_ONLY_METHOD_PREFIXES = ("get_", "is_")
+
     def __init__(self, config=ConfigStore.get_adapters_manager_config()):
         self._logger = Logger.get_logger(self.__class__.__name__)
         self._STARTING_PRIORITY = 1
         self.adapters = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.get("max_parallel_calls", 4)),
+            thread_name_prefix=self.__class__.__name__,
+        )
+
+        # VOs are looked up by both adapters, so they share a single cache
+        self._vo_cache = None
+        if "vo_cache" in config:
+            self._vo_cache = VoCache(config["vo_cache"] or {})
 
         adapters_info = config["adapters"]
 
@@ -30,17 +66,19 @@ class AdaptersManager(AdapterInterface):
             priority = config_data.pop("priority")
 
             if adapter_type == "ldap":
-                ldap_adapter = LdapAdapter(config_data)
+                ldap_adapter = LdapAdapter(config_data, self._vo_cache)
 
                 self.adapters[priority] = {
                     "name": "ldap_adapter",
+                    "type": adapter_type,
                     "adapter": ldap_adapter,
                 }
             elif adapter_type == "openApi":
-                rpc_adapter = PerunRpcAdapter(config_data)
+                rpc_adapter = PerunRpcAdapter(config_data, self._vo_cache)
 
                 self.adapters[priority] = {
                     "name": "rpc_adapter",
+                    "type": adapter_type,
                     "adapter": rpc_adapter,
                 }
             else:
@@ -49,192 +87,483 @@ class AdaptersManager(AdapterInterface):
                     f'{adapter_type}"'
                 )
 
-    def _execute_method_by_priority(self, method_name: str, *args):
-        current_priority = self._STARTING_PRIORITY
-        current_adapter = self.adapters.get(current_priority)
-
-        while current_adapter is not None:
-            adapter_impl = current_adapter["adapter"]
-            try:
-                return getattr(adapter_impl, method_name)(*args)
-            except AdapterSkipException:
-                self._logger.warning(
-                    f'Method "{method_name}" is not supported by '
-                    f'{current_adapter["name"]}. Going to try another '
-                    f'adapter if available.')
-                current_priority += 1
-                current_adapter = self.adapters.get(current_priority)
-            except ApiException as ex:
-                if 'notexistsexception"' in ex.body.lower():
-                    self._logger.warning(
-                        "Requested entity doesn't exist in Perun")
-                raise
-            except Exception as ex:
-                self._logger.warning(
-                    f'Method "{method_name}" could not be executed '
-                    f'successfully by {current_adapter["name"]}, exception '
-                    f'occurred: "{ex}"')
-                raise
-
-        raise Exception(
-            f'None of the provided adapters was able to resolve method "'
-            f'{method_name}"'
-        )
-
-    def _get_caller_name(self):
-        return inspect.stack()[1].function
-
-    def get_perun_user(self, idp_id: str, uids: List[str]) -> Optional[User]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), idp_id, uids
-        )
-
-    def get_group_by_name(self, vo: Union[int, VO], name: str) -> Group:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), vo, name
-        )
-
-    def get_vo(self, short_name: str, vo_id: int) -> VO:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), short_name, vo_id
-        )
-
-    def get_member_groups(self, user: Union[int, User], vo: Union[int, VO]) -> List[Group]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user, vo
-        )
-
-    def get_sp_groups_by_facility(self, facility: Union[Facility, int]) -> List[Group]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility
-        )
-
-    def get_sp_groups_by_rp_id(self, rp_id: str) -> List[Group]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), rp_id
-        )
-
-    def get_user_attributes(
-            self, user: Union[int, User], attr_names: List[str]
-    ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user, attr_names
+        self._probe_executor = None
+        breaker_config = None
+        if "circuit_breaker" in config:
+            breaker_config = config["circuit_breaker"] or {}
+            self._probe_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"{self.__class__.__name__}Probe",
+            )
+        for adapter in self.adapters.values():
+            adapter["circuit_breaker"] = (
+                CircuitBreaker(adapter["name"], breaker_config)
+                if breaker_config is not None
+                else None
+            )
+
+        self._adapters_by_method = self._get_adapters_by_method(
+            config.get("method_priorities") or {}
         )
 
-    def get_entityless_attribute(
-            self, attr_name: str
-    ) -> Union[str, Optional[int], bool, List[str], dict[str, str]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), attr_name
+        hedging_config = config.get("hedging") or {}
+        self._hedging_policy = HedgingPolicy({
+            **hedging_config,
+            "methods": self._get_hedged_methods(hedging_config),
+        })
+        self._single_flight = SingleFlight(
+            self._get_coalesced_methods(config["single_flight"] or {})
+            if "single_flight" in config
+            else ()
         )
 
-    def get_vo_attributes(
-            self, vo: Union[int, VO], attr_names: List[str]
-    ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), vo, attr_names
-        )
-
-    def get_facility_attribute(
-            self, facility: Union[int, Facility], attr_name: str
-    ) -> Union[str, Optional[int], bool, List[str], dict[str, str]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility, attr_name
-        )
-
-    def get_facility_by_rp_identifier(
-            self, rp_identifier: str
-    ) -> Facility:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), rp_identifier
-        )
-
-    def get_users_groups_on_facility_by_rp_id(
-            self, rp_identifier: str, user: Union[User, int]
-    ) -> List[Group]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), rp_identifier, user
-        )
-
-    def get_users_groups_on_facility(
-            self, facility: Union[Facility, int], user: Union[User, int]
-    ) -> List[Group]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility, user
-        )
-
-    def get_facilities_by_attribute_value(
-            self, attribute: dict[str, str]
-    ) -> List[Facility]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), attribute
-        )
+        self._audit_log_consumer = None
+        if "audit_log_consumer" in config:
+            self._audit_log_consumer = self._create_audit_log_consumer(
+                config["audit_log_consumer"] or {}
+            )
+
+        # hedged calls get their own threads, so that calls submitted by
+        # get_login_context can't wait for threads they occupy themselves
+        self._hedging_executor = None
+        if self._hedging_policy.methods:
+            self._hedging_executor = ThreadPoolExecutor(
+                max_workers=int(hedging_config.get("max_parallel_calls", 8)),
+                thread_name_prefix=f"{self.__class__.__name__}Hedging",
+            )
+
+    def _get_read_only_methods(self) -> List[str]:
+        return [
+            method_name for method_name in AdapterInterface.__abstractmethods__
+            if method_name.startswith(self._READ_ONLY_METHOD_PREFIXES)
+        ]
+
+    def _get_hedged_methods(self, hedging_config: dict) -> List[str]:
+        """Get methods listed in the config which are read-only, a hedged
+        write would be executed by two adapters"""
+        read_only_methods = self._get_read_only_methods()
+        method_names = hedging_config.get("methods") or []
+        for method_name in set(method_names) - set(read_only_methods):
+            self._logger.warning(
+                f'Config file enables hedging of method "{method_name}" '
+                f'which is unknown or not read-only'
+            )
+        return [
+            method_name for method_name in method_names
+            if method_name in read_only_methods
+        ]
+
+    def _get_coalesced_methods(self, single_flight_config: dict) -> List[str]:
+        """Get read-only methods whose concurrent calls with equal arguments
+        share one execution, all of them unless listed in the config"""
+        read_only_methods = self._get_read_only_methods()
+        method_names = single_flight_config.get("methods")
+        if method_names is None:
+            return read_only_methods
+
+        for method_name in set(method_names) - set(read_only_methods):
+            self._logger.warning(
+                f'Config file enables single flight of method "'
+                f'{method_name}" which is unknown or not read-only'
+            )
+        return [
+            method_name for method_name in method_names
+            if method_name in read_only_methods
+        ]
+
+    def _create_audit_log_consumer(self, consumer_config: dict):
+        """Creates consumer of the Perun audit log which drops changed
+        entities from the caches of the manager and the adapters"""
+        rpc_adapters = [
+            adapter["adapter"] for adapter in self.adapters.values()
+            if adapter["type"] == "openApi"
+        ]
+        if not rpc_adapters:
+            self._logger.warning(
+                'Config file enables audit log consumer, but the audit log '
+                'can be read only by adapter type "openApi" which is not used'
+            )
+            return None
+
+        consumer = rpc_adapters[0].create_audit_log_consumer(consumer_config)
+        if self._vo_cache is not None:
+            consumer.add_listener("vo", self._on_vo_changed)
+        for adapter in self.adapters.values():
+            register_method = getattr(
+                adapter["adapter"], "register_cache_invalidation", None
+            )
+            if register_method is not None:
+                register_method(consumer)
+        consumer.start()
+        return consumer
+
+    def _on_vo_changed(self, event_name: str, event) -> None:
+        vo = event["vo"]
+        self._vo_cache.invalidate(vo_id=vo["id"], short_name=vo["short_name"])
+
+    def _get_adapters_by_priority(self) -> tuple[dict, ...]:
+        adapters_by_priority = []
+        current_priority = self._STARTING_PRIORITY
+        while current_priority in self.adapters:
+            adapters_by_priority.append(self.adapters[current_priority])
+            current_priority += 1
+
+        return tuple(adapters_by_priority)
+
+    def _get_adapters_by_method(
+            self, method_priorities: dict[str, List[str]]
+    ) -> dict[str, tuple[dict, ...]]:
+        """Get adapters able to execute each interface method, ordered by
+        priority. Adapter types listed for the method in method_priorities
+        go first, in the given order."""
+        adapters_by_priority = self._get_adapters_by_priority()
+        adapter_types = {adapter["type"] for adapter in adapters_by_priority}
+
+        for method_name, preferred_types in method_priorities.items():
+            if method_name not in AdapterInterface.__abstractmethods__:
+                self._logger.warning(
+                    f'Config file sets priority of unknown method "'
+                    f'{method_name}"'
+                )
+            for adapter_type in set(preferred_types) - adapter_types:
+                self._logger.warning(
+                    f'Config file sets priority of method "{method_name}" '
+                    f'for adapter type "{adapter_type}" which is not used'
+                )
 
-    def get_facility_attributes(
-            self, facility: Union[int, Facility], attr_names: List[str]
-    ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility, attr_names
-        )
+        adapters_by_method = {}
+        for method_name in AdapterInterface.__abstractmethods__:
+            preferred_types = method_priorities.get(method_name, [])
+            ordered_adapters = sorted(
+                adapters_by_priority,
+                key=lambda adapter: preferred_types.index(adapter["type"])
+                if adapter["type"] in preferred_types
+                else len(preferred_types),
+            )
+            adapters_by_method[method_name] = tuple(
+                adapter for adapter in ordered_adapters
+                if method_name not in adapter["adapter"].UNSUPPORTED_METHODS
+            )
+
+        return adapters_by_method
+
+    def get_hedging_stats(self) -> dict[str, dict[str, int]]:
+        """Get number of calls, fired hedges and hedges which answered
+        first for each hedged method"""
+        return self._hedging_policy.get_stats()
+
+    def get_single_flight_stats(self) -> dict[str, dict[str, int]]:
+        """Get number of calls and calls which shared the execution of an
+        equal call in flight for each coalesced method"""
+        return self._single_flight.get_stats()
+
+    def get_vo_cache_stats(self) -> Optional[dict[str, int]]:
+        """Get number of hits, hits of VOs which don't exist, misses and
+        evictions of the VO cache shared by the adapters and its size"""
+        if self._vo_cache is None:
+            return None
+        return self._vo_cache.get_stats()
+
+    def get_circuit_breaker_stats(self) -> dict[str, dict]:
+        """Get state, number of rejected calls and recent state transitions
+        of the circuit breaker of each adapter"""
+        return {
+            adapter["name"]: adapter["circuit_breaker"].get_stats()
+            for adapter in self.adapters.values()
+            if adapter["circuit_breaker"] is not None
+        }
+
+    def close(self) -> None:
+        if self._audit_log_consumer is not None:
+            self._audit_log_consumer.stop()
+        self._executor.shutdown()
+        if self._probe_executor is not None:
+            self._probe_executor.shutdown()
+        if self._hedging_executor is not None:
+            self._hedging_executor.shutdown()
+        for adapter in self.adapters.values():
+            close_method = getattr(adapter["adapter"], "close", None)
+            if close_method is not None:
+                close_method()
 
-    def get_user_ext_source(
-            self, ext_source_name: str, ext_source_login: str
-    ) -> UserExtSource:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), ext_source_name, ext_source_login
-        )
+    def _execute_method_by_priority(self, method_name: str, *args):
+        if self._single_flight.is_coalesced(method_name):
+            return self._single_flight.execute(
+                method_name, self._execute_method_on_adapters,
+                method_name, *args
+            )
 
-    def update_user_ext_source_last_access(self, user_ext_source: str) -> None:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user_ext_source
-        )
+        return self._execute_method_on_adapters(method_name, *args)
 
-    def get_user_ext_source_attributes(
-            self, user_ext_source: Union[int, UserExtSource],
-            attributes: List[dict[str, str]]
-    ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user_ext_source
+    def _execute_method_on_adapters(self, method_name: str, *args):
+        adapters = self._get_available_adapters(
+            method_name, self._adapters_by_method.get(method_name, ()), *args
         )
+        if self._hedging_policy.is_hedged(method_name) and len(adapters) > 1:
+            return self._execute_method_hedged(method_name, adapters, *args)
+
+        return self._execute_method_sequentially(method_name, adapters, *args)
+
+    def _get_available_adapters(
+            self, method_name: str, adapters: tuple[dict, ...], *args
+    ) -> tuple[dict, ...]:
+        """Leave out adapters with open circuit breaker. When a breaker is
+        due to be probed, the probe is executed in the background, unless
+        the adapter is the only one left or the method is not read-only."""
+        if self._probe_executor is None:
+            return adapters
+
+        available_adapters = []
+        probed_adapters = []
+        for adapter in adapters:
+            breaker = adapter["circuit_breaker"]
+            if breaker.try_acquire_probe():
+                if method_name.startswith(self._READ_ONLY_METHOD_PREFIXES):
+                    probed_adapters.append(adapter)
+                else:
+                    available_adapters.append(adapter)
+            elif breaker.allows_calls():
+                available_adapters.append(adapter)
+
+        if not available_adapters and probed_adapters:
+            available_adapters.append(probed_adapters.pop(0))
+        for adapter in probed_adapters:
+            self._probe_executor.submit(
+                self._execute_method_on_adapter, adapter, method_name, *args
+            )
+
+        return tuple(available_adapters)
+
+    def _execute_method_sequentially(
+            self, method_name: str, adapters: tuple[dict, ...], *args
+    ):
+        failure = None
+        for current_adapter in adapters:
+            try:
+                return self._execute_method_on_adapter(
+                    current_adapter, method_name, *args
+                )
+            except AdapterSkipException:
+                self._log_skipped_adapter(current_adapter, method_name)
+            except Exception as ex:
+                if not self._can_fall_through(current_adapter, ex):
+                    raise
+                failure = ex
+                self._logger.warning(
+                    f'Going to try another adapter if available instead '
+                    f'of {current_adapter["name"]}.')
 
-    def set_user_ext_source_attributes(
-            self, user_ext_source: Union[int, UserExtSource],
-            attributes: List[dict[str, str]]
-    ) -> None:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user_ext_source
+        if failure is not None:
+            raise failure
+        raise Exception(
+            f'None of the provided adapters was able to resolve method "'
+            f'{method_name}"'
         )
 
-    def get_member_status_by_user_and_vo(self, user: Union[int, User], vo:  Union[int, VO]) -> str:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user, vo
+    def _execute_method_hedged(
+            self, method_name: str, adapters: tuple[dict, ...], *args
+    ):
+        """Executes the method on the first adapter, if it doesn't answer
+        in time, executes it also on the second one and the first
+        successful result wins"""
+        primary_adapter, secondary_adapter = adapters[:2]
+        self._hedging_policy.record_call(method_name)
+
+        futures = {
+            self._hedging_executor.submit(
+                self._execute_timed_method_on_adapter,
+                primary_adapter, method_name, *args
+            ): primary_adapter
+        }
+        done, _ = wait(
+            futures, timeout=self._hedging_policy.get_delay(method_name)
         )
-
-    def is_user_in_vo_by_short_name(self, user:  Union[int, User], vo_short_name: str) -> bool:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), user, vo_short_name
+        if not done and self._hedging_policy.acquire_hedge(method_name):
+            self._logger.debug(
+                f'Method "{method_name}" was not executed by '
+                f'{primary_adapter["name"]} in time, hedging it by '
+                f'{secondary_adapter["name"]}'
+            )
+            futures[self._hedging_executor.submit(
+                self._execute_method_on_adapter,
+                secondary_adapter, method_name, *args
+            )] = secondary_adapter
+
+        exceptions = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                current_adapter = futures[future]
+                try:
+                    result = future.result()
+                except AdapterSkipException:
+                    self._log_skipped_adapter(current_adapter, method_name)
+                    continue
+                except Exception as ex:
+                    exceptions[current_adapter["name"]] = ex
+                    continue
+
+                if current_adapter is secondary_adapter:
+                    self._hedging_policy.record_win(method_name)
+                return result
+
+        for current_adapter in adapters[:len(futures)]:
+            exception = exceptions.get(current_adapter["name"])
+            if exception is not None and (
+                    not self._can_fall_through(current_adapter, exception)
+                    or len(adapters) == len(futures)
+            ):
+                raise exception
+
+        return self._execute_method_sequentially(
+            method_name, adapters[len(futures):], *args
         )
 
-    def get_resource_capabilities_by_facility(
-            self, facility: Union[Facility, int], user_groups: List[Union[Group, int]]
-    ) -> List[str]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility, user_groups
+    def _execute_timed_method_on_adapter(
+            self, adapter: dict, method_name: str, *args
+    ):
+        start = time.monotonic()
+        try:
+            return self._execute_method_on_adapter(adapter, method_name, *args)
+        finally:
+            self._hedging_policy.record_latency(
+                method_name, time.monotonic() - start
+            )
+
+    def _execute_method_on_adapter(
+            self, adapter: dict, method_name: str, *args
+    ):
+        breaker = adapter.get("circuit_breaker")
+        start = time.monotonic()
+        try:
+            result = getattr(adapter["adapter"], method_name)(*args)
+        except AdapterSkipException:
+            if breaker is not None:
+                breaker.record_success(time.monotonic() - start)
+            raise
+        except Exception as ex:
+            if breaker is not None:
+                if self._is_adapter_failure(ex):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success(time.monotonic() - start)
+
+            if isinstance(ex, ApiException):
+                if 'notexistsexception"' in ex.body.lower():
+                    self._logger.warning(
+                        "Requested entity doesn't exist in Perun")
+            else:
+                self._logger.warning(
+                    f'Method "{method_name}" could not be executed '
+                    f'successfully by {adapter["name"]}, exception '
+                    f'occurred: "{ex}"')
+            raise
+
+        if breaker is not None:
+            breaker.record_success(time.monotonic() - start)
+        return result
+
+    @staticmethod
+    def _is_adapter_failure(ex: Exception) -> bool:
+        """Perun errors like non-existing entity are valid answers, only
+        server errors and failures of the adapter itself count"""
+        return not isinstance(ex, ApiException) or (ex.status or 0) >= 500
+
+    def _can_fall_through(self, adapter: dict, ex: Exception) -> bool:
+        """With circuit breakers enabled, failing adapter is replaced by the
+        next one instead of failing the call"""
+        return (
+            adapter.get("circuit_breaker") is not None
+            and self._is_adapter_failure(ex)
         )
 
-    def get_resource_capabilities_by_rp_id(
-            self, rp_identifier: str, user_groups: List[Union[Group, int]]
-    ) -> List[str]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), rp_identifier, user_groups
-        )
+    def _log_skipped_adapter(self, adapter: dict, method_name: str) -> None:
+        self._logger.warning(
+            f'Method "{method_name}" is not supported by '
+            f'{adapter["name"]}. Going to try another '
+            f'adapter if available.')
+
+    get_perun_user = _delegate_by_priority("get_perun_user")
+    get_group_by_name = _delegate_by_priority("get_group_by_name")
+    get_vo = _delegate_by_priority("get_vo")
+    get_member_groups = _delegate_by_priority("get_member_groups")
+    get_sp_groups_by_facility = _delegate_by_priority("get_sp_groups_by_facility")
+    get_sp_groups_by_rp_id = _delegate_by_priority("get_sp_groups_by_rp_id")
+    get_user_attributes = _delegate_by_priority("get_user_attributes")
+    get_entityless_attribute = _delegate_by_priority("get_entityless_attribute")
+    get_vo_attributes = _delegate_by_priority("get_vo_attributes")
+    get_facility_attribute = _delegate_by_priority("get_facility_attribute")
+    get_facility_by_rp_identifier = _delegate_by_priority("get_facility_by_rp_identifier")
+    get_users_groups_on_facility_by_rp_id = _delegate_by_priority("get_users_groups_on_facility_by_rp_id")
+    get_users_groups_on_facility = _delegate_by_priority("get_users_groups_on_facility")
+    get_facilities_by_attribute_value = _delegate_by_priority("get_facilities_by_attribute_value")
+    get_facility_attributes = _delegate_by_priority("get_facility_attributes")
+    get_user_ext_source = _delegate_by_priority("get_user_ext_source")
+    update_user_ext_source_last_access = _delegate_by_priority("update_user_ext_source_last_access")
+    get_user_ext_source_attributes = _delegate_by_priority("get_user_ext_source_attributes")
+    set_user_ext_source_attributes = _delegate_by_priority("set_user_ext_source_attributes")
+    get_member_status_by_user_and_vo = _delegate_by_priority("get_member_status_by_user_and_vo")
+    is_user_in_vo_by_short_name = _delegate_by_priority("is_user_in_vo_by_short_name")
+    get_resource_capabilities_by_facility = _delegate_by_priority("get_resource_capabilities_by_facility")
+    get_resource_capabilities_by_rp_id = _delegate_by_priority("get_resource_capabilities_by_rp_id")
+    get_facility_capabilities_by_rp_id = _delegate_by_priority("get_facility_capabilities_by_rp_id")
+    get_facility_capabilities_by_facility = _delegate_by_priority("get_facility_capabilities_by_facility")
+
+    def get_login_context(
+            self, idp_id: str, uids: List[str], rp_id: str,
+            user_attr_names: List[str], facility_attr_names: List[str]
+    ) -> LoginContext:
+        """Get user, facility and everything related to them needed for
+        login, independent lookups are executed in parallel"""
+        user_future = self._executor.submit(self.get_perun_user, idp_id, uids)
+        facility = self.get_facility_by_rp_identifier(rp_id)
+
+        facility_capabilities_future = None
+        facility_attributes_future = None
+        if facility is not None:
+            facility_capabilities_future = self._executor.submit(
+                self.get_facility_capabilities_by_facility, facility
+            )
+            if facility_attr_names:
+                facility_attributes_future = self._executor.submit(
+                    self.get_facility_attributes, facility, facility_attr_names
+                )
 
-    def get_facility_capabilities_by_rp_id(self, rp_identifier: str) -> List[str]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), rp_identifier
+        user = user_future.result()
+
+        user_attributes_future = None
+        if user is not None:
+            user_attributes_future = self._executor.submit(
+                self.get_user_attributes, user, user_attr_names
+            )
+
+        users_groups_on_facility = []
+        resource_capabilities = []
+        if user is not None and facility is not None:
+            users_groups_on_facility = self.get_users_groups_on_facility(
+                facility, user
+            )
+            resource_capabilities = self.get_resource_capabilities_by_facility(
+                facility, users_groups_on_facility
+            )
+
+        return LoginContext(
+            user=user,
+            facility=facility,
+            users_groups_on_facility=tuple(users_groups_on_facility),
+            resource_capabilities=tuple(resource_capabilities),
+            facility_capabilities=tuple(
+                self._get_future_result(facility_capabilities_future) or []
+            ),
+            user_attributes=MappingProxyType(
+                self._get_future_result(user_attributes_future) or {}
+            ),
+            facility_attributes=MappingProxyType(
+                self._get_future_result(facility_attributes_future) or {}
+            ),
         )
 
-    def get_facility_capabilities_by_facility(self, facility: Union[Facility, int]) -> List[str]:
-        return self._execute_method_by_priority(
-            self._get_caller_name(), facility
-        )
+    @staticmethod
+    def _get_future_result(future):
+        return future.result() if future is not None else None
@@ -1,6 +1,8 @@
+import functools
 from typing import List, Union, Optional
 
 from connectors.LdapConnector import LdapConnector
+from connectors.LdapReplica import LdapReplica
 from models.Facility import Facility
 from models.Group import Group
 from models.User import User
@@ -8,7 +10,10 @@ from models.UserExtSource import UserExtSource
 from models.VO import VO
 from models.MemberStatusEnum import MemberStatusEnum
 from utils.AttributeUtils import AttributeUtils
+from utils.AuditLogConsumer import AuditLogConsumer
+from utils.FacilityIndex import FacilityIndex
 from utils.Logger import Logger
+from utils.VoCache import VoCache
 from adapters.AdapterInterface import AdapterInterface
 
 
@@ -19,13 +24,107 @@ class AdapterSkipException(Exception):
 
 
 class LdapAdapter(AdapterInterface):
-
-    def __init__(self, loaded_config):
+    UNSUPPORTED_METHODS = frozenset({
+        "get_entityless_attribute",
+        "get_vo_attributes",
+        "get_facility_attribute",
+        "get_facilities_by_attribute_value",
+        "get_facility_attributes",
+        "get_user_ext_source",
+        "update_user_ext_source_last_access",
+        "get_user_ext_source_attributes",
+        "set_user_ext_source_attributes",
+    })
+
+    # entity type of audit events -> object class of its entries in LDAP
+    _REPLICA_OBJECT_CLASSES = {
+        "vo": "perunVo",
+        "facility": "perunFacility",
+        "group": "perunGroup",
+        "user": "perunUser",
+    }
+
+    def __init__(self, loaded_config, vo_cache: Optional[VoCache] = None):
         self._logger = Logger.get_logger(self.__class__.__name__)
         self._ldap_base = loaded_config['base_dn']
         self.connector = LdapConnector(loaded_config)
         self._attribute_utils = AttributeUtils()
         self._RP_ID_ATTR = "perunFacilityAttr_rpID"
+        self._MAX_IDS_IN_FILTER = 100
+        self._vo_cache = vo_cache
+
+        self._replica = None
+        replica_config = loaded_config.get('replica') or {}
+        if replica_config.get('enabled', False):
+            self._replica = LdapReplica(self.connector, self._ldap_base,
+                                        self._get_rp_id_attr_name(),
+                                        replica_config)
+            self._replica.start()
+
+        self._facility_index = None
+        facility_index_config = loaded_config.get('facility_index') or {}
+        if facility_index_config.get('enabled', False):
+            self._facility_index = FacilityIndex('ldap_adapter',
+                                                 self._load_facilities,
+                                                 facility_index_config)
+            self._facility_index.start()
+
+    def close(self) -> None:
+        """Stops updating the replica and the facility index and unbinds
+        pooled connections to the Perun LDAP"""
+        if self._replica is not None:
+            self._replica.stop()
+        if self._facility_index is not None:
+            self._facility_index.stop()
+        self.connector.close()
+
+    def register_cache_invalidation(self, consumer: AuditLogConsumer) -> None:
+        """Drops facilities changed in Perun from the facility index and
+        entities changed in Perun from the replica"""
+        if self._facility_index is not None:
+            consumer.add_listener("facility", self._on_facility_changed)
+        if self._replica is not None:
+            for entity_type in ("vo", "facility", "resource", "group",
+                                "member", "user"):
+                consumer.add_listener(entity_type, functools.partial(
+                    self._on_replica_entity_changed, entity_type
+                ))
+
+    def _on_replica_entity_changed(self, entity_type: str, event_name: str,
+                                   event) -> None:
+        entity = event[entity_type]
+        if entity_type == "member":
+            # memberships are stored in memberOf of the user
+            self._replica.invalidate("perunUser", entity["user_id"])
+        elif entity_type == "resource":
+            self._replica.invalidate_resources_of_facility(
+                entity["facility_id"]
+            )
+        else:
+            self._replica.invalidate(
+                self._REPLICA_OBJECT_CLASSES[entity_type], entity["id"]
+            )
+
+    def _on_facility_changed(self, event_name: str, event) -> None:
+        attribute = event.get("attribute")
+        if attribute is not None and (
+                f'{attribute["namespace"]}:{attribute["friendly_name"]}'
+                != self._attribute_utils.get_rpc_attr_name(self._RP_ID_ATTR)
+        ):
+            return
+        self._facility_index.invalidate(event["facility"]["id"])
+
+    def _get_replica(self) -> Optional[LdapReplica]:
+        """Get the local copy of Perun LDAP if it is loaded, entries not
+        found in it are still searched for in Perun LDAP, as they might have
+        been created since the last sync"""
+        if self._replica is not None and self._replica.is_loaded():
+            return self._replica
+        return None
+
+    def _get_rp_id_attr_name(self) -> str:
+        return self._attribute_utils.get_ldap_attr_name(self._RP_ID_ATTR) \
+            or "entityID"
 
     def get_perun_user(self, idp_id: str, uids: List[str]) -> Optional[User]:
         query = ''
@@ -35,10 +134,13 @@ class LdapAdapter(AdapterInterface):
         if query == '':
             return None
 
-        user = self.connector.search_for_entity(
-            'ou=People,' + self._ldap_base, '(|' + query + ')',
-            ['perunUserId', 'displayName', 'cn', 'givenName',
-             'sn', 'preferredMail', 'mail'])
+        replica = self._get_replica()
+        user = replica.get_user_by_eppns(uids) if replica else None
+        if not user:
+            user = self.connector.search_for_entity(
+                'ou=People,' + self._ldap_base, '(|' + query + ')',
+                ['perunUserId', 'displayName', 'cn', 'givenName',
+                 'sn', 'preferredMail', 'mail'])
 
         if not user:
             return user
@@ -66,26 +168,40 @@ class LdapAdapter(AdapterInterface):
         return self._create_internal_representation_group(group)
 
     def get_vo(self, short_name=None, vo_id=None) -> Optional[VO]:
-        if short_name:
+        def load_vo() -> Optional[VO]:
+            return self._load_vo(short_name, vo_id)
+
+        if self._vo_cache is None:
+            vo = load_vo()
+        else:
+            vo = self._vo_cache.get_or_load(load_vo, vo_id, short_name)
+
+        if vo is None and short_name:
+            raise Exception('Vo with name: ' + short_name +
+                            ' does not exists in Perun LDAP.')
+        elif vo is None:
+            raise Exception('Vo with id: ' + str(vo_id) +
+                            ' does not exists in Perun LDAP.')
+        return vo
+
+    def _load_vo(self, short_name=None, vo_id=None) -> Optional[VO]:
+        replica = self._get_replica()
+        vo = replica.get_vo(vo_id, short_name) if replica else None
+        if not vo and short_name:
             vo = self.connector.search_for_entity(
                 self._ldap_base,
                 '(&(objectClass=perunVo)(o=' + short_name + '))',
                 ['perunVoId', 'o', 'description']
             )
-
-            if not vo:
-                raise Exception('Vo with name: ' + short_name +
-                                ' does not exists in Perun LDAP.')
-        else:
+        elif not vo:
             vo = self.connector.search_for_entity(
                 self._ldap_base,
                 '(&(objectClass=perunVo)(perunVoId=' + str(vo_id) + '))',
                 ['o', 'description']
             )
-            if not vo:
-                raise Exception('Vo with id: ' + str(vo_id) +
-                                ' does not exists in Perun LDAP.')
 
+        if not vo:
+            return None
         return VO(
             vo_id or int(vo['perunVoId']),
             vo['description'][0],
@@ -95,53 +211,92 @@ class LdapAdapter(AdapterInterface):
     def get_member_groups(self, user: Union[User, int], vo: Union[VO, int]) -> List[Group]:
         user_id = AdapterInterface.get_object_id(user)
         vo_id = AdapterInterface.get_object_id(vo)
-        user_with_membership = self.connector.search_for_entity(
-            'perunUserId=' + str(user_id) + ',ou=People,' + self._ldap_base,
-            '(objectClass=perunUser)', ['perunUserId', 'memberOf'])
-        groups = []
+        replica = self._get_replica()
+        user_with_membership = replica.get_user(user_id) if replica else None
+        if not user_with_membership:
+            user_with_membership = self.connector.search_for_entity(
+                'perunUserId=' + str(user_id) + ',ou=People,' +
+                self._ldap_base,
+                '(objectClass=perunUser)', ['perunUserId', 'memberOf'])
+        group_ids = []
         for group_dn in user_with_membership['memberOf']:
-            group_vo_id = group_dn.split(',')[1].split('=', 2)[1]
-            if group_vo_id != str(vo_id):
+            group_rdn, vo_rdn = group_dn.split(',')[:2]
+            if vo_rdn.split('=', 2)[1] != str(vo_id):
                 continue
-            group = self.connector.search_for_entity(
-                group_dn, '(objectClass=perunGroup)',
+            group_ids.append(group_rdn.split('=', 2)[1])
+
+        return self._get_groups_by_ids(vo_id, group_ids)
+
+    def _get_groups_by_ids(
+            self, vo_id: Union[str, int], group_ids: List[str]
+    ) -> List[Group]:
+        """Get groups of the VO in the order of the given ids, fetched by a
+        search per chunk of ids, the VO is fetched only once"""
+        if not group_ids:
+            return []
+
+        groups_by_id = {}
+        replica = self._get_replica()
+        if replica is not None:
+            for group_id in group_ids:
+                group = replica.get_group(group_id)
+                if group:
+                    groups_by_id[str(group_id)] = group
+
+        missing_group_ids = [
+            group_id for group_id in group_ids
+            if str(group_id) not in groups_by_id
+        ]
+        for chunk_start in range(0, len(missing_group_ids),
+                                 self._MAX_IDS_IN_FILTER):
+            ids_filter = ''
+            for group_id in missing_group_ids[
+                    chunk_start:chunk_start + self._MAX_IDS_IN_FILTER]:
+                ids_filter += '(perunGroupId=' + str(group_id) + ')'
+            groups = self.connector.search_for_entities(
+                'perunVoId=' + str(vo_id) + ',' + self._ldap_base,
+                '(&(objectClass=perunGroup)(|' + ids_filter + '))',
                 ['perunGroupId', 'cn', 'perunUniqueGroupName',
-                 'perunVoId', 'uuid', 'description'])
-            groups.append(
-                self._create_internal_representation_group(group)
+                 'perunVoId', 'uuid', 'description']
             )
+            for group in groups:
+                groups_by_id[str(group['perunGroupId'])] = group
 
-        return groups
+        vo = self.get_vo(vo_id=int(vo_id))
+        return [
+            self._create_internal_representation_group(
+                groups_by_id[str(group_id)], vo
+            )
+            for group_id in group_ids
+            if str(group_id) in groups_by_id
+        ]
 
     def get_sp_groups_by_facility(self, facility: Union[Facility, int]) -> List[Group]:
         if not facility:
             return []
         facility_id = AdapterInterface.get_object_id(facility)
-        resources = self.connector.search_for_entities(
+        resources = self.connector.iter_entities(
             self._ldap_base,
             '(&(objectClass=perunResource)(perunFacilityDn=perunFacilityId=' +
             str(facility_id) + ',' + self._ldap_base + '))',
             ['perunResourceId', 'assignedGroupId', 'perunVoId']
         )
-        groups = []
-        unique_ids = []
-
+        group_ids_by_vo = {}
+        unique_ids = set()
         for resource in resources:
-            if 'assignedGroupId' in resource:
-                for group_id in resource['assignedGroupId']:
-                    group = self.connector.search_for_entity(
-                        'perunGroupId=' + group_id + ',perunVoId=' +
-                        resource['perunVoId'] + ',' + self._ldap_base,
-                        '(objectClass=perunGroup)',
-                        ['perunGroupId', 'cn', 'perunUniqueGroupName',
-                         'perunVoId', 'uuid', 'description']
-                    )
-                    if group['perunGroupId'] not in unique_ids:
-                        groups.append(
-                            self._create_internal_representation_group(group)
-                        )
-
-                        unique_ids.append(group['perunGroupId'])
+            if 'assignedGroupId' not in resource:
+                continue
+            for group_id in resource['assignedGroupId']:
+                if group_id in unique_ids:
+                    continue
+                unique_ids.add(group_id)
+                group_ids_by_vo.setdefault(
+                    resource['perunVoId'], []
+                ).append(group_id)
+
+        groups = []
+        for vo_id, group_ids in group_ids_by_vo.items():
+            groups.extend(self._get_groups_by_ids(vo_id, group_ids))
         return groups
 
     def get_sp_groups_by_rp_id(self, rp_id: str) -> List[Group]:
@@ -177,15 +332,29 @@ class LdapAdapter(AdapterInterface):
             self,
             rp_identifier: str,
     ) -> Optional[Facility]:
-        attr_name = \
-            self._attribute_utils.get_ldap_attr_name(self._RP_ID_ATTR) \
-            or "entityID"
-        ldap_result = self.connector.search_for_entity(
-            self._ldap_base,
-            '(&(objectClass=perunFacility)(' + attr_name + '=' +
-            rp_identifier + '))',
-            ['perunFacilityId', 'cn', 'description']
-        )
+        if self._facility_index is None:
+            return self._search_facility_by_rp_identifier(rp_identifier)
+
+        indexed, facility = self._facility_index.get(rp_identifier)
+        if not indexed:
+            facility = self._search_facility_by_rp_identifier(rp_identifier)
+            self._facility_index.put(rp_identifier, facility)
+        return facility
+
+    def _search_facility_by_rp_identifier(
+            self,
+            rp_identifier: str,
+    ) -> Optional[Facility]:
+        replica = self._get_replica()
+        ldap_result = replica.get_facility_by_rp_id(rp_identifier) \
+            if replica else None
+        if not ldap_result:
+            ldap_result = self.connector.search_for_entity(
+                self._ldap_base,
+                '(&(objectClass=perunFacility)(' +
+                self._get_rp_id_attr_name() + '=' + rp_identifier + '))',
+                ['perunFacilityId', 'cn', 'description']
+            )
         if not ldap_result:
             self._logger.warning('perun:AdapterLdap: '
                                  'No facility with entityID \'' +
@@ -199,6 +368,26 @@ class LdapAdapter(AdapterInterface):
             rp_identifier
         )
 
+    def _load_facilities(self) -> List[Facility]:
+        """Get all facilities, once per each of their rpIDs"""
+        rp_id_attr = self._get_rp_id_attr_name()
+        facilities = []
+        for facility in self.connector.iter_entities(
+                self._ldap_base, '(objectClass=perunFacility)',
+                ['perunFacilityId', 'cn', 'description', rp_id_attr]
+        ):
+            rp_ids = facility.get(rp_id_attr) or []
+            if isinstance(rp_ids, str):
+                rp_ids = [rp_ids]
+            for rp_id in rp_ids:
+                facilities.append(Facility(
+                    facility['perunFacilityId'],
+                    facility['cn'][0],
+                    facility['description'][0],
+                    rp_id
+                ))
+        return facilities
+
     def get_users_groups_on_facility(
             self, facility: Union[Facility, int], user: Union[User, int]
     ) -> List[Group]:
@@ -209,7 +398,7 @@ class LdapAdapter(AdapterInterface):
         facility_id = AdapterInterface.get_object_id(facility)
         user_id = AdapterInterface.get_object_id(user)
 
-        resources = self.connector.search_for_entities(
+        resources = self.connector.iter_entities(
             self._ldap_base,
             '(&(objectClass=perunResource)(perunFacilityDn='
             'perunFacilityId=' +
@@ -217,31 +406,33 @@ class LdapAdapter(AdapterInterface):
             ['perunResourceId']
         )
 
-        self._logger.debug('Resources - ' + str(resources))
-
-        if not resources:
-            raise Exception('Service with spEntityId: ' + str(facility_id) +
-                            ' hasn\'t assigned any resource.')
-        resources_string = '(|'
+        resources_string = ''
         for resource in resources:
             resources_string += '(assignedToResourceId=' + \
                                 resource['perunResourceId'] + ')'
-        resources_string += ')'
-        result_groups = []
-        unique_ids = []
-        groups = self.connector.search_for_entities(
+
+        self._logger.debug('Resources - ' + resources_string)
+
+        if not resources_string:
+            raise Exception('Service with spEntityId: ' + str(facility_id) +
+                            ' hasn\'t assigned any resource.')
+        resources_string = '(|' + resources_string + ')'
+        groups = self.connector.iter_entities(
             self._ldap_base,
             '(&(uniqueMember=perunUserId=' + str(user_id) + ', ou=People,' +
             self._ldap_base + ')' + resources_string + ')',
             ['perunGroupId', 'cn', 'perunUniqueGroupName',
              'perunVoId', 'uuid', 'description']
         )
+        # the VOs are fetched once the paged search finishes, so that the
+        # search doesn't hold one pooled connection while waiting for another
+        unique_groups = {}
         for group in groups:
-            if group['perunGroupId'] not in unique_ids:
-                result_groups.append(
-                    self._create_internal_representation_group(group)
-                )
-                unique_ids.append(group['perunGroupId'])
+            unique_groups.setdefault(group['perunGroupId'], group)
+        result_groups = [
+            self._create_internal_representation_group(group)
+            for group in unique_groups.values()
+        ]
 
         self._logger.debug('Groups - ' + str(result_groups))
 
@@ -312,12 +503,17 @@ class LdapAdapter(AdapterInterface):
             return []
 
         facility_id = AdapterInterface.get_object_id(facility)
-        resources = self.connector.search_for_entities(
-            self._ldap_base,
-            '(&(objectClass=perunResource)(perunFacilityDn=perunFacilityId=' +
-            str(facility_id) + ',' + self._ldap_base + '))',
-            ['capabilities', 'assignedGroupId']
-        )
+        replica = self._get_replica()
+        resources = replica.get_resources_by_facility(facility_id) \
+            if replica else None
+        if not resources:
+            resources = self.connector.iter_entities(
+                self._ldap_base,
+                '(&(objectClass=perunResource)(perunFacilityDn='
+                'perunFacilityId=' + str(facility_id) + ',' +
+                self._ldap_base + '))',
+                ['capabilities', 'assignedGroupId']
+            )
 
         user_groups_ids = []
         for user_group in user_groups:
@@ -364,11 +560,11 @@ class LdapAdapter(AdapterInterface):
         return self.get_facility_capabilities_by_facility(facility)
 
     def _create_internal_representation_group(
-            self, group: dict[str, str]
+            self, group: dict[str, str], vo: Optional[VO] = None
     ) -> Group:
         return Group(
             int(group['perunGroupId']),
-            self.get_vo(vo_id=int(group['perunVoId'])),
+            vo or self.get_vo(vo_id=int(group['perunVoId'])),
             group['uuid'],
             group['cn'][0],
             group['perunUniqueGroupName'],
@@ -1,6 +1,10 @@
-from typing import List, Union, Optional
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, Optional, Set
 
 import perun_openapi.model.group
+import perun_openapi.model.rich_group
 from adapters.AdapterInterface import AdapterInterface
 from models.MemberStatusEnum import MemberStatusEnum
 from utils.Logger import Logger
@@ -10,8 +14,13 @@ from models.Member import Member
 from models.User import User
 from models.UserExtSource import UserExtSource
 from models.VO import VO
-from perun_openapi import ApiClient, Configuration, ApiException
+from perun_openapi import (
+    ApiClient, Configuration, ApiException, ApiTypeError, ApiValueError,
+)
 from perun_openapi.api.attributes_manager_api import AttributesManagerApi
+from perun_openapi.api.audit_messages_manager_api import (
+    AuditMessagesManagerApi,
+)
 from perun_openapi.api.facilities_manager_api import FacilitiesManagerApi
 from perun_openapi.api.groups_manager_api import GroupsManagerApi
 from perun_openapi.api.members_manager_api import MembersManagerApi
@@ -20,15 +29,25 @@ from perun_openapi.api.searcher_api import SearcherApi
 from perun_openapi.api.users_manager_api import UsersManagerApi
 from perun_openapi.api.vos_manager_api import VosManagerApi
 from perun_openapi.model.input_get_facilities import InputGetFacilities
+from perun_openapi.model.attribute import Attribute
 from perun_openapi.model.input_set_user_ext_source_attributes import (
     InputSetUserExtSourceAttributes,
 )
+from perun_openapi.model_utils import validate_and_convert_types
+from utils.AttributeFingerprints import AttributeFingerprints
 from utils.AttributeUtils import AttributeUtils
+from utils.AuditLogConsumer import AuditLogConsumer
+from utils.FacilityIndex import FacilityIndex
+from utils.RawResponse import decode_raw_response
+from utils.WriteBehindQueue import WriteBehindQueue
+from utils.WriteJournal import WriteJournal
+from utils.VoCache import VoCache
 
 
 class PerunRpcAdapter(AdapterInterface):
 
-    def __init__(self, config_data: dict[str, str]):
+    def __init__(self, config_data: dict[str, str],
+                 vo_cache: Optional[VoCache] = None):
         self._CONFIG = None
         self._logger = Logger.get_logger(self.__class__.__name__)
         self._BASIC_AUTH = "BasicAuth"
@@ -37,8 +56,109 @@ class PerunRpcAdapter(AdapterInterface):
 
         self._set_up_openapi_config(config_data)
 
+        # urllib3's PoolManager is thread-safe, so a single client shared by
+        # all threads keeps connections to Perun alive between calls
+        self._api_client = ApiClient(self._CONFIG)
+        # constructing an API builds all of its endpoints, so the APIs are
+        # built once and shared by all calls, their endpoints are stateless
+        self._attributes_api = AttributesManagerApi(self._api_client)
+        self._facilities_api = FacilitiesManagerApi(self._api_client)
+        self._groups_api = GroupsManagerApi(self._api_client)
+        self._members_api = MembersManagerApi(self._api_client)
+        self._resources_api = ResourcesManagerApi(self._api_client)
+        self._searcher_api = SearcherApi(self._api_client)
+        self._users_api = UsersManagerApi(self._api_client)
+        self._vos_api = VosManagerApi(self._api_client)
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config_data.get("fan_out_concurrency", 4)),
+            thread_name_prefix=self.__class__.__name__,
+        )
+        self._allowed_rich_groups_supported = True
+        self._concurrent_user_lookup = bool(
+            config_data.get("concurrent_user_lookup", False)
+        )
+        self._raw_responses = bool(config_data.get("raw_responses", False))
+
         self._RP_ID_ATTR = "perunFacilityAttr_rpID"
+        self._GROUP_ID_ATTR = "urn:perun:group:attribute-def:core:id"
+        self._RESOURCE_CAPABILITIES_ATTR = (
+            "urn:perun:resource:attribute-def:def:capabilities"
+        )
         self._ATTRIBUTE_UTILS = AttributeUtils()
+        self._vo_cache = vo_cache
+
+        self._facility_index = None
+        facility_index_config = config_data.get("facility_index") or {}
+        if facility_index_config.get("enabled", False):
+            self._facility_index = FacilityIndex(
+                "rpc_adapter", self._load_facilities, facility_index_config
+            )
+            self._facility_index.start()
+
+        self._write_journal = None
+        journal_config = config_data.get("write_journal") or {}
+        if journal_config.get("enabled", False):
+            self._write_journal = WriteJournal(
+                "rpc_adapter", self._replay_write, journal_config
+            )
+            self._write_journal.start()
+
+        self._last_access_queue = None
+        write_behind_config = (
+            config_data.get("last_access_write_behind") or {}
+        )
+        if write_behind_config.get("enabled", False):
+            self._last_access_queue = WriteBehindQueue(
+                "last_access",
+                lambda user_ext_source_id, _: (
+                    self._submit_user_ext_source_last_access(
+                        user_ext_source_id
+                    )
+                ),
+                write_behind_config,
+            )
+            self._last_access_queue.start()
+
+        self._ues_attribute_fingerprints = None
+        suppression_config = (
+            config_data.get("ues_attributes_write_suppression") or {}
+        )
+        if suppression_config.get("enabled", False):
+            self._ues_attribute_fingerprints = AttributeFingerprints(
+                suppression_config
+            )
+
+    def close(self) -> None:
+        """Stops worker threads and closes pooled connections to Perun RPC"""
+        if self._facility_index is not None:
+            self._facility_index.stop()
+        if self._last_access_queue is not None:
+            self._last_access_queue.stop()
+        if self._write_journal is not None:
+            self._write_journal.stop()
+        self._executor.shutdown()
+        self._api_client.close()
+        self._api_client.rest_client.pool_manager.clear()
+
+    def create_audit_log_consumer(self, config: dict) -> AuditLogConsumer:
+        """Creates consumer of the audit log of the Perun this adapter is
+        connected to"""
+        return AuditLogConsumer(AuditMessagesManagerApi(self._api_client),
+                                config)
+
+    def register_cache_invalidation(self, consumer: AuditLogConsumer) -> None:
+        """Drops facilities changed in Perun from the facility index"""
+        if self._facility_index is not None:
+            consumer.add_listener("facility", self._on_facility_changed)
+
+    def _on_facility_changed(self, event_name: str, event) -> None:
+        attribute = event.get("attribute")
+        if attribute is not None and (
+                f'{attribute["namespace"]}:{attribute["friendly_name"]}'
+                != self._ATTRIBUTE_UTILS.get_rpc_attr_name(self._RP_ID_ATTR)
+        ):
+            return
+        self._facility_index.invalidate(event["facility"]["id"])
 
     def _set_up_openapi_config(self, config_data: dict[str, str]) -> None:
         auth_type = config_data["auth_type"]
@@ -61,215 +181,314 @@ class PerunRpcAdapter(AdapterInterface):
             )
             raise ValueError(exception_message)
 
+        pool_maxsize = config_data.get("connection_pool_maxsize")
+        if pool_maxsize is not None:
+            self._CONFIG.connection_pool_maxsize = int(pool_maxsize)
+
+    def _call_api(self, api_method, *args, **kwargs):
+        """Calls the API method, in raw mode its JSON response is decoded
+        straight into RawRecords instead of openapi models. Used for
+        responses with entities only, raw mode does not keep keys of map
+        attribute values."""
+        if not self._raw_responses:
+            return api_method(*args, **kwargs)
+        return decode_raw_response(
+            api_method(*args, _preload_content=False, **kwargs)
+        )
+
+    def _get_user_by_ext_login(self, idp_id: str, uid: str) -> Optional[User]:
+        try:
+            user = self._call_api(
+                self._users_api.get_user_by_ext_source_name_and_ext_login,
+                ext_login=uid, ext_source_name=idp_id
+            )
+        except ApiException as ex:
+            if '"name":"UserExtSourceNotExistsException"' in ex.body:
+                return None
+            raise ex
+
+        name = ""
+        for user_attr in [
+            "title_before",
+            "first_name",
+            "middle_name",
+            "last_name",
+            "title_after",
+        ]:
+            if user[user_attr] is not None:
+                name += user[user_attr] + " "
+
+        return User(user["id"], name.strip())
+
     def get_perun_user(self, idp_id: str, uids: List[str]) -> Optional[User]:
-        with ApiClient(self._CONFIG) as api_client:
-            api_instance = UsersManagerApi(api_client)
+        if not self._concurrent_user_lookup or len(uids) < 2:
             for uid in uids:
-                try:
-                    user = \
-                        api_instance.get_user_by_ext_source_name_and_ext_login(
-                            ext_login=uid, ext_source_name=idp_id
-                        )
-                    name = ""
-                    for user_attr in [
-                        "title_before",
-                        "first_name",
-                        "middle_name",
-                        "last_name",
-                        "title_after",
-                    ]:
-                        if user[user_attr] is not None:
-                            name += user[user_attr] + " "
-
-                    return User(user["id"], name.strip())
-                except ApiException as ex:
-                    if '"name":"UserExtSourceNotExistsException"' in ex.body:
-                        continue
-                    raise ex
+                user = self._get_user_by_ext_login(idp_id, uid)
+                if user is not None:
+                    return user
             return None
 
-    def _get_group_unique_name(
-            self,
-            attributes_api_instance: AttributesManagerApi,
-            group_name: str,
-            group_id: int,
-    ) -> str:
-        attr = attributes_api_instance.get_attribute(
-            group=group_id,
-            attribute_name="urn:perun:group:attribute-def:virt:voShortName",
-        )
-        return f'{attr["value"]}:{group_name}'
+        # lookups run concurrently, but results are consumed in the order
+        # of uids so the first uid with a user still wins
+        futures = [
+            self._executor.submit(self._get_user_by_ext_login, idp_id, uid)
+            for uid in uids
+        ]
+        try:
+            for future in futures:
+                user = future.result()
+                if user is not None:
+                    return user
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _get_vos_by_ids(self, vo_ids: Set[int]) -> dict[int, VO]:
+        if not vo_ids:
+            return {}
+
+        vos = {}
+        if self._vo_cache is not None:
+            vos, vo_ids = self._vo_cache.get_many(vo_ids)
+            if not vo_ids:
+                return vos
+
+        perun_vos = self._call_api(self._vos_api.get_vos_by_ids,
+                                   sorted(vo_ids))
+        for perun_vo in perun_vos:
+            vos[perun_vo.id] = VO(perun_vo.id, perun_vo.name,
+                                  perun_vo.short_name)
+
+        if self._vo_cache is not None:
+            for vo_id in vo_ids:
+                if vo_id in vos:
+                    self._vo_cache.put(vos[vo_id])
+                else:
+                    self._vo_cache.put_missing(vo_id=vo_id)
+
+        return vos
 
     def _create_internal_representation_groups(self,
                                                input_groups: List[
                                                    perun_openapi.model.group.Group
                                                ],
-                                               converted_groups: List[Group],
-                                               attributes_api_instance:
-                                               AttributesManagerApi) -> None:
-        unique_ids = []
+                                               converted_groups: List[Group]) -> None:
+        unique_groups = {}
         for group in input_groups:
-            if group["id"] not in unique_ids:
-                group["unique_name"] = self._get_group_unique_name(
-                    attributes_api_instance, group["name"], group["id"]
+            unique_groups.setdefault(group["id"], group)
+
+        vos = self._get_vos_by_ids(
+            {group["vo_id"] for group in unique_groups.values()}
+        )
+
+        for group in unique_groups.values():
+            vo = vos.get(group["vo_id"])
+            if vo is None:
+                self._logger.warning(
+                    f'VO with id "{group["vo_id"]}" of group with id "'
+                    f'{group["id"]}" does not exist in Perun.'
                 )
-                converted_groups.append(
-                    Group(
-                        group["id"],
-                        self.get_vo(vo_id=group["vo_id"]),
-                        group["uuid"],
-                        group["name"],
-                        group["unique_name"],
-                        group["description"],
-                    )
+                continue
+
+            converted_groups.append(
+                Group(
+                    group["id"],
+                    vo,
+                    group["uuid"],
+                    group["name"],
+                    f'{vo.short_name}:{group["name"]}',
+                    group["description"],
                 )
-                unique_ids.append(group["id"])
+            )
 
     def get_member_groups(self, user: Union[User, int], vo: Union[VO, int]) -> List[Group]:
-        with ApiClient(self._CONFIG) as api_client:
-            members_api_instance = MembersManagerApi(api_client)
-            groups_api_instance = GroupsManagerApi(api_client)
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            converted_groups = []
-            vo_id = AdapterInterface.get_object_id(vo)
-            user_id = AdapterInterface.get_object_id(user)
-            try:
-                member = members_api_instance.get_member_by_user(
-                    vo_id, user_id
+        converted_groups = []
+        vo_id = AdapterInterface.get_object_id(vo)
+        user_id = AdapterInterface.get_object_id(user)
+        try:
+            member = self._call_api(self._members_api.get_member_by_user,
+                                    vo_id, user_id)
+            member_groups = []
+            if member:
+                member_groups = self._call_api(
+                    self._groups_api.get_all_member_groups, member["id"]
                 )
-                member_groups = []
-                if member:
-                    member_groups = groups_api_instance.get_all_member_groups(
-                        member["id"]
-                    )
-                self._create_internal_representation_groups(member_groups,
-                                                            converted_groups,
-                                                            attributes_api_instance)  # noqa E501
-            except ApiException as e:
-                self._logger.warning(f' OpenAPI raised an exception: "{e}"')
+            self._create_internal_representation_groups(member_groups,
+                                                        converted_groups)
+        except ApiException as e:
+            self._logger.warning(f' OpenAPI raised an exception: "{e}"')
+
+        return converted_groups
+
+    def _is_unknown_method(self, ex: ApiException) -> bool:
+        return ex.status == 404 or (
+            ex.body is not None and '"type":"UNKNOWN_METHOD"' in ex.body
+        )
+
+    def _get_allowed_rich_groups(
+            self, facility_id: int
+    ) -> Optional[List[perun_openapi.model.rich_group.RichGroup]]:
+        try:
+            # attributes of the groups are not used, request a cheap core
+            # one so that Perun does not load all of them
+            return self._call_api(
+                self._facilities_api.get_allowed_rich_groups_with_attributes,  # noqa E501
+                facility_id, [self._GROUP_ID_ATTR]
+            )
+        except ApiException as ex:
+            if not self._is_unknown_method(ex):
+                raise ex
+            self._logger.warning(
+                "getAllowedRichGroupsWithAttributes is not available in "
+                "Perun, falling back to fetching groups per resource."
+            )
+            self._allowed_rich_groups_supported = False
+            return None
+
+    def _get_assigned_groups_per_resource(
+            self, facility_id: int
+    ) -> List[perun_openapi.model.group.Group]:
+        resources = self._call_api(
+            self._facilities_api.get_assigned_resources_for_facility,
+            facility_id
+        )
+        resources_ids = [resource.id for resource in resources]
 
-            return converted_groups
+        groups = []
+        for resource_groups in self._executor.map(
+                functools.partial(self._call_api,
+                                  self._resources_api.get_assigned_groups),
+                resources_ids
+        ):
+            groups.extend(resource_groups)
+        return groups
 
     def get_sp_groups_by_facility(self, facility: Union[Facility, int]) -> List[Group]:
         if facility is None:
             return []
 
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-            facilities_api_instance = FacilitiesManagerApi(api_client)
-            resources_api_instance = ResourcesManagerApi(api_client)
-
-            facility_id = AdapterInterface.get_object_id(facility)
-            resources = (
-                facilities_api_instance.get_assigned_resources_for_facility(
-                    facility_id
-                )
-            )
-
-            resources_ids = [resource.id for resource in resources]
+        facility_id = AdapterInterface.get_object_id(facility)
 
-            sp_groups = []
-            for resource_id in resources_ids:
-                groups = resources_api_instance.get_assigned_groups(
-                    resource_id
-                )
+        groups = None
+        if self._allowed_rich_groups_supported:
+            groups = self._get_allowed_rich_groups(facility_id)
+        if groups is None:
+            groups = self._get_assigned_groups_per_resource(facility_id)
 
-                self._create_internal_representation_groups(groups,
-                                                            sp_groups,
-                                                            attributes_api_instance)  # noqa E501
-            return sp_groups
+        sp_groups = []
+        self._create_internal_representation_groups(groups, sp_groups)
+        return sp_groups
 
     def get_sp_groups_by_rp_id(self, rp_id: str) -> List[Group]:
         facility = self.get_facility_by_rp_identifier(rp_id)
         return self.get_sp_groups_by_facility(facility)
 
-    def get_group_by_name(self, vo: Union[VO, int], name: str) -> Group:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-            groups_api_instance = GroupsManagerApi(api_client)
-
-            vo_id = AdapterInterface.get_object_id(vo)
-            group = groups_api_instance.get_group_by_name(vo_id, name)
-            group_external_representation = [group]
-            converted_group = []
-            self._create_internal_representation_groups(
-                group_external_representation,
-                converted_group,
-                attributes_api_instance)
-            return converted_group[0]
+    def get_group_by_name(
+            self, vo: Union[VO, int], name: str
+    ) -> Optional[Group]:
+        vo_id = AdapterInterface.get_object_id(vo)
+        group = self._call_api(self._groups_api.get_group_by_name, vo_id,
+                               name)
+        group_external_representation = [group]
+        converted_group = []
+        self._create_internal_representation_groups(
+            group_external_representation,
+            converted_group)
+        # the VO of the group does not exist, it was logged already
+        if not converted_group:
+            return None
+        return converted_group[0]
 
     def get_vo(self, short_name=None, vo_id=None) -> Optional[VO]:
-        with ApiClient(self._CONFIG) as api_client:
-            vos_api_instance = VosManagerApi(api_client)
-
-            if short_name and vo_id:
-                raise ValueError(
-                    "VO can be obtained either by its short_name or id, "
-                    "not both "
-                    "at the same time."
-                )
-            elif vo_id:
-                vo_lookup_method = vos_api_instance.get_vo_by_id
-                vo_lookup_attribute = vo_id
-                identifier = "id"
-            elif short_name:
-                vo_lookup_method = vos_api_instance.get_vo_by_short_name
-                vo_lookup_attribute = short_name
-                identifier = "short name"
-            else:
-                raise ValueError(
-                    "Neither short_name nor id was provided, please specify "
-                    "exactly one to find VO by."
-                )
+        if short_name and vo_id:
+            raise ValueError(
+                "VO can be obtained either by its short_name or id, "
+                "not both "
+                "at the same time."
+            )
+        elif vo_id:
+            vo_lookup_method = self._vos_api.get_vo_by_id
+            vo_lookup_attribute = vo_id
+            identifier = "id"
+        elif short_name:
+            vo_lookup_method = self._vos_api.get_vo_by_short_name
+            vo_lookup_attribute = short_name
+            identifier = "short name"
+        else:
+            raise ValueError(
+                "Neither short_name nor id was provided, please specify "
+                "exactly one to find VO by."
+            )
 
-            try:
-                vo = vo_lookup_method(vo_lookup_attribute)
-                return VO(vo.id, vo.name, vo.short_name)
-            except ApiException as ex:
-                vo_not_found = '"name":"VoNotExistsException"' in ex.body
+        def load_vo() -> Optional[VO]:
+            return self._load_vo(vo_lookup_method, vo_lookup_attribute,
+                                 identifier)
 
-                if vo_not_found:
-                    self._logger.warning(
-                        f'VO looked up by {identifier} "'
-                        f'{vo_lookup_attribute}" does not exist in Perun.'
-                    )
-                    return None
-                raise ex
+        if self._vo_cache is None:
+            return load_vo()
+        return self._vo_cache.get_or_load(load_vo, vo_id, short_name)
+
+    def _load_vo(self, vo_lookup_method, vo_lookup_attribute,
+                 identifier: str) -> Optional[VO]:
+        try:
+            vo = self._call_api(vo_lookup_method, vo_lookup_attribute)
+            return VO(vo.id, vo.name, vo.short_name)
+        except ApiException as ex:
+            vo_not_found = '"name":"VoNotExistsException"' in ex.body
+
+            if vo_not_found:
+                self._logger.warning(
+                    f'VO looked up by {identifier} "'
+                    f'{vo_lookup_attribute}" does not exist in Perun.'
+                )
+                return None
+            raise ex
 
     def get_facility_by_rp_identifier(
             self,
             rp_identifier: str,
     ) -> Optional[Facility]:
-        with ApiClient(self._CONFIG) as api_client:
-            facilities_api_instance = FacilitiesManagerApi(api_client)
+        if self._facility_index is None:
+            return self._get_facility_by_rp_id_attribute(rp_identifier)
 
-            attr_name = self._ATTRIBUTE_UTILS.get_rpc_attr_name(
-                self._RP_ID_ATTR
-            )
+        indexed, facility = self._facility_index.get(rp_identifier)
+        if not indexed:
+            facility = self._get_facility_by_rp_id_attribute(rp_identifier)
+            self._facility_index.put(rp_identifier, facility)
+        return facility
 
-            facilities = facilities_api_instance.get_facilities_by_attribute(
-                attribute_name=attr_name, attribute_value=rp_identifier
-            )
+    def _get_facility_by_rp_id_attribute(
+            self,
+            rp_identifier: str,
+    ) -> Optional[Facility]:
+        attr_name = self._ATTRIBUTE_UTILS.get_rpc_attr_name(
+            self._RP_ID_ATTR
+        )
 
-            if not facilities:
-                self._logger.warning(
-                    f"No facility with rpID '{rp_identifier}' found."
-                )
-                return None
+        facilities = self._call_api(
+            self._facilities_api.get_facilities_by_attribute,
+            attribute_name=attr_name, attribute_value=rp_identifier
+        )
 
-            if len(facilities) > 1:
-                self._logger.warning(
-                    f"There is more than one facility with rpID '"
-                    f"{rp_identifier}'."
-                )
-                return None
-            return Facility(
-                facilities[0]["id"],
-                facilities[0]["name"],
-                facilities[0]["description"],
-                rp_identifier,
+        if not facilities:
+            self._logger.warning(
+                f"No facility with rpID '{rp_identifier}' found."
             )
+            return None
+
+        if len(facilities) > 1:
+            self._logger.warning(
+                f"There is more than one facility with rpID '"
+                f"{rp_identifier}'."
+            )
+            return None
+        return Facility(
+            facilities[0]["id"],
+            facilities[0]["name"],
+            facilities[0]["description"],
+            rp_identifier,
+        )
 
     def get_users_groups_on_facility(
             self, facility: Union[Facility, int], user: Union[User, int]
@@ -277,23 +496,17 @@ class PerunRpcAdapter(AdapterInterface):
         if facility is None:
             return []
 
-        with ApiClient(self._CONFIG) as api_client:
-            users_api_instance = UsersManagerApi(api_client)
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            facility_id = AdapterInterface.get_object_id(facility)
-            user_id = AdapterInterface.get_object_id(user)
-            users_groups_on_facility = (
-                users_api_instance.get_groups_for_facility_where_user_is_active(  # noqa E501
-                    user_id,
-                    facility_id,
-                )
-            )
-            converted_groups = []
-            self._create_internal_representation_groups(
-                users_groups_on_facility, converted_groups,
-                attributes_api_instance)
-            return converted_groups
+        facility_id = AdapterInterface.get_object_id(facility)
+        user_id = AdapterInterface.get_object_id(user)
+        users_groups_on_facility = self._call_api(
+            self._users_api.get_groups_for_facility_where_user_is_active,
+            user_id,
+            facility_id,
+        )
+        converted_groups = []
+        self._create_internal_representation_groups(
+            users_groups_on_facility, converted_groups)
+        return converted_groups
 
     def get_users_groups_on_facility_by_rp_id(
             self, rp_identifier: str, user: Union[User, int]
@@ -301,10 +514,28 @@ class PerunRpcAdapter(AdapterInterface):
         facility = self.get_facility_by_rp_identifier(rp_identifier)
         return self.get_users_groups_on_facility(facility, user)
 
-    def _get_rp_id(self, facility: Facility) -> str:
+    def _get_rp_id(self, facility: Union[Facility, int]) -> str:
         return self.get_facility_attributes(facility, [self._RP_ID_ATTR]) \
             .get(self._RP_ID_ATTR)
 
+    def _load_facilities(self) -> List[Facility]:
+        """Get all facilities with their rpIDs"""
+        perun_facilities = self._call_api(
+            self._facilities_api.get_all_facilities
+        )
+        rp_ids = self._executor.map(
+            self._get_rp_id,
+            [perun_facility["id"] for perun_facility in perun_facilities]
+        )
+
+        return [
+            Facility(perun_facility["id"],
+                     perun_facility["name"],
+                     perun_facility["description"],
+                     rp_id)
+            for perun_facility, rp_id in zip(perun_facilities, rp_ids)
+        ]
+
     # TODO test this method once SearcherAPI is supported on Devel
     def get_facilities_by_attribute_value(
             self, attribute: dict[str, str]
@@ -316,98 +547,121 @@ class PerunRpcAdapter(AdapterInterface):
             )
             return []
 
-        with ApiClient(self._CONFIG) as api_client:
-            searcher_api = SearcherApi(api_client)
+        attribute_to_match_in_facilities = InputGetFacilities(attribute)
+        perun_facilities = self._searcher_api.get_facilities(
+            attribute_to_match_in_facilities
+        )
 
-            attribute_to_match_in_facilities = InputGetFacilities(attribute)
-            perun_facilities = searcher_api.get_facilities(
-                attribute_to_match_in_facilities
+        [(attr_name, attr_value)] = attribute.items()
+        if attr_name == self._ATTRIBUTE_UTILS.get_rpc_attr_name(
+                self._RP_ID_ATTR):
+            # all found facilities have the searched value as their rpID
+            rp_ids = [attr_value] * len(perun_facilities)
+        else:
+            rp_ids = self._executor.map(
+                self._get_rp_id,
+                [perun_facility['id'] for perun_facility in perun_facilities]
             )
 
-            facilities = []
-            for perun_facility in perun_facilities:
-                facility = Facility(perun_facility['id'],
-                                    perun_facility['name'],
-                                    perun_facility['description'],
-                                    "")
-                facility.rp_id = self._get_rp_id(facility)
-                facilities.append(facility)
-
-        return facilities
+        return [
+            Facility(perun_facility['id'],
+                     perun_facility['name'],
+                     perun_facility['description'],
+                     rp_id)
+            for perun_facility, rp_id in zip(perun_facilities, rp_ids)
+        ]
 
     def get_facility_attributes(
             self, facility: Union[Facility, int], attr_names: List[str]
     ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
+        facility_id = AdapterInterface.get_object_id(facility)
 
-            facility_id = AdapterInterface.get_object_id(facility)
-
-            attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
-                attr_names
-            )
-            perun_attrs = (
-                attributes_api_instance.get_facility_attributes_by_names(
-                    facility_id, list(attr_names_map.keys())
-                )
+        attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
+            attr_names
+        )
+        perun_attrs = (
+            self._attributes_api.get_facility_attributes_by_names(
+                facility_id, list(attr_names_map.keys())
             )
-            facility_attrs = self._get_attributes(perun_attrs, attr_names_map)
-            return {
-                facility_attr_name: facility_attr["value"]
-                for facility_attr_name, facility_attr in facility_attrs.items()
-            }
+        )
+        facility_attrs = self._get_attributes(perun_attrs, attr_names_map)
+        return {
+            facility_attr_name: facility_attr["value"]
+            for facility_attr_name, facility_attr in facility_attrs.items()
+        }
 
     def get_user_ext_source(
             self, ext_source_name: str, ext_source_login: str
     ) -> UserExtSource:
-        with ApiClient(self._CONFIG) as api_client:
-            users_api_instance = UsersManagerApi(api_client)
-
-            user_ext_source_perun = \
-                users_api_instance.get_user_ext_source_by_ext_login_and_ext_source_name(  # noqa E501
-                    ext_source_name=ext_source_name,
-                    ext_source_login=ext_source_login
-                )
+        user_ext_source_perun = \
+            self._users_api.get_user_ext_source_by_ext_login_and_ext_source_name(  # noqa E501
+                ext_source_name=ext_source_name,
+                ext_source_login=ext_source_login
+            )
 
-            ext_source_id = user_ext_source_perun["id"]
-            login = user_ext_source_perun["login"]
+        ext_source_id = user_ext_source_perun["id"]
+        login = user_ext_source_perun["login"]
 
-            ext_source_details = user_ext_source_perun["ext_source"]
-            name = ext_source_details["name"]
+        ext_source_details = user_ext_source_perun["ext_source"]
+        name = ext_source_details["name"]
 
-            user = self.get_perun_user(ext_source_name, [ext_source_login])
+        user = self.get_perun_user(ext_source_name, [ext_source_login])
 
-            return UserExtSource(ext_source_id, name, login, user)
+        return UserExtSource(ext_source_id, name, login, user)
 
     def update_user_ext_source_last_access(
             self, user_ext_source: Union[UserExtSource, int]
     ) -> None:
         user_ext_source_id = AdapterInterface.get_object_id(user_ext_source)
 
-        with ApiClient(self._CONFIG) as api_client:
-            users_api_instance = UsersManagerApi(api_client)
+        # Perun sets the last access to the time of the update, queued
+        # updates are delayed by the flush interval of the queue at most
+        if self._last_access_queue is not None and \
+                self._last_access_queue.put(user_ext_source_id, time.time()):
+            return
 
-            users_api_instance.update_user_ext_source_last_access(
-                user_ext_source_id
-            )
+        self._submit_user_ext_source_last_access(user_ext_source_id)
+
+    def _submit_user_ext_source_last_access(
+            self, user_ext_source_id: int
+    ) -> None:
+        if self._write_journal is not None:
+            self._write_journal.append({
+                "method": "update_user_ext_source_last_access",
+                "user_ext_source": user_ext_source_id,
+            })
+            return
+
+        self._write_user_ext_source_last_access(user_ext_source_id)
+
+    def _write_user_ext_source_last_access(
+            self, user_ext_source_id: int
+    ) -> None:
+        self._users_api.update_user_ext_source_last_access(
+            user_ext_source_id
+        )
+
+    def get_last_access_write_behind_stats(self) -> Optional[dict[str, int]]:
+        """Get numbers of queued, merged, rejected, written and failed last
+        access updates and the number of pending ones"""
+        if self._last_access_queue is None:
+            return None
+        return self._last_access_queue.get_stats()
 
     def get_user_ext_source_attributes(
             self, user_ext_source: Union[UserExtSource, int], attr_names: List[str]
     ) -> dict[str, Union[str, Optional[int], bool, List[str], dict[str, str]]]:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            user_ext_source_id = AdapterInterface.get_object_id(user_ext_source)
+        user_ext_source_id = AdapterInterface.get_object_id(user_ext_source)
 
-            attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
-                attr_names
+        attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
+            attr_names
+        )
+        perun_attrs = \
+            self._attributes_api.get_user_ext_source_attributes_by_names(  # noqa E501
+                user_ext_source=user_ext_source_id,
+                attr_names=list(attr_names_map.keys()),
             )
-            perun_attrs = \
-                attributes_api_instance.get_user_ext_source_attributes_by_names(  # noqa E501
-                    user_ext_source=user_ext_source_id,
-                    attr_names=list(attr_names_map.keys()),
-                )
-            return self._get_attributes(perun_attrs, attr_names_map)
+        return self._get_attributes(perun_attrs, attr_names_map)
 
     def set_user_ext_source_attributes(
             self,
@@ -419,14 +673,116 @@ class PerunRpcAdapter(AdapterInterface):
                 ]
             ],
     ) -> None:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
+        user_ext_source_id = AdapterInterface.get_object_id(user_ext_source)
+        if self._ues_attribute_fingerprints is not None:
+            attributes = self._ues_attribute_fingerprints.get_changed(
+                user_ext_source_id, attributes
+            )
+            if not attributes:
+                return
+
+        if self._write_journal is not None:
+            # invalid attributes fail here, the journal could never replay
+            # them and they would hold up all writes appended after them
+            attributes = validate_and_convert_types(
+                attributes, ([Attribute],), ["attributes"], False, True,
+                configuration=self._CONFIG
+            )
+            self._write_journal.append({
+                "method": "set_user_ext_source_attributes",
+                "user_ext_source": user_ext_source_id,
+                "attributes": self._api_client.sanitize_for_serialization(
+                    attributes
+                ),
+            })
+            # fingerprints are recorded by the replay, once Perun accepts
+            # the write
+            return
+
+        self._write_user_ext_source_attributes(user_ext_source_id,
+                                               attributes)
+        if self._ues_attribute_fingerprints is not None:
+            self._ues_attribute_fingerprints.record_written(
+                user_ext_source_id, attributes
+            )
+
+    def _write_user_ext_source_attributes(
+            self, user_ext_source_id: int, attributes: List[Attribute]
+    ) -> None:
+        self._attributes_api.set_user_ext_source_attributes(
+            InputSetUserExtSourceAttributes(user_ext_source_id, attributes)
+        )
 
-            user_ext_source_id = AdapterInterface.get_object_id(user_ext_source)
-            attributes_api_instance.set_user_ext_source_attributes(
-                InputSetUserExtSourceAttributes(user_ext_source_id, attributes)
+    def _replay_write(self, record: dict) -> None:
+        """Executes a write from the journal, writes refused by Perun and
+        invalid writes are dropped, other failures including throttled and
+        timed out writes are retried by the journal"""
+        attributes = []
+        try:
+            if record["method"] == "update_user_ext_source_last_access":
+                self._write_user_ext_source_last_access(
+                    record["user_ext_source"]
+                )
+            elif record["method"] == "set_user_ext_source_attributes":
+                attributes = validate_and_convert_types(
+                    record["attributes"], ([Attribute],), ["attributes"],
+                    True, True, configuration=self._CONFIG
+                )
+                self._write_user_ext_source_attributes(
+                    record["user_ext_source"], attributes
+                )
+                if self._ues_attribute_fingerprints is not None:
+                    self._ues_attribute_fingerprints.record_written(
+                        record["user_ext_source"], attributes
+                    )
+            else:
+                self._logger.warning(
+                    f'Journal contains write of unknown method "'
+                    f'{record["method"]}", dropping it: {record}'
+                )
+        except ApiException as ex:
+            if not self._is_refused_write(ex):
+                raise ex
+            # the values were not written, the next write of the same
+            # values must not be skipped
+            if self._ues_attribute_fingerprints is not None:
+                self._ues_attribute_fingerprints.invalidate(
+                    record["user_ext_source"], attributes
+                )
+            self._logger.warning(
+                f'Perun refused write "{record["method"]}" of user ext '
+                f'source "{record["user_ext_source"]}" from the journal, '
+                f'dropping it: {record}, {ex}'
+            )
+        except (ApiTypeError, ApiValueError, KeyError) as ex:
+            # a retry of the write would fail the same way
+            self._logger.warning(
+                f'Journal contains invalid write "{record.get("method")}", '
+                f'dropping it: {record}, {ex!r}'
             )
 
+    @staticmethod
+    def _is_refused_write(ex: ApiException) -> bool:
+        """Client errors are refusals, except throttled (429) and timed out
+        (408) requests and requests which did not get any response (0),
+        those and server errors succeed when retried later"""
+        return ex.status is not None and 0 < ex.status < 500 and \
+            ex.status not in (408, 429)
+
+    def get_write_journal_stats(self) -> Optional[dict[str, int]]:
+        """Get numbers of appended, replayed and retried writes of the
+        journal and the number of writes waiting for the replay"""
+        if self._write_journal is None:
+            return None
+        return self._write_journal.get_stats()
+
+    def get_ues_attributes_write_stats(self) -> Optional[dict[str, int]]:
+        """Get numbers of performed and skipped writes of attributes of
+        user's external sources and of written and skipped attributes"""
+        if self._ues_attribute_fingerprints is None:
+            return None
+        return self._ues_attribute_fingerprints.get_stats()
+
     def get_member_status_by_user_and_vo(
             self, user: Union[User, int], vo: Union[VO, int]
     ) -> Optional[str]:
@@ -459,42 +815,39 @@ class PerunRpcAdapter(AdapterInterface):
         return user_status == valid_status
 
     def get_member_by_user(self, user: Union[User, int], vo: Union[VO, int]) -> Optional[Member]:
-        with ApiClient(self._CONFIG) as api_client:
-            members_api_instance = MembersManagerApi(api_client)
-
-            user_id = AdapterInterface.get_object_id(user)
-            vo_id = AdapterInterface.get_object_id(vo)
-
-            try:
-                member = members_api_instance.get_member_by_user(vo_id,
-                                                                 user_id)
-                return Member(member["id"], vo, member["status"])
-            except ApiException as ex:
-                user_not_found = '"name":"UserNotExistsException"' in ex.body
-                vo_not_found = '"name":"VoNotExistsException"' in ex.body
-                member_not_exists = '"name":"MemberNotExistsException"' in \
-                                    ex.body
-
-                if user_not_found:
-                    self._logger.warning(
-                        f'User with id "{user_id}" does not exist in '
-                        f'Perun.'
-                    )
-                if vo_not_found:
-                    self._logger.warning(
-                        f'VO with id "{vo_id}" does not '
-                        f'exist in Perun.'
-                    )
-                if member_not_exists:
-                    self._logger.warning(
-                        f'Member with VO "{vo_id}" and user id "'
-                        f'{user_id}" does not exist in Perun.'
-                    )
+        user_id = AdapterInterface.get_object_id(user)
+        vo_id = AdapterInterface.get_object_id(vo)
+
+        try:
+            member = self._members_api.get_member_by_user(vo_id,
+                                                          user_id)
+            return Member(member["id"], vo, member["status"])
+        except ApiException as ex:
+            user_not_found = '"name":"UserNotExistsException"' in ex.body
+            vo_not_found = '"name":"VoNotExistsException"' in ex.body
+            member_not_exists = '"name":"MemberNotExistsException"' in \
+                                ex.body
+
+            if user_not_found:
+                self._logger.warning(
+                    f'User with id "{user_id}" does not exist in '
+                    f'Perun.'
+                )
+            if vo_not_found:
+                self._logger.warning(
+                    f'VO with id "{vo_id}" does not '
+                    f'exist in Perun.'
+                )
+            if member_not_exists:
+                self._logger.warning(
+                    f'Member with VO "{vo_id}" and user id "'
+                    f'{user_id}" does not exist in Perun.'
+                )
 
-                if user_not_found or vo_not_found or member_not_exists:
-                    return None
+            if user_not_found or vo_not_found or member_not_exists:
+                return None
 
-                raise ex
+            raise ex
 
     def get_resource_capabilities_by_facility(
             self, facility: Union[Facility, int], user_groups: List[Union[Group, int]]
@@ -503,36 +856,37 @@ class PerunRpcAdapter(AdapterInterface):
         if facility is None:
             return capabilities
 
-        with ApiClient(self._CONFIG) as api_client:
-            facilities_api_instance = FacilitiesManagerApi(api_client)
-            resources_api_instance = ResourcesManagerApi(api_client)
-            attributes_api_instance = AttributesManagerApi(api_client)
+        user_groups_ids = {AdapterInterface.get_object_id(user_group) for user_group in user_groups}
+        if not user_groups_ids:
+            return capabilities
 
-            facility_id = AdapterInterface.get_object_id(facility)
-            resources = (
-                facilities_api_instance.get_assigned_resources_for_facility(
-                    facility_id
-                )
-            )
-            user_groups_ids = [AdapterInterface.get_object_id(user_group) for user_group in user_groups]
-            for resource in resources:
-                resource_groups = resources_api_instance.get_assigned_groups(
-                    resource["id"]
-                )
+        facility_id = AdapterInterface.get_object_id(facility)
+        enriched_resources = self._call_api(
+            self._resources_api.get_enriched_resources_for_facility,
+            facility_id, attr_names=[self._RESOURCE_CAPABILITIES_ATTR]
+        )
 
-                resource_capabilities = attributes_api_instance.get_attribute(
-                    resource=resource["id"],
-                    attribute_name="urn:perun:resource:attribute-def:def"
-                                   ":capabilities"
-                )["value"]
+        resources_capabilities = []
+        for enriched_resource in enriched_resources:
+            for attribute in enriched_resource["attributes"]:
+                attribute_name = attribute["namespace"] + ":" + attribute["friendly_name"]
+                if attribute_name == self._RESOURCE_CAPABILITIES_ATTR and attribute["value"]:
+                    resources_capabilities.append(
+                        (enriched_resource["resource"]["id"], attribute["value"])
+                    )
 
-                if resource_capabilities is None:
-                    continue
+        # groups are needed only for resources which have any capabilities
+        resources_groups = self._executor.map(
+            functools.partial(self._call_api,
+                              self._resources_api.get_assigned_groups),
+            [resource_id for resource_id, _ in resources_capabilities]
+        )
+        for (_, resource_capabilities), resource_groups in zip(
+                resources_capabilities, resources_groups
+        ):
+            if any(resource_group["id"] in user_groups_ids for resource_group in resource_groups):
+                capabilities.extend(resource_capabilities)
 
-                for resource_group in resource_groups:
-                    if resource_group["id"] in user_groups_ids:
-                        capabilities.extend(resource_capabilities)
-                        break
         return capabilities
 
     def get_resource_capabilities_by_rp_id(
@@ -545,18 +899,15 @@ class PerunRpcAdapter(AdapterInterface):
         if facility is None:
             return []
 
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            facility_id = AdapterInterface.get_object_id(facility)
+        facility_id = AdapterInterface.get_object_id(facility)
 
-            facility_capabilities = attributes_api_instance.get_attribute(
-                facility=facility_id,
-                attribute_name="urn:perun:facility:attribute-def:def"
-                               ":capabilities",
-            )["value"]
+        facility_capabilities = self._attributes_api.get_attribute(
+            facility=facility_id,
+            attribute_name="urn:perun:facility:attribute-def:def"
+                           ":capabilities",
+        )["value"]
 
-            return facility_capabilities
+        return facility_capabilities
 
     def get_facility_capabilities_by_rp_id(self, rp_identifier: str) -> List[str]:
         facility = self.get_facility_by_rp_identifier(rp_identifier)
@@ -569,49 +920,43 @@ class PerunRpcAdapter(AdapterInterface):
         if not attr_names:
             attr_names.append(default_attribute_name)
 
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            user_id = AdapterInterface.get_object_id(user)
+        user_id = AdapterInterface.get_object_id(user)
 
-            attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
-                attr_names
-            )
+        attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
+            attr_names
+        )
 
-            perun_attrs = attributes_api_instance.get_user_attributes_by_names(
-                user_id, list(attr_names_map.keys())
-            )
+        perun_attrs = self._attributes_api.get_user_attributes_by_names(
+            user_id, list(attr_names_map.keys())
+        )
 
-            user_attrs = self._get_attributes(perun_attrs, attr_names_map)
+        user_attrs = self._get_attributes(perun_attrs, attr_names_map)
 
-            return {
-                user_attr_name: user_attr["value"]
-                for user_attr_name, user_attr in user_attrs.items()
-            }
+        return {
+            user_attr_name: user_attr["value"]
+            for user_attr_name, user_attr in user_attrs.items()
+        }
 
     def get_entityless_attribute(
             self, attr_name: str
     ) -> Union[str, Optional[int], bool, List[str], dict[str, str]]:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            attributes = {}
-            perun_attr_values = (
-                attributes_api_instance.get_entityless_attributes_by_name(
-                    attr_name=self._ATTRIBUTE_UTILS.get_rpc_attr_name(
-                        attr_name)
-                )
+        attributes = {}
+        perun_attr_values = (
+            self._attributes_api.get_entityless_attributes_by_name(
+                attr_name=self._ATTRIBUTE_UTILS.get_rpc_attr_name(
+                    attr_name)
             )
+        )
 
-            attr_id = perun_attr_values[0].get("id")
-            if attr_id is None:
-                return attributes
+        attr_id = perun_attr_values[0].get("id")
+        if attr_id is None:
+            return attributes
 
-            perun_attr_keys = attributes_api_instance.get_entityless_keys(
-                attr_id
-            )
+        perun_attr_keys = self._attributes_api.get_entityless_keys(
+            attr_id
+        )
 
-            return dict(zip(perun_attr_keys, perun_attr_values))
+        return dict(zip(perun_attr_keys, perun_attr_values))
 
     def get_vo_attributes(
             self, vo: Union[VO, int], attr_names: List[str]
@@ -620,40 +965,34 @@ class PerunRpcAdapter(AdapterInterface):
         if not attr_names:
             attr_names.append(default_attribute_name)
 
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            vo_id = AdapterInterface.get_object_id(vo)
+        vo_id = AdapterInterface.get_object_id(vo)
 
-            attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
-                attr_names
-            )
+        attr_names_map = self._ATTRIBUTE_UTILS.get_rpc_attr_names(
+            attr_names
+        )
 
-            perun_attrs = attributes_api_instance.get_vo_attributes_by_names(
-                vo_id, list(attr_names_map.keys())
-            )
+        perun_attrs = self._attributes_api.get_vo_attributes_by_names(
+            vo_id, list(attr_names_map.keys())
+        )
 
-            vo_attrs = self._get_attributes(perun_attrs, attr_names_map)
+        vo_attrs = self._get_attributes(perun_attrs, attr_names_map)
 
-            return {
-                vo_attr_name: user_attr["value"]
-                for vo_attr_name, user_attr in vo_attrs.items()
-            }
+        return {
+            vo_attr_name: user_attr["value"]
+            for vo_attr_name, user_attr in vo_attrs.items()
+        }
 
     def get_facility_attribute(
             self, facility: Union[Facility, int], attr_name: str
     ) -> Union[str, Optional[int], bool, List[str], dict[str, str]]:
-        with ApiClient(self._CONFIG) as api_client:
-            attributes_api_instance = AttributesManagerApi(api_client)
-
-            facility_id = AdapterInterface.get_object_id(facility)
+        facility_id = AdapterInterface.get_object_id(facility)
 
-            attr_name = self._ATTRIBUTE_UTILS.get_rpc_attr_name(attr_name)
-            perun_attr = attributes_api_instance.get_attribute(
-                facility=facility_id, attribute_name=attr_name
-            )
+        attr_name = self._ATTRIBUTE_UTILS.get_rpc_attr_name(attr_name)
+        perun_attr = self._attributes_api.get_attribute(
+            facility=facility_id, attribute_name=attr_name
+        )
 
-            return perun_attr["value"]
+        return perun_attr["value"]
 
     def _get_attributes(
             self, perun_attrs: List[dict[str, str]],
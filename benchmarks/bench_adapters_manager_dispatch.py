@@ -0,0 +1,104 @@
+"""Measures per-call overhead of AdaptersManager dispatch.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_adapters_manager_dispatch [calls]
+
+"before" is the dispatch of the manager before the method table, which
+resolved the method name by ``inspect.stack()`` on every call and walked
+the adapters by priority, "after" uses the delegating methods generated once
+for the class. The adapter method itself returns immediately, so the numbers
+show the dispatch overhead only.
+"""
+import inspect
+import sys
+import time
+from unittest.mock import patch
+
+from adapters.AdaptersManager import AdaptersManager
+from adapters.LdapAdapter import AdapterSkipException, LdapAdapter
+from models.VO import VO
+from perun_openapi import ApiException
+
+LDAP_CONFIG_DATA = {
+    "type": "ldap",
+    "priority": 1,
+    "username": "cn=admin,dc=muni,dc=cz",
+    "base_dn": "dc=muni,dc=cz",
+    "password": "mypassword",
+    "start_tls": True,
+    "servers": [{"hostname": "ldap://openldap", "port": 389}],
+}
+TEST_VO = VO(1, "vo", "vo")
+
+
+class BaselineAdaptersManager(AdaptersManager):
+    """Dispatch of the manager before the method table, copied from it"""
+
+    def _execute_method_by_priority(self, method_name: str, *args):
+        current_priority = self._STARTING_PRIORITY
+        current_adapter = self.adapters.get(current_priority)
+
+        while current_adapter is not None:
+            adapter_impl = current_adapter["adapter"]
+            try:
+                return getattr(adapter_impl, method_name)(*args)
+            except AdapterSkipException:
+                self._logger.warning(
+                    f'Method "{method_name}" is not supported by '
+                    f'{current_adapter["name"]}. Going to try another '
+                    f'adapter if available.')
+                current_priority += 1
+                current_adapter = self.adapters.get(current_priority)
+            except ApiException as ex:
+                if 'notexistsexception"' in ex.body.lower():
+                    self._logger.warning(
+                        "Requested entity doesn't exist in Perun")
+                raise
+            except Exception as ex:
+                self._logger.warning(
+                    f'Method "{method_name}" could not be executed '
+                    f'successfully by {current_adapter["name"]}, exception '
+                    f'occurred: "{ex}"')
+                raise
+
+        raise Exception(
+            f'None of the provided adapters was able to resolve method "'
+            f'{method_name}"'
+        )
+
+    def _get_caller_name(self):
+        return inspect.stack()[1].function
+
+    def get_vo(self, short_name: str, vo_id: int) -> VO:
+        return self._execute_method_by_priority(
+            self._get_caller_name(), short_name, vo_id
+        )
+
+
+def measure(manager: AdaptersManager, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        manager.get_vo("vo", 1)
+    return time.perf_counter() - start
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    config = {"adapters": [LDAP_CONFIG_DATA]}
+
+    with patch.object(LdapAdapter, "get_vo", return_value=TEST_VO):
+        results = {
+            "before": measure(BaselineAdaptersManager(config), calls),
+            "after": measure(AdaptersManager(config), calls),
+        }
+
+    for name, elapsed in results.items():
+        print(
+            f"{name:>6}: {calls} calls in {elapsed:.3f}s, "
+            f"{elapsed / calls * 1e6:.2f} us per call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measures memory used by LdapConnector when reading a large result.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ldap_paged_search [entries] [page_size]
+
+The directory is served by ldap3's ``MOCK_SYNC`` strategy in memory.
+"search_for_entities" reads the whole result at once the way facility scans
+used to, "iter_entities" consumes it page by page. Peak memory is traced by
+tracemalloc above what the seeded directory itself takes, it includes the
+pages the mock server prepares in the same process.
+"""
+import sys
+import time
+import tracemalloc
+from unittest.mock import patch
+
+from ldap3 import Server, Connection, MOCK_SYNC
+
+from connectors.LdapConnectionPool import LdapConnectionPool
+from connectors.LdapConnector import LdapConnector
+
+BASE_DN = "dc=perun,dc=cesnet,dc=cz"
+LDAP_CONFIG_DATA = {
+    "username": "cn=admin," + BASE_DN,
+    "password": "mypassword",
+    "start_tls": False,
+    "servers": [{"hostname": "ldap://openldap", "port": 389}],
+}
+SEARCH_BASE = "ou=People," + BASE_DN
+SEARCH_FILTER = "(objectClass=perunUser)"
+ATTRIBUTES = ["perunUserId", "cn", "eduPersonPrincipalNames"]
+
+
+def create_directory(entries: int) -> Connection:
+    connection = Connection(
+        Server("mock"), user=LDAP_CONFIG_DATA["username"],
+        password=LDAP_CONFIG_DATA["password"], client_strategy=MOCK_SYNC
+    )
+    # return (status, result, response, request) like SAFE_SYNC does
+    connection.strategy.thread_safe = True
+    connection.strategy.add_entry(LDAP_CONFIG_DATA["username"], {
+        "userPassword": LDAP_CONFIG_DATA["password"], "sn": "admin"
+    })
+    for user_id in range(1, entries + 1):
+        connection.strategy.add_entry(
+            f"perunUserId={user_id},{SEARCH_BASE}", {
+                "objectClass": ["perunUser"],
+                "perunUserId": str(user_id),
+                "cn": f"User {user_id}",
+                "eduPersonPrincipalNames": [f"user{user_id}@idp.example.org"],
+            }
+        )
+    connection.bind()
+    return connection
+
+
+def search_all(connector: LdapConnector, page_size: int) -> int:
+    return len(connector.search_for_entities(
+        SEARCH_BASE, SEARCH_FILTER, ATTRIBUTES
+    ))
+
+
+def iterate_all(connector: LdapConnector, page_size: int) -> int:
+    return sum(1 for _ in connector.iter_entities(
+        SEARCH_BASE, SEARCH_FILTER, ATTRIBUTES, page_size
+    ))
+
+
+def measure(function, connector: LdapConnector, page_size: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function(connector, page_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    connection = create_directory(entries)
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      return_value=connection):
+        connector = LdapConnector(LDAP_CONFIG_DATA)
+        results = {
+            "search_for_entities": measure(search_all, connector, page_size),
+            "iter_entities": measure(iterate_all, connector, page_size),
+        }
+
+    for name, (count, elapsed, peak) in results.items():
+        print(
+            f"{name:>19}: {count} entries in {elapsed:.2f}s, "
+            f"peak {peak / 2 ** 20:.1f} MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
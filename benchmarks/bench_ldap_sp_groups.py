@@ -0,0 +1,172 @@
+"""Measures LdapAdapter.get_sp_groups_by_facility against a seeded directory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ldap_sp_groups [resources]
+
+The directory is served by ldap3's ``MOCK_SYNC`` strategy in memory, so the
+numbers show the number of searches and the client side cost only, each
+search against a real Perun LDAP adds a network round-trip on top. "before"
+runs a base search and a get_vo per assigned group the way the adapter used
+to, "after" fetches distinct groups by a chunked search per VO.
+"""
+import sys
+import time
+from unittest.mock import patch
+
+from ldap3 import Server, Connection, MOCK_SYNC
+
+from adapters.LdapAdapter import LdapAdapter
+from connectors.LdapConnectionPool import LdapConnectionPool
+from connectors.LdapConnector import LdapConnector
+
+BASE_DN = "dc=perun,dc=cesnet,dc=cz"
+LDAP_CONFIG_DATA = {
+    "username": "cn=admin," + BASE_DN,
+    "base_dn": BASE_DN,
+    "password": "mypassword",
+    "start_tls": False,
+    "servers": [{"hostname": "ldap://openldap", "port": 389}],
+}
+FACILITY_ID = 1
+VOS = 5
+GROUPS_PER_RESOURCE = 3
+# Perun LDAP schema makes these single valued, the mock has no schema
+SINGLE_VALUED_ATTRIBUTES = {"perunVoId", "perunGroupId", "perunResourceId",
+                            "perunUniqueGroupName", "uuid"}
+
+
+class PerGroupSearchLdapAdapter(LdapAdapter):
+    def get_sp_groups_by_facility(self, facility):
+        resources = self.connector.search_for_entities(
+            self._ldap_base,
+            '(&(objectClass=perunResource)(perunFacilityDn=perunFacilityId=' +
+            str(facility) + ',' + self._ldap_base + '))',
+            ['perunResourceId', 'assignedGroupId', 'perunVoId']
+        )
+        groups = []
+        unique_ids = []
+        for resource in resources:
+            for group_id in resource.get('assignedGroupId', []):
+                group = self.connector.search_for_entity(
+                    'perunGroupId=' + group_id + ',perunVoId=' +
+                    resource['perunVoId'] + ',' + self._ldap_base,
+                    '(objectClass=perunGroup)',
+                    ['perunGroupId', 'cn', 'perunUniqueGroupName',
+                     'perunVoId', 'uuid', 'description']
+                )
+                if group['perunGroupId'] not in unique_ids:
+                    groups.append(
+                        self._create_internal_representation_group(group)
+                    )
+                    unique_ids.append(group['perunGroupId'])
+        return groups
+
+
+def create_directory(resources: int) -> Connection:
+    connection = Connection(
+        Server("mock"), user=LDAP_CONFIG_DATA["username"],
+        password=LDAP_CONFIG_DATA["password"], client_strategy=MOCK_SYNC
+    )
+    # return (status, result, response, request) like SAFE_SYNC does
+    connection.strategy.thread_safe = True
+    connection.strategy.add_entry(LDAP_CONFIG_DATA["username"], {
+        "userPassword": LDAP_CONFIG_DATA["password"], "sn": "admin"
+    })
+
+    groups = resources * GROUPS_PER_RESOURCE // 2 // VOS * VOS
+    for vo_id in range(1, VOS + 1):
+        connection.strategy.add_entry(f"perunVoId={vo_id},{BASE_DN}", {
+            "objectClass": ["perunVo"], "perunVoId": str(vo_id),
+            "o": f"vo{vo_id}", "description": f"VO {vo_id}",
+        })
+    for group_id in range(1, groups + 1):
+        vo_id = group_id % VOS + 1
+        connection.strategy.add_entry(
+            f"perunGroupId={group_id},perunVoId={vo_id},{BASE_DN}", {
+                "objectClass": ["perunGroup"], "perunGroupId": str(group_id),
+                "perunVoId": str(vo_id), "cn": f"group{group_id}",
+                "perunUniqueGroupName": f"vo{vo_id}:group{group_id}",
+                "uuid": f"uuid-{group_id}",
+                "description": f"group {group_id}",
+            }
+        )
+    for resource_id in range(1, resources + 1):
+        vo_id = resource_id % VOS + 1
+        # groups of the same VO, neighbouring resources share some of them
+        assigned_group_ids = [
+            str(((resource_id // VOS + offset) * VOS + vo_id - 1) % groups
+                or groups)
+            for offset in range(GROUPS_PER_RESOURCE)
+        ]
+        connection.strategy.add_entry(
+            f"perunResourceId={resource_id},perunVoId={vo_id},{BASE_DN}", {
+                "objectClass": ["perunResource"],
+                "perunResourceId": str(resource_id),
+                "perunVoId": str(vo_id),
+                "perunFacilityDn": f"perunFacilityId={FACILITY_ID},{BASE_DN}",
+                "assignedGroupId": assigned_group_ids,
+            }
+        )
+
+    connection.bind()
+    return connection
+
+
+def get_simplified_entries(result):
+    return [
+        {
+            name: value[0]
+            if name in SINGLE_VALUED_ATTRIBUTES and len(value) == 1
+            else value
+            for name, value in entry["attributes"].items()
+        }
+        for entry in result
+    ]
+
+
+def measure(adapter: LdapAdapter, connection: Connection):
+    searches = 0
+    search = connection.search
+
+    def counting_search(*args, **kwargs):
+        nonlocal searches
+        searches += 1
+        return search(*args, **kwargs)
+
+    with patch.object(connection, "search", side_effect=counting_search):
+        start = time.perf_counter()
+        groups = adapter.get_sp_groups_by_facility(FACILITY_ID)
+        elapsed = time.perf_counter() - start
+
+    return elapsed, searches, groups
+
+
+def main():
+    resources = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    connection = create_directory(resources)
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      return_value=connection), \
+            patch.object(LdapConnector, "_get_simplified_entries",
+                         side_effect=get_simplified_entries):
+        results = {
+            "before": measure(
+                PerGroupSearchLdapAdapter(LDAP_CONFIG_DATA), connection
+            ),
+            "after": measure(LdapAdapter(LDAP_CONFIG_DATA), connection),
+        }
+
+    before_groups = sorted(group.id for group in results["before"][2])
+    after_groups = sorted(group.id for group in results["after"][2])
+    assert before_groups == after_groups, "results differ"
+
+    for name, (elapsed, searches, groups) in results.items():
+        print(
+            f"{name:>6}: {resources} resources, {len(groups)} groups, "
+            f"{searches} searches in {elapsed:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Measures the overhead of constructing openapi API classes per call.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rpc_api_construction [calls]
+
+First prints the time to construct each API class PerunRpcAdapter uses, as
+it did in every method. Then compares get_perun_user calls: "before"
+constructs UsersManagerApi for every call the way the adapter used to,
+"after" uses the API the adapter built once. The HTTP layer is replaced by
+a canned response, so the numbers show the overhead of the adapter only.
+"""
+import io
+import json
+import sys
+import time
+
+import urllib3
+
+from adapters.PerunRpcAdapter import PerunRpcAdapter
+from perun_openapi.api.attributes_manager_api import AttributesManagerApi
+from perun_openapi.api.facilities_manager_api import FacilitiesManagerApi
+from perun_openapi.api.groups_manager_api import GroupsManagerApi
+from perun_openapi.api.members_manager_api import MembersManagerApi
+from perun_openapi.api.resources_manager_api import ResourcesManagerApi
+from perun_openapi.api.searcher_api import SearcherApi
+from perun_openapi.api.users_manager_api import UsersManagerApi
+from perun_openapi.api.vos_manager_api import VosManagerApi
+
+API_CLASSES = [
+    AttributesManagerApi,
+    FacilitiesManagerApi,
+    GroupsManagerApi,
+    MembersManagerApi,
+    ResourcesManagerApi,
+    SearcherApi,
+    UsersManagerApi,
+    VosManagerApi,
+]
+USER_RESPONSE = json.dumps({
+    "id": 10,
+    "beanName": "User",
+    "firstName": "John",
+    "lastName": "Doe",
+    "middleName": None,
+    "titleBefore": None,
+    "titleAfter": None,
+}).encode()
+
+
+def create_adapter():
+    adapter = PerunRpcAdapter({
+        "host": "https://perun.example.org",
+        "auth_type": "BasicAuth",
+        "username": "username",
+        "password": "password",
+    })
+
+    def request(method, url, **kwargs):
+        return urllib3.HTTPResponse(
+            body=io.BytesIO(USER_RESPONSE), status=200,
+            headers={"content-type": "application/json"},
+            preload_content=kwargs.get("preload_content", True),
+        )
+
+    adapter._api_client.rest_client.pool_manager.request = request
+    return adapter
+
+
+def measure_construction(api_client, api_class, calls):
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        api_class(api_client)
+    return (time.perf_counter() - start_time) / calls
+
+
+def run_per_call_apis(adapter, calls):
+    for _ in range(calls):
+        adapter._users_api = UsersManagerApi(adapter._api_client)
+        adapter.get_perun_user("idp", ["john@idp"])
+
+
+def run_shared_apis(adapter, calls):
+    for _ in range(calls):
+        adapter.get_perun_user("idp", ["john@idp"])
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    adapter = create_adapter()
+
+    try:
+        for api_class in API_CLASSES:
+            elapsed = measure_construction(adapter._api_client, api_class,
+                                           calls)
+            print(f"{api_class.__name__:>22}: {elapsed * 1000:.3f}ms per "
+                  f"construction")
+
+        for label, runner in [("before", run_per_call_apis),
+                              ("after", run_shared_apis)]:
+            start_time = time.perf_counter()
+            runner(adapter, calls)
+            elapsed = (time.perf_counter() - start_time) / calls
+            print(f"{label:>22}: {elapsed * 1000:.3f}ms per "
+                  f"get_perun_user call")
+    finally:
+        adapter.close()
+
+
+if __name__ == "__main__":
+    main()
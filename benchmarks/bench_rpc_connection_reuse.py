@@ -0,0 +1,140 @@
+"""Counts TLS handshakes PerunRpcAdapter makes against a local HTTPS server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rpc_connection_reuse [calls]
+
+"before" gives every call a new connection pool the way the adapter used to
+by creating a new client (``with ApiClient(self._CONFIG)`` in each method),
+"after" uses the adapter's shared client.
+"""
+import json
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from adapters.PerunRpcAdapter import PerunRpcAdapter
+from perun_openapi.rest import RESTClientObject
+
+USER_RESPONSE = json.dumps({
+    "id": 10,
+    "beanName": "User",
+    "firstName": "John",
+    "lastName": "Doe",
+    "middleName": None,
+    "titleBefore": None,
+    "titleAfter": None,
+}).encode()
+
+
+class PerunStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # send headers and body in one segment, avoids delayed-ACK stalls
+    wbufsize = -1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(USER_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(USER_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HandshakeCountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, ssl_context):
+        super().__init__(address, PerunStandInHandler)
+        self.ssl_context = ssl_context
+        self.handshakes = 0
+        self._lock = threading.Lock()
+
+    def get_request(self):
+        sock, address = super().get_request()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self.handshakes += 1
+        return self.ssl_context.wrap_socket(sock, server_side=True), address
+
+
+def create_certificate(directory):
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost",
+         "-keyout", key_file, "-out", cert_file],
+        check=True, capture_output=True,
+    )
+    return cert_file, key_file
+
+
+def create_adapter(port, cert_file):
+    adapter = PerunRpcAdapter({
+        "host": f"https://localhost:{port}",
+        "auth_type": "BasicAuth",
+        "username": "username",
+        "password": "password",
+    })
+    adapter._CONFIG.ssl_ca_cert = cert_file
+    adapter._api_client.rest_client = RESTClientObject(adapter._CONFIG)
+    return adapter
+
+
+def run_per_call_clients(adapter, calls):
+    for _ in range(calls):
+        adapter._api_client.rest_client = RESTClientObject(adapter._CONFIG)
+        adapter.get_perun_user("idp", ["john@idp"])
+        adapter._api_client.rest_client.pool_manager.clear()
+    adapter.close()
+
+
+def run_shared_client(adapter, calls):
+    for _ in range(calls):
+        adapter.get_perun_user("idp", ["john@idp"])
+    adapter.close()
+
+
+def measure(server, adapter, runner, calls):
+    server.handshakes = 0
+    start_time = time.perf_counter()
+    runner(adapter, calls)
+    elapsed = time.perf_counter() - start_time
+    return server.handshakes, elapsed
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = create_certificate(directory)
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(cert_file, key_file)
+
+        server = HandshakeCountingServer(("localhost", 0), ssl_context)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+
+        try:
+            for label, runner in [("before", run_per_call_clients),
+                                  ("after", run_shared_client)]:
+                adapter = create_adapter(port, cert_file)
+                handshakes, elapsed = measure(server, adapter, runner, calls)
+                print(f"{label:>6}: {handshakes} TLS handshakes per {calls} "
+                      f"get_perun_user calls, {elapsed:.2f}s")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Measures deserialisation of a 5,000 group response by PerunRpcAdapter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rpc_raw_responses [groups] [rounds]
+
+The HTTP layer is replaced by canned JSON responses, so the numbers show
+the time spent turning the response into internal Groups. "models" builds
+and type-checks openapi models the way the adapter does by default, "raw"
+uses the adapter's raw_responses mode which decodes the JSON straight into
+RawRecords.
+"""
+import io
+import json
+import sys
+import time
+
+import urllib3
+
+from adapters.PerunRpcAdapter import PerunRpcAdapter
+
+VOS_COUNT = 50
+
+
+def create_payloads(groups_count):
+    groups = json.dumps([
+        {
+            "id": group_id,
+            "beanName": "Group",
+            "voId": group_id % VOS_COUNT + 1,
+            "name": f"group{group_id}",
+            "shortName": f"group{group_id}",
+            "description": f"Group number {group_id}",
+            "parentGroupId": None,
+            "uuid": f"00000000-0000-0000-0000-{group_id:012d}",
+        }
+        for group_id in range(1, groups_count + 1)
+    ]).encode()
+    vos = json.dumps([
+        {
+            "id": vo_id,
+            "beanName": "Vo",
+            "name": f"vo{vo_id}",
+            "shortName": f"vo{vo_id}",
+        }
+        for vo_id in range(1, VOS_COUNT + 1)
+    ]).encode()
+    return {"getGroupsWhereUserIsActive/facility": groups,
+            "getVosByIds": vos}
+
+
+def create_adapter(payloads, raw_responses):
+    adapter = PerunRpcAdapter({
+        "host": "https://perun.example.org",
+        "auth_type": "BasicAuth",
+        "username": "username",
+        "password": "password",
+        "raw_responses": raw_responses,
+    })
+
+    def request(method, url, **kwargs):
+        body = next(payload for method_name, payload in payloads.items()
+                    if f"/{method_name}" in url)
+        return urllib3.HTTPResponse(
+            body=io.BytesIO(body), status=200,
+            headers={"content-type": "application/json"},
+            preload_content=kwargs.get("preload_content", True),
+        )
+
+    adapter._api_client.rest_client.pool_manager.request = request
+    return adapter
+
+
+def measure(adapter, rounds):
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        groups = adapter.get_users_groups_on_facility(1, 1)
+    return groups, (time.perf_counter() - start_time) / rounds
+
+
+def main():
+    groups_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    payloads = create_payloads(groups_count)
+
+    results = {}
+    for label, raw_responses in [("models", False), ("raw", True)]:
+        adapter = create_adapter(payloads, raw_responses)
+        try:
+            groups, elapsed = measure(adapter, rounds)
+        finally:
+            adapter.close()
+        results[label] = groups
+        print(f"{label:>6}: {elapsed * 1000:.1f}ms per "
+              f"get_users_groups_on_facility of {len(groups)} groups")
+
+    assert results["models"] == results["raw"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, TypeVar
+
+from ldap3 import Connection, ServerPool, SAFE_SYNC, BASE
+from ldap3.core.exceptions import LDAPCommunicationError
+
+from utils.Logger import Logger
+
+
+T = TypeVar("T")
+
+
+class _PooledConnection:
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+
+
+class LdapConnectionPool:
+    """Thread-safe pool of connections to the Perun LDAP, each connection is
+    opened, secured by STARTTLS and bound once and then reused"""
+
+    def __init__(self, servers: ServerPool, user: str, password: str,
+                 enable_tls: bool, config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._servers = servers
+        self._user = user
+        self._password = password
+        self._enable_tls = enable_tls
+
+        self._max_lifetime = float(config.get("max_connection_lifetime_s",
+                                              600))
+        self._idle_check_interval = float(
+            config.get("idle_health_check_after_s", 60)
+        )
+        self._checkout_timeout = float(config.get("checkout_timeout_s", 10))
+
+        self._lock = threading.Lock()
+        self._idle_connections = deque()
+        self._available = threading.BoundedSemaphore(
+            int(config.get("pool_size", 4))
+        )
+
+    @contextmanager
+    def connection(self, fresh: bool = False):
+        """Checks out a bound connection and returns it to the pool
+        afterwards, connection which failed is discarded. A fresh connection
+        is opened instead of reusing an idle one."""
+        if not self._available.acquire(timeout=self._checkout_timeout):
+            raise Exception("Unable to get a connection to the Perun LDAP "
+                            "from the pool in time")
+        try:
+            pooled_connection = None if fresh else self._get_idle_connection()
+            if pooled_connection is None:
+                pooled_connection = _PooledConnection(self._connect())
+            try:
+                yield pooled_connection.connection
+            except BaseException:
+                # also when a paged search is abandoned half way
+                self._discard(pooled_connection)
+                raise
+
+            pooled_connection.returned_at = time.monotonic()
+            with self._lock:
+                self._idle_connections.append(pooled_connection)
+        finally:
+            self._available.release()
+
+    def execute(self, operation: Callable[[Connection], T]) -> T:
+        """Executes the operation on a pooled connection. The server or a
+        load balancer may close an idle connection in between its health
+        checks, an operation which fails on a closed connection is retried
+        once on a fresh one."""
+        try:
+            with self.connection() as connection:
+                return operation(connection)
+        except LDAPCommunicationError as ex:
+            self._logger.debug(f"ldap_connection_pool.execute - Connection "
+                               f"to Perun LDAP failed, retrying on a new "
+                               f"connection: {ex}")
+
+        with self.connection(fresh=True) as connection:
+            return operation(connection)
+
+    def close(self) -> None:
+        with self._lock:
+            idle_connections = list(self._idle_connections)
+            self._idle_connections.clear()
+        for pooled_connection in idle_connections:
+            self._discard(pooled_connection)
+
+    def _get_idle_connection(self):
+        while True:
+            with self._lock:
+                if not self._idle_connections:
+                    return None
+                # the most recently used connection is the least likely
+                # to be closed by the server
+                pooled_connection = self._idle_connections.pop()
+
+            now = time.monotonic()
+            if now - pooled_connection.created_at > self._max_lifetime:
+                self._discard(pooled_connection)
+            elif (
+                now - pooled_connection.returned_at > self._idle_check_interval
+                and not self._is_healthy(pooled_connection.connection)
+            ):
+                self._discard(pooled_connection)
+            else:
+                return pooled_connection
+
+    def _connect(self) -> Connection:
+        connection = Connection(server=self._servers, auto_bind=False,
+                                user=self._user, password=self._password,
+                                version=3, client_strategy=SAFE_SYNC,
+                                read_only=True)
+        connection.open()
+        hostname = connection.server
+        # enable TLS if required
+        if self._enable_tls and not connection.server.ssl:
+            status, _, _, _ = connection.start_tls()
+            if not status:
+                connection.unbind()
+                raise Exception('Unable to force STARTTLS on Perun LDAP')
+
+        status, _, _, _ = connection.bind()
+        if not status:
+            connection.unbind()
+            raise Exception(f'Unable to bind user to the Perun LDAP,'
+                            f'{hostname}')
+        self._logger.debug(f"ldap_connection_pool.connect - Connection "
+                           f"to Perun LDAP established. host: "
+                           f"{hostname}, user: {self._user}")
+
+        return connection
+
+    def _is_healthy(self, connection: Connection) -> bool:
+        if connection.closed or not connection.bound:
+            return False
+        try:
+            status, _, _, _ = connection.search(
+                search_base="", search_filter="(objectClass=*)",
+                search_scope=BASE, attributes=["1.1"]
+            )
+        except Exception as ex:
+            self._logger.debug(f"ldap_connection_pool.is_healthy - Idle "
+                               f"connection to Perun LDAP is broken: {ex}")
+            return False
+        return status
+
+    def _discard(self, pooled_connection: _PooledConnection) -> None:
+        try:
+            pooled_connection.connection.unbind()
+        except Exception as ex:
+            self._logger.debug(f"ldap_connection_pool.discard - Unable to "
+                               f"unbind connection to Perun LDAP: {ex}")
@@ -1,11 +1,16 @@
 import ssl
-from ldap3 import Connection, Server, ServerPool, SAFE_RESTARTABLE, Tls
+from ldap3 import Server, ServerPool, Tls
+from ldap3.core.exceptions import LDAPCommunicationError
+
+from connectors.LdapConnectionPool import LdapConnectionPool
 from utils.Logger import Logger
 import time
 import json
 
 
 class LdapConnector:
+    _PAGED_RESULTS_CONTROL = '1.2.840.113556.1.4.319'
+
     def __init__(self, config):
         self._logger = Logger.get_logger(self.__class__.__name__)
         self._servers = ServerPool()
@@ -19,18 +24,15 @@ class LdapConnector:
 
         self._user = config['username']
         self._password = config['password']
-        self._conn = Connection(server=self._servers, auto_bind=False,
-                                user=self._user, password=self._password,
-                                version=3, client_strategy=SAFE_RESTARTABLE,
-                                read_only=True)
-        if not self._conn:
-            raise Exception("Unable to connect to the Perun LDAP,")
-
-        hostname = self._servers.get_current_server(self._conn)
-        # enable TLS if required
-        if self._enableTLS and not str(hostname).startswith("ldaps:"):
-            if not self._conn.start_tls():
-                raise Exception('Unable to force STARTTLS on Perun LDAP')
+        self._page_size = int(config.get('page_size', 500))
+        # connections are opened lazily and kept bound between searches
+        self._pool = LdapConnectionPool(self._servers, self._user,
+                                        self._password, self._enableTLS,
+                                        config)
+
+    def close(self) -> None:
+        """Unbinds pooled connections to the Perun LDAP"""
+        self._pool.close()
 
     def search_for_entity(self, base, filters,
                           attr_names=None):
@@ -65,20 +67,57 @@ class LdapConnector:
 
         return entries
 
-    def _search(self, base, filters, attributes=None):
-        hostname = self._servers.get_current_server(self._conn)
-        if not self._conn.bind():
-            raise Exception('Unable to bind user to the Perun LDAP,' +
-                            hostname)
-        self._logger.debug(f"ldap_connector.search - Connection "
-                           f"to Perun LDAP established. Ready to "
-                           f"perform search query. host: "
-                           f"{hostname}, user: {self._user}")
+    def iter_entities(self, base, filters, attr_names=None, page_size=None):
+        """Yields entities one by one, the server returns them in pages
+        (RFC 2696), so large results neither hit its size limit nor have to
+        be held in memory at once. A search which fails on a closed pooled
+        connection before yielding anything is retried on a new one."""
+        yielded = False
+        try:
+            with self._pool.connection() as conn:
+                for entity in self._iter_pages(conn, base, filters,
+                                               attr_names, page_size):
+                    yielded = True
+                    yield entity
+            return
+        except LDAPCommunicationError as ex:
+            if yielded:
+                raise
+            self._logger.debug(f"ldap_connector.iter_entities - Connection "
+                               f"to Perun LDAP failed, retrying on a new "
+                               f"connection: {ex}")
+
+        with self._pool.connection(fresh=True) as conn:
+            yield from self._iter_pages(conn, base, filters, attr_names,
+                                        page_size)
+
+    def _iter_pages(self, conn, base, filters, attr_names, page_size):
+        # paged_search of ldap3 yields entries of each page in reverse
+        # order, pages are requested here to keep the order of the server
+        cookie = None
+        while True:
+            _, result, response, _ = conn.search(
+                search_base=base, search_filter=filters,
+                attributes=attr_names,
+                paged_size=page_size or self._page_size, paged_cookie=cookie
+            )
+            yield from self._get_simplified_entries(
+                entry for entry in response or []
+                if entry['type'] == 'searchResEntry'
+            )
+
+            cookie = (result.get('controls') or {}).get(
+                self._PAGED_RESULTS_CONTROL, {}
+            ).get('value', {}).get('cookie')
+            if not cookie:
+                return
 
+    def _search(self, base, filters, attributes=None):
         start_time = time.time()
-        status, result, response, _ = \
-            self._conn.search(search_base=base, search_filter=filters,
-                              attributes=attributes)
+        status, result, response, _ = self._pool.execute(
+            lambda conn: conn.search(search_base=base, search_filter=filters,
+                                     attributes=attributes)
+        )
         end_time = time.time()
 
         response_time = round(end_time - start_time, 3)
@@ -87,8 +126,6 @@ class LdapConnector:
 
         entries = self._get_simplified_entries(response)
 
-        self._conn.unbind()
-
         self._logger.debug(f"ldap_connector.search - search query "
                            f"proceeded in {str(response_time)}"
                            f"ms. Query base: {base}, filter: "
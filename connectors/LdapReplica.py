@@ -0,0 +1,352 @@
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from connectors.LdapConnector import LdapConnector
+from utils.Logger import Logger
+
+
+def _single(value):
+    """Perun LDAP schema makes ids single valued, entries read without the
+    schema have them as lists"""
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _values(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class _Indexes:
+    _ENTRIES_BY_OBJECT_CLASS = {
+        'perunUser': 'users',
+        'perunVo': 'vos',
+        'perunGroup': 'groups',
+        'perunFacility': 'facilities',
+        'perunResource': 'resources',
+    }
+
+    def __init__(self, rp_id_attr: str):
+        self._rp_id_attr = rp_id_attr
+        self.users = {}
+        self.user_ids_by_eppn = {}
+        self.vos = {}
+        self.vo_ids_by_short_name = {}
+        self.groups = {}
+        self.facilities = {}
+        self.facility_ids_by_rp_id = {}
+        self.resources = {}
+        self.resource_ids_by_facility_dn = {}
+
+    def put(self, object_class: str, entry: dict) -> None:
+        getattr(self, '_put_' + object_class)(entry)
+
+    def drop(self, object_class: str, entity_id: str) -> None:
+        getattr(self, '_drop_' + object_class)(entity_id)
+
+    def drop_missing(self, object_class: str, existing_ids: set) -> int:
+        """Drops entries whose ids are not among the existing ones, returns
+        how many were dropped"""
+        entries = getattr(self, self._ENTRIES_BY_OBJECT_CLASS[object_class])
+        missing_ids = entries.keys() - existing_ids
+        for entity_id in missing_ids:
+            self.drop(object_class, entity_id)
+        return len(missing_ids)
+
+    def _put_perunUser(self, user: dict) -> None:
+        user_id = str(_single(user['perunUserId']))
+        previous_user = self.users.get(user_id)
+        if previous_user is not None:
+            for eppn in _values(previous_user.get('eduPersonPrincipalNames')):
+                self.user_ids_by_eppn.pop(eppn, None)
+        self.users[user_id] = user
+        for eppn in _values(user.get('eduPersonPrincipalNames')):
+            self.user_ids_by_eppn[eppn] = user_id
+
+    def _drop_perunUser(self, user_id: str) -> None:
+        user = self.users.pop(user_id, None)
+        if user is not None:
+            for eppn in _values(user.get('eduPersonPrincipalNames')):
+                self.user_ids_by_eppn.pop(eppn, None)
+
+    def _put_perunVo(self, vo: dict) -> None:
+        vo_id = str(_single(vo['perunVoId']))
+        previous_vo = self.vos.get(vo_id)
+        if previous_vo is not None:
+            self.vo_ids_by_short_name.pop(previous_vo['o'][0], None)
+        self.vos[vo_id] = vo
+        self.vo_ids_by_short_name[vo['o'][0]] = vo_id
+
+    def _drop_perunVo(self, vo_id: str) -> None:
+        vo = self.vos.pop(vo_id, None)
+        if vo is not None:
+            self.vo_ids_by_short_name.pop(vo['o'][0], None)
+
+    def _put_perunGroup(self, group: dict) -> None:
+        self.groups[str(_single(group['perunGroupId']))] = group
+
+    def _drop_perunGroup(self, group_id: str) -> None:
+        self.groups.pop(group_id, None)
+
+    def _put_perunFacility(self, facility: dict) -> None:
+        facility_id = str(_single(facility['perunFacilityId']))
+        previous_facility = self.facilities.get(facility_id)
+        if previous_facility is not None:
+            for rp_id in _values(previous_facility.get(self._rp_id_attr)):
+                self.facility_ids_by_rp_id.pop(rp_id, None)
+        self.facilities[facility_id] = facility
+        for rp_id in _values(facility.get(self._rp_id_attr)):
+            self.facility_ids_by_rp_id[rp_id] = facility_id
+
+    def _drop_perunFacility(self, facility_id: str) -> None:
+        facility = self.facilities.pop(facility_id, None)
+        if facility is not None:
+            for rp_id in _values(facility.get(self._rp_id_attr)):
+                self.facility_ids_by_rp_id.pop(rp_id, None)
+
+    def drop_resources_of_facility(self, facility_dn: str) -> None:
+        for resource_id in self.resource_ids_by_facility_dn.pop(facility_dn,
+                                                                ()):
+            self.resources.pop(resource_id, None)
+
+    def _put_perunResource(self, resource: dict) -> None:
+        resource_id = str(_single(resource['perunResourceId']))
+        previous_resource = self.resources.get(resource_id)
+        if previous_resource is not None:
+            self.resource_ids_by_facility_dn.get(
+                _single(previous_resource.get('perunFacilityDn')), set()
+            ).discard(resource_id)
+        self.resources[resource_id] = resource
+        self.resource_ids_by_facility_dn.setdefault(
+            _single(resource.get('perunFacilityDn')), set()
+        ).add(resource_id)
+
+    def _drop_perunResource(self, resource_id: str) -> None:
+        resource = self.resources.pop(resource_id, None)
+        if resource is not None:
+            self.resource_ids_by_facility_dn.get(
+                _single(resource.get('perunFacilityDn')), set()
+            ).discard(resource_id)
+
+
+class LdapReplica:
+    """In-process copy of the Perun LDAP entries needed by the hot lookups,
+    indexed by the values they are looked up by. The copy is loaded once and
+    then updated by entries changed since the last sync (modifyTimestamp).
+    Deletions do not change any remaining entry, so each sync also lists ids
+    of all entries and drops the ones which are gone."""
+
+    USER_ATTRS = ['perunUserId', 'displayName', 'cn', 'givenName', 'sn',
+                  'preferredMail', 'mail', 'eduPersonPrincipalNames',
+                  'memberOf']
+    VO_ATTRS = ['perunVoId', 'o', 'description']
+    GROUP_ATTRS = ['perunGroupId', 'cn', 'perunUniqueGroupName', 'perunVoId',
+                   'uuid', 'description']
+    RESOURCE_ATTRS = ['perunResourceId', 'perunFacilityDn', 'perunVoId',
+                      'assignedGroupId', 'capabilities']
+
+    def __init__(self, connector: LdapConnector, base_dn: str,
+                 rp_id_attr: str, config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._connector = connector
+        self._base_dn = base_dn
+        self._rp_id_attr = rp_id_attr
+        self._sync_interval = float(config.get('sync_interval_s', 30))
+        self._full_reload_interval = float(
+            config.get('full_reload_interval_s', 3600)
+        )
+        self._searches = (
+            ('ou=People,' + base_dn, 'perunUser', self.USER_ATTRS),
+            (base_dn, 'perunVo', self.VO_ATTRS),
+            (base_dn, 'perunGroup', self.GROUP_ATTRS),
+            (base_dn, 'perunFacility',
+             ['perunFacilityId', 'cn', 'description', 'capabilities',
+              rp_id_attr]),
+            (base_dn, 'perunResource', self.RESOURCE_ATTRS),
+        )
+        self._id_attrs = {
+            'perunUser': 'perunUserId',
+            'perunVo': 'perunVoId',
+            'perunGroup': 'perunGroupId',
+            'perunFacility': 'perunFacilityId',
+            'perunResource': 'perunResourceId',
+        }
+
+        self._lock = threading.Lock()
+        self._indexes = None
+        self._last_modified = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Loads the copy and keeps it up to date in a background thread"""
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=self.__class__.__name__)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def is_loaded(self) -> bool:
+        return self._indexes is not None
+
+    def _run(self) -> None:
+        seconds_since_reload = None
+        while not self._stop_event.is_set():
+            try:
+                if (
+                    seconds_since_reload is None
+                    or seconds_since_reload >= self._full_reload_interval
+                ):
+                    self.reload()
+                    seconds_since_reload = 0
+                else:
+                    self.sync()
+            except Exception as ex:
+                self._logger.warning(f"ldap_replica - Unable to update the "
+                                     f"copy of Perun LDAP: {ex}")
+            if self._stop_event.wait(self._sync_interval):
+                return
+            if seconds_since_reload is not None:
+                seconds_since_reload += self._sync_interval
+
+    def reload(self) -> None:
+        """Replaces the copy by all entries currently in Perun LDAP, lookups
+        are served from the previous copy until the new one is loaded"""
+        indexes = _Indexes(self._rp_id_attr)
+        entries, last_modified = self._fetch_entries()
+        for object_class, entry in entries:
+            indexes.put(object_class, entry)
+
+        with self._lock:
+            self._indexes = indexes
+            self._last_modified = last_modified
+        self._logger.debug(f"ldap_replica.reload - Loaded "
+                           f"{len(indexes.users)} users, "
+                           f"{len(indexes.groups)} groups, "
+                           f"{len(indexes.facilities)} facilities and "
+                           f"{len(indexes.resources)} resources")
+
+    def sync(self) -> None:
+        """Updates the copy by entries changed since the last sync and drops
+        entries deleted since then"""
+        if not self.is_loaded():
+            self.reload()
+            return
+
+        entries, last_modified = self._fetch_entries(self._last_modified)
+        # listed after the changes, so that an entry added in between is
+        # not dropped, it is only missing in the copy until the next sync
+        existing_ids = self._fetch_existing_ids()
+        deleted = 0
+        with self._lock:
+            for object_class, entry in entries:
+                self._indexes.put(object_class, entry)
+            for object_class, ids in existing_ids.items():
+                deleted += self._indexes.drop_missing(object_class, ids)
+            self._last_modified = last_modified
+        self._logger.debug(f"ldap_replica.sync - Updated {len(entries)} "
+                           f"entries, dropped {deleted} deleted entries")
+
+    def _fetch_entries(self, modified_since: Optional[str] = None):
+        entries = []
+        last_modified = modified_since
+        for base, object_class, attr_names in self._searches:
+            filters = '(objectClass=' + object_class + ')'
+            if modified_since is not None:
+                filters = ('(&' + filters + '(modifyTimestamp>=' +
+                           modified_since + '))')
+            for entry in self._connector.iter_entities(
+                    base, filters, attr_names + ['modifyTimestamp']):
+                modified = self._to_generalized_time(
+                    _single(entry.pop('modifyTimestamp', None))
+                )
+                if modified is not None and (
+                        last_modified is None or modified > last_modified
+                ):
+                    last_modified = modified
+                entries.append((object_class, entry))
+
+        return entries, last_modified
+
+    def _fetch_existing_ids(self) -> dict:
+        existing_ids = {}
+        for base, object_class, _ in self._searches:
+            id_attr = self._id_attrs[object_class]
+            existing_ids[object_class] = {
+                str(_single(entry[id_attr]))
+                for entry in self._connector.iter_entities(
+                    base, '(objectClass=' + object_class + ')', [id_attr]
+                )
+            }
+
+        return existing_ids
+
+    def get_user_by_eppns(self, eppns: List[str]) -> Optional[dict]:
+        with self._lock:
+            for eppn in eppns:
+                user_id = self._indexes.user_ids_by_eppn.get(eppn)
+                if user_id is not None:
+                    return self._indexes.users[user_id]
+            return None
+
+    def get_user(self, user_id) -> Optional[dict]:
+        with self._lock:
+            return self._indexes.users.get(str(user_id))
+
+    def get_vo(self, vo_id=None, short_name=None) -> Optional[dict]:
+        with self._lock:
+            if short_name:
+                vo_id = self._indexes.vo_ids_by_short_name.get(short_name)
+            return self._indexes.vos.get(str(vo_id))
+
+    def get_group(self, group_id) -> Optional[dict]:
+        with self._lock:
+            return self._indexes.groups.get(str(group_id))
+
+    def get_facility_by_rp_id(self, rp_id: str) -> Optional[dict]:
+        with self._lock:
+            facility_id = self._indexes.facility_ids_by_rp_id.get(rp_id)
+            return self._indexes.facilities.get(facility_id)
+
+    def get_resources_by_facility(self, facility_id) -> List[dict]:
+        with self._lock:
+            return [
+                self._indexes.resources[resource_id]
+                for resource_id in
+                self._indexes.resource_ids_by_facility_dn.get(
+                    self._get_facility_dn(facility_id), ()
+                )
+            ]
+
+    def invalidate(self, object_class: str, entity_id) -> None:
+        """Drops the entry from the copy, it is looked up in Perun LDAP
+        until it changes there or the copy is reloaded"""
+        with self._lock:
+            if self._indexes is not None:
+                self._indexes.drop(object_class, str(entity_id))
+
+    def invalidate_resources_of_facility(self, facility_id) -> None:
+        """Drops all resources of the facility, resources are looked up by
+        their facility, so they are looked up in Perun LDAP all together"""
+        with self._lock:
+            if self._indexes is not None:
+                self._indexes.drop_resources_of_facility(
+                    self._get_facility_dn(facility_id)
+                )
+
+    def _get_facility_dn(self, facility_id) -> str:
+        return 'perunFacilityId=' + str(facility_id) + ',' + self._base_dn
+
+    @staticmethod
+    def _to_generalized_time(value) -> Optional[str]:
+        if isinstance(value, datetime):
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc)
+            return value.strftime('%Y%m%d%H%M%SZ')
+        return value
@@ -0,0 +1,24 @@
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Optional, Tuple, Mapping, Union, List
+
+from models.Facility import Facility
+from models.Group import Group
+from models.User import User
+
+
+@dataclass(frozen=True)
+class LoginContext:
+    """Everything the proxy needs from Perun to log a user into an RP"""
+
+    user: Optional[User]
+    facility: Optional[Facility]
+    users_groups_on_facility: Tuple[Group, ...] = ()
+    resource_capabilities: Tuple[str, ...] = ()
+    facility_capabilities: Tuple[str, ...] = ()
+    user_attributes: Mapping[
+        str, Union[str, Optional[int], bool, List[str], dict[str, str]]
+    ] = field(default_factory=lambda: MappingProxyType({}))
+    facility_attributes: Mapping[
+        str, Union[str, Optional[int], bool, List[str], dict[str, str]]
+    ] = field(default_factory=lambda: MappingProxyType({}))
@@ -1,14 +1,21 @@
 import copy
+import inspect
 import logging
+import threading
+import time
 from unittest.mock import patch, MagicMock
 
 import pytest
 
 import adapters
+from adapters.AdapterInterface import AdapterInterface
 from adapters.AdaptersManager import AdaptersManager
 from adapters.LdapAdapter import LdapAdapter, AdapterSkipException
 from adapters.PerunRpcAdapter import PerunRpcAdapter
+from models.Facility import Facility
+from models.Group import Group
 from models.User import User
+from models.VO import VO
 from perun_openapi import ApiException
 
 
@@ -118,6 +125,53 @@ def test_create_manager_with_unsupported_adapter(caplog):
             assert validator(manager)
 
 
+def test_delegating_methods_keep_interface_signature():
+    for method_name in AdapterInterface.__abstractmethods__:
+        delegate = getattr(AdaptersManager, method_name)
+        interface_method = getattr(AdapterInterface, method_name)
+
+        assert delegate.__name__ == method_name
+        assert inspect.signature(delegate) == inspect.signature(
+            interface_method
+        )
+
+
+def test_vo_cache_enabled_by_config_only():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config["adapters"] = SUPPORTED_CONFIG_DATA
+    manager = AdaptersManager(config)
+    cached_manager = AdaptersManager({**config, "vo_cache": None})
+
+    assert manager.get_vo_cache_stats() is None
+    for adapter in manager.adapters.values():
+        assert adapter["adapter"]._vo_cache is None
+    assert cached_manager.get_vo_cache_stats()["size"] == 0
+    for adapter in cached_manager.adapters.values():
+        assert adapter["adapter"]._vo_cache is cached_manager._vo_cache
+    manager.close()
+    cached_manager.close()
+
+
+def test_delegating_methods_accept_keyword_arguments():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config["adapters"] = SUPPORTED_CONFIG_DATA
+    manager = AdaptersManager(config)
+    test_vo = VO(1, "einfra", "einfra")
+
+    with patch.object(
+            LdapAdapter, "get_vo", return_value=test_vo
+    ) as get_vo_mock:
+        assert manager.get_vo(short_name="einfra", vo_id=None) == test_vo
+        assert manager.get_vo("einfra", vo_id=None) == test_vo
+
+    assert [call.args for call in get_vo_mock.call_args_list] == [
+        ("einfra", None), ("einfra", None)
+    ]
+    with pytest.raises(TypeError):
+        manager.get_vo(short_name="einfra", id=None)
+    manager.close()
+
+
 @patch("adapters.LdapAdapter.LdapAdapter.get_perun_user")
 def test_find_method_on_first_adapter_successfully_execute(mock_request_1):
     config = copy.deepcopy(BASE_MANAGER_CONFIG)
@@ -164,6 +218,55 @@ def test_find_method_on_second_adapter_successfully_execute(mock_request_1,
         assert result == test_user
 
 
+def test_unsupported_method_not_routed_to_adapter(caplog):
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+
+    manager = AdaptersManager(config)
+
+    vo_attributes = {"perunVoAttribute_aup": "aup"}
+    with patch.object(LdapAdapter, "get_vo_attributes") as mock_ldap, \
+            patch.object(PerunRpcAdapter, "get_vo_attributes",
+                         return_value=vo_attributes) as mock_rpc, \
+            caplog.at_level(logging.WARNING):
+        result = manager.get_vo_attributes(1, ["perunVoAttribute_aup"])
+
+    assert result == vo_attributes
+    mock_ldap.assert_not_called()
+    mock_rpc.assert_called_once_with(1, ["perunVoAttribute_aup"])
+    assert "is not supported by ldap_adapter" not in caplog.text
+
+
+def test_method_priority_override():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['method_priorities'] = {"get_perun_user": ["openApi", "ldap"]}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    with patch.object(LdapAdapter, "get_perun_user") as mock_ldap, \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         return_value=test_user) as mock_rpc:
+        result = manager.get_perun_user("1", ["John Doe"])
+
+    assert result == test_user
+    mock_ldap.assert_not_called()
+    mock_rpc.assert_called_once()
+
+
+def test_method_priority_override_unknown_method(caplog):
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['method_priorities'] = {"get_unknown": ["openApi"]}
+
+    with caplog.at_level(logging.WARNING):
+        _ = AdaptersManager(config)
+
+    assert 'Config file sets priority of unknown method "get_unknown"' \
+           in caplog.text
+
+
 @patch("adapters.LdapAdapter.LdapAdapter.get_perun_user")
 def test_found_method_fail_on_api_exception(mock_request_1, caplog):
     config = copy.deepcopy(BASE_MANAGER_CONFIG)
@@ -251,3 +354,338 @@ def test_method_not_found_on_any_adapter(mock_request_1, mock_request_2):
         _ = manager.get_perun_user("1", ["John Doe"])
         assert str(
             error.value.args[0]) == method_not_found_on_any_adapter_message
+
+
+def test_get_login_context():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    test_facility = Facility(1, "facility", "description", "rp_id")
+    test_group = Group(1, VO(1, "vo", "vo"), "uuid", "group", "vo:group", "")
+
+    # both lookups have to wait for each other, so they can only
+    # succeed when executed in parallel
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get_perun_user(idp_id, uids):
+        barrier.wait()
+        return test_user
+
+    def get_facility_by_rp_identifier(rp_id):
+        barrier.wait()
+        return test_facility
+
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=get_perun_user), \
+            patch.object(LdapAdapter, "get_facility_by_rp_identifier",
+                         side_effect=get_facility_by_rp_identifier) \
+            as mock_get_facility, \
+            patch.object(LdapAdapter, "get_users_groups_on_facility",
+                         return_value=[test_group]), \
+            patch.object(LdapAdapter, "get_resource_capabilities_by_facility",
+                         return_value=["resource capability"]), \
+            patch.object(LdapAdapter, "get_facility_capabilities_by_facility",
+                         return_value=["facility capability"]), \
+            patch.object(LdapAdapter, "get_user_attributes",
+                         return_value={"perunUserAttribute_loa": 2}), \
+            patch.object(LdapAdapter, "get_facility_attributes",
+                         side_effect=AdapterSkipException), \
+            patch.object(PerunRpcAdapter, "get_facility_attributes",
+                         return_value={"perunFacilityAttr_spname": "sp"}):
+        login_context = manager.get_login_context(
+            "idp", ["john@idp"], "rp_id",
+            ["perunUserAttribute_loa"], ["perunFacilityAttr_spname"]
+        )
+
+    manager.close()
+
+    assert mock_get_facility.call_count == 1
+    assert login_context.user == test_user
+    assert login_context.facility == test_facility
+    assert login_context.users_groups_on_facility == (test_group,)
+    assert login_context.resource_capabilities == ("resource capability",)
+    assert login_context.facility_capabilities == ("facility capability",)
+    assert login_context.user_attributes == {"perunUserAttribute_loa": 2}
+    assert login_context.facility_attributes == {
+        "perunFacilityAttr_spname": "sp"
+    }
+    with pytest.raises(AttributeError):
+        login_context.user = None
+
+
+def test_get_login_context_facility_not_found():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+
+    with patch.object(LdapAdapter, "get_perun_user",
+                      return_value=test_user), \
+            patch.object(LdapAdapter, "get_facility_by_rp_identifier",
+                         return_value=None), \
+            patch.object(LdapAdapter, "get_users_groups_on_facility") \
+            as mock_get_groups, \
+            patch.object(LdapAdapter, "get_user_attributes",
+                         return_value={}):
+        login_context = manager.get_login_context(
+            "idp", ["john@idp"], "unknown_rp_id", [], []
+        )
+
+    manager.close()
+
+    mock_get_groups.assert_not_called()
+    assert login_context.user == test_user
+    assert login_context.facility is None
+    assert login_context.users_groups_on_facility == ()
+    assert login_context.facility_capabilities == ()
+
+
+def test_hedged_call_answered_by_second_adapter():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['hedging'] = {"methods": ["get_perun_user"],
+                         "initial_delay_ms": 10, "max_hedge_ratio": 1}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    ldap_released = threading.Event()
+
+    def get_slow_perun_user(idp_id, uids):
+        ldap_released.wait(5)
+        return None
+
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=get_slow_perun_user), \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         return_value=test_user) as mock_rpc:
+        result = manager.get_perun_user("1", ["John Doe"])
+        ldap_released.set()
+
+    manager.close()
+
+    assert result == test_user
+    mock_rpc.assert_called_once_with("1", ["John Doe"])
+    assert manager.get_hedging_stats() == {
+        "get_perun_user": {"calls": 1, "fired": 1, "won": 1}
+    }
+
+
+def test_hedged_call_answered_in_time_by_first_adapter():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['hedging'] = {"methods": ["get_perun_user"],
+                         "initial_delay_ms": 5000, "max_hedge_ratio": 1}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    with patch.object(LdapAdapter, "get_perun_user",
+                      return_value=test_user), \
+            patch.object(PerunRpcAdapter, "get_perun_user") as mock_rpc:
+        result = manager.get_perun_user("1", ["John Doe"])
+
+    manager.close()
+
+    assert result == test_user
+    mock_rpc.assert_not_called()
+    assert manager.get_hedging_stats() == {
+        "get_perun_user": {"calls": 1, "fired": 0, "won": 0}
+    }
+
+
+def test_hedged_call_limited_by_max_hedge_ratio():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['hedging'] = {"methods": ["get_perun_user"],
+                         "initial_delay_ms": 1, "min_delay_ms": 1,
+                         "max_hedge_ratio": 0.5}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+
+    def get_slow_perun_user(idp_id, uids):
+        time.sleep(0.05)
+        return test_user
+
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=get_slow_perun_user), \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         side_effect=get_slow_perun_user) as mock_rpc:
+        for _ in range(4):
+            assert manager.get_perun_user("1", ["John Doe"]) == test_user
+
+    manager.close()
+
+    assert mock_rpc.call_count == 2
+    assert manager.get_hedging_stats()["get_perun_user"]["fired"] == 2
+
+
+def test_writes_not_hedged():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['hedging'] = {"methods": ["get_perun_user",
+                                     "update_user_ext_source_last_access"],
+                         "initial_delay_ms": 1, "max_hedge_ratio": 1}
+
+    manager = AdaptersManager(config)
+
+    def slow_update(user_ext_source):
+        time.sleep(0.05)
+
+    with patch.object(PerunRpcAdapter, "update_user_ext_source_last_access",
+                      side_effect=slow_update) as mock_rpc:
+        manager.update_user_ext_source_last_access(5)
+
+    manager.close()
+
+    mock_rpc.assert_called_once_with(5)
+    assert list(manager.get_hedging_stats()) == ["get_perun_user"]
+
+
+def test_hedged_call_skipped_by_first_adapter():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['hedging'] = {"methods": ["get_perun_user"],
+                         "initial_delay_ms": 5000}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=AdapterSkipException), \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         return_value=test_user) as mock_rpc:
+        result = manager.get_perun_user("1", ["John Doe"])
+
+    manager.close()
+
+    assert result == test_user
+    mock_rpc.assert_called_once_with("1", ["John Doe"])
+    assert manager.get_hedging_stats()["get_perun_user"]["fired"] == 0
+
+
+def test_circuit_breaker_opens_and_falls_through():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['circuit_breaker'] = {"min_calls": 2, "window_size": 2,
+                                 "open_timeout_s": 60}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=Exception("LDAP is down")) as mock_ldap, \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         return_value=test_user) as mock_rpc:
+        for _ in range(3):
+            assert manager.get_perun_user("1", ["John Doe"]) == test_user
+
+    manager.close()
+
+    assert mock_ldap.call_count == 2
+    assert mock_rpc.call_count == 3
+    stats = manager.get_circuit_breaker_stats()
+    assert stats["ldap_adapter"]["state"] == "open"
+    assert stats["ldap_adapter"]["rejected_calls"] == 1
+    assert stats["ldap_adapter"]["transitions"][-1]["to"] == "open"
+    assert stats["rpc_adapter"]["state"] == "closed"
+
+
+def test_circuit_breaker_closed_by_background_probe():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['circuit_breaker'] = {"min_calls": 1, "window_size": 1,
+                                 "open_timeout_s": 0.01}
+
+    manager = AdaptersManager(config)
+
+    test_user = User(1, "John Doe")
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=[Exception("LDAP is down"), test_user]), \
+            patch.object(PerunRpcAdapter, "get_perun_user",
+                         return_value=test_user) as mock_rpc:
+        manager.get_perun_user("1", ["John Doe"])
+        time.sleep(0.02)
+        manager.get_perun_user("1", ["John Doe"])
+        manager.close()
+
+    assert mock_rpc.call_count == 2
+    transitions = manager.get_circuit_breaker_stats()["ldap_adapter"][
+        "transitions"]
+    assert [transition["to"] for transition in transitions] == [
+        "open", "half_open", "closed"
+    ]
+
+
+def test_circuit_breaker_ignores_perun_errors():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = SUPPORTED_CONFIG_DATA
+    config['circuit_breaker'] = {"min_calls": 1, "window_size": 1}
+
+    manager = AdaptersManager(config)
+
+    with patch.object(LdapAdapter, "get_perun_user",
+                      side_effect=ApiException(http_resp=HttpResponse(
+                          '"name":"UserNotExistsException"'))), \
+            patch.object(PerunRpcAdapter, "get_perun_user") as mock_rpc:
+        with pytest.raises(ApiException):
+            manager.get_perun_user("1", ["John Doe"])
+
+    manager.close()
+
+    mock_rpc.assert_not_called()
+    assert manager.get_circuit_breaker_stats()["ldap_adapter"][
+        "state"] == "closed"
+
+
+def test_concurrent_equal_calls_share_one_execution():
+    config = copy.deepcopy(BASE_MANAGER_CONFIG)
+    config['adapters'] = [LDAP_CONFIG_DATA]
+    config['single_flight'] = {"methods": ["get_facility_by_rp_identifier"]}
+
+    manager = AdaptersManager(config)
+
+    test_facility = Facility(1, "facility", "test facility", "rp_id")
+    ldap_called = threading.Event()
+    ldap_released = threading.Event()
+
+    def get_slow_facility(rp_identifier):
+        ldap_called.set()
+        ldap_released.wait(5)
+        return test_facility
+
+    results = []
+    with patch.object(LdapAdapter, "get_facility_by_rp_identifier",
+                      side_effect=get_slow_facility) as mock_ldap:
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                manager.get_facility_by_rp_identifier("rp_id")
+            ))
+            for _ in range(5)
+        ]
+        threads[0].start()
+        ldap_called.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while manager.get_single_flight_stats()[
+            "get_facility_by_rp_identifier"
+        ]["calls"] < 5:
+            time.sleep(0.01)
+        ldap_released.set()
+        for thread in threads:
+            thread.join()
+
+    manager.close()
+
+    mock_ldap.assert_called_once_with("rp_id")
+    assert results == [test_facility] * 5
+    assert manager.get_single_flight_stats() == {
+        "get_facility_by_rp_identifier": {"calls": 5, "collapsed": 4}
+    }
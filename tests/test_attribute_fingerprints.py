@@ -0,0 +1,39 @@
+from unittest.mock import patch
+
+from utils.AttributeFingerprints import AttributeFingerprints
+
+MAIL = {"namespace": "urn:perun:ues:attribute-def:def",
+        "friendly_name": "mail", "value": "john@example.org"}
+
+
+def test_unchanged_attribute_written_after_refresh_interval():
+    fingerprints = AttributeFingerprints({"refresh_interval_s": 60})
+
+    with patch("utils.AttributeFingerprints.time.monotonic",
+               return_value=1000):
+        fingerprints.record_written(1, [MAIL])
+        assert fingerprints.get_changed(1, [MAIL]) == []
+        # the same attribute of another entity is not written yet
+        assert fingerprints.get_changed(2, [MAIL]) == [MAIL]
+    with patch("utils.AttributeFingerprints.time.monotonic",
+               return_value=1060):
+        assert fingerprints.get_changed(1, [MAIL]) == [MAIL]
+
+
+def test_invalidated_attribute_written_again():
+    fingerprints = AttributeFingerprints({})
+
+    fingerprints.record_written(1, [MAIL])
+    fingerprints.invalidate(1, [MAIL])
+
+    assert fingerprints.get_changed(1, [MAIL]) == [MAIL]
+
+
+def test_least_recently_written_attributes_forgotten():
+    fingerprints = AttributeFingerprints({"max_entries": 1})
+
+    fingerprints.record_written(1, [MAIL])
+    fingerprints.record_written(2, [MAIL])
+
+    assert fingerprints.get_changed(1, [MAIL]) == [MAIL]
+    assert fingerprints.get_changed(2, [MAIL]) == []
@@ -0,0 +1,100 @@
+from unittest.mock import MagicMock
+
+from utils.AuditLogConsumer import AuditLogConsumer
+
+EVENTS_PACKAGE = "cz.metacentrum.perun.audit.events."
+VO = {"id": 1, "name": "Virtual Organization", "short_name": "vo1"}
+FACILITY = {"id": 2, "name": "facility"}
+RP_ID_ATTRIBUTE = {"namespace": "urn:perun:facility:attribute-def:def",
+                   "friendly_name": "OIDCClientID"}
+
+
+def create_message(message_id: int, name: str, **entities) -> dict:
+    return {"id": message_id,
+            "event": {"name": EVENTS_PACKAGE + name, **entities}}
+
+
+def create_consumer(api_instance, state_file=None) -> AuditLogConsumer:
+    return AuditLogConsumer(api_instance, {"consumer_name": "test",
+                                           "state_file": state_file})
+
+
+def test_listeners_notified_about_changed_entities():
+    api_instance = MagicMock()
+    api_instance.poll_consumer_messages.return_value = [
+        create_message(10, "VoManagerEvents.VoUpdated", vo=VO),
+        create_message(11, "AttributesManagerEvents.AttributeSetForFacility",
+                       attribute=RP_ID_ATTRIBUTE, facility=FACILITY),
+        create_message(12, "UserManagerEvents.UserUpdated",
+                       user={"id": 3}),
+    ]
+    consumer = create_consumer(api_instance)
+    vo_listener = MagicMock()
+    facility_listener = MagicMock()
+    consumer.add_listener("vo", vo_listener)
+    consumer.add_listener("facility", facility_listener)
+
+    consumer.poll()
+
+    vo_listener.assert_called_once_with(
+        "VoUpdated", api_instance.poll_consumer_messages.return_value[0][
+            "event"]
+    )
+    assert facility_listener.call_args.args[0] == "AttributeSetForFacility"
+
+
+def test_listeners_not_notified_about_other_events():
+    api_instance = MagicMock()
+    api_instance.poll_consumer_messages.return_value = [
+        # names containing the name of an entity type only
+        create_message(10, "VoManagerEvents.AdminAddedForVo", vo=VO),
+        create_message(11, "GroupManagerEvents.GroupSyncStarted",
+                       group={"id": 4}),
+        create_message(12, "GroupManagerEvents.GroupUpdated",
+                       group={"id": 4}),
+    ]
+    consumer = create_consumer(api_instance)
+    vo_listener = MagicMock()
+    group_listener = MagicMock()
+    consumer.add_listener("vo", vo_listener)
+    consumer.add_listener("group", group_listener)
+
+    consumer.poll()
+
+    vo_listener.assert_not_called()
+    assert [call.args[0] for call in group_listener.call_args_list] == [
+        "GroupUpdated"
+    ]
+
+
+def test_failing_listener_does_not_stop_processing():
+    api_instance = MagicMock()
+    api_instance.poll_consumer_messages.return_value = [
+        create_message(10, "VoManagerEvents.VoDeleted", vo=VO),
+        create_message(11, "VoManagerEvents.VoUpdated", vo=VO),
+    ]
+    consumer = create_consumer(api_instance)
+    listener = MagicMock(side_effect=[Exception("cache error"), None])
+    consumer.add_listener("vo", listener)
+
+    consumer.poll()
+
+    assert listener.call_count == 2
+
+
+def test_restart_continues_after_last_processed_message(tmp_path):
+    state_file = str(tmp_path / "audit_log_consumer_state")
+    api_instance = MagicMock()
+    api_instance.poll_consumer_messages.return_value = [
+        create_message(10, "VoManagerEvents.VoUpdated", vo=VO),
+        create_message(11, "VoManagerEvents.VoUpdated", vo=VO),
+    ]
+    consumer = create_consumer(api_instance, state_file)
+    consumer.register()
+    api_instance.set_last_processed_id.assert_not_called()
+    consumer.poll()
+
+    restarted_consumer = create_consumer(api_instance, state_file)
+    restarted_consumer.register()
+
+    api_instance.set_last_processed_id.assert_called_once_with("test", 11)
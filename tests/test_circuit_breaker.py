@@ -0,0 +1,25 @@
+from unittest.mock import patch
+
+from utils.CircuitBreaker import CircuitBreaker
+
+
+def test_another_probe_let_through_after_probe_timeout():
+    breaker = CircuitBreaker("adapter", {"min_calls": 1,
+                                         "open_timeout_s": 30,
+                                         "probe_timeout_s": 10})
+
+    with patch("utils.CircuitBreaker.time.monotonic") as mock_monotonic:
+        mock_monotonic.return_value = 1000
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        mock_monotonic.return_value = 1030
+        assert breaker.try_acquire_probe()
+        # the probe hangs, its result is never recorded
+        mock_monotonic.return_value = 1039
+        assert not breaker.try_acquire_probe()
+        mock_monotonic.return_value = 1040
+        assert breaker.try_acquire_probe()
+
+        breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
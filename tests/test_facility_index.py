@@ -0,0 +1,60 @@
+from unittest.mock import MagicMock, patch
+
+from models.Facility import Facility
+from utils.FacilityIndex import FacilityIndex
+
+FACILITY_1 = Facility(1, "facility1", "first facility", "https://sp1.org")
+FACILITY_2 = Facility(2, "facility2", "second facility", "https://sp2.org")
+FACILITY_3 = Facility(3, "facility3", "third facility", "https://sp2.org")
+
+
+def test_indexed_facilities_found():
+    index = FacilityIndex("test", lambda: [FACILITY_1, FACILITY_2,
+                                           FACILITY_3], {})
+    assert index.get(FACILITY_1.rp_id) == (False, None)
+
+    index.reload()
+
+    assert index.get(FACILITY_1.rp_id) == (True, FACILITY_1)
+    # rpID shared by more facilities identifies none of them
+    assert index.get(FACILITY_2.rp_id) == (True, None)
+    assert index.get("https://unknown.org") == (False, None)
+
+
+def test_facility_created_after_reload_added():
+    index = FacilityIndex("test", lambda: [FACILITY_1], {})
+    index.reload()
+    new_facility = Facility(4, "facility4", "new facility", "https://sp4.org")
+
+    index.put(new_facility.rp_id, new_facility)
+
+    assert index.get(new_facility.rp_id) == (True, new_facility)
+    assert index.get_stats()["size"] == 2
+
+
+def test_unknown_rp_ids_cached_with_bound_size():
+    index = FacilityIndex("test", MagicMock(return_value=[]),
+                          {"negative_cache_size": 2, "negative_ttl_s": 60})
+    index.reload()
+
+    with patch("utils.FacilityIndex.time.monotonic", return_value=1000):
+        for rp_id in ["https://a.org", "https://b.org", "https://c.org"]:
+            index.put(rp_id, None)
+
+        assert index.get("https://a.org") == (False, None)
+        assert index.get("https://c.org") == (True, None)
+    with patch("utils.FacilityIndex.time.monotonic", return_value=1061):
+        assert index.get("https://c.org") == (False, None)
+
+    assert index.get_stats()["negative_cache_size"] == 1
+
+
+def test_changed_facility_invalidated():
+    index = FacilityIndex("test", lambda: [FACILITY_1], {})
+    index.reload()
+    index.put("https://renamed.org", None)
+
+    index.invalidate(FACILITY_1.id)
+
+    assert index.get(FACILITY_1.rp_id) == (False, None)
+    assert index.get("https://renamed.org") == (False, None)
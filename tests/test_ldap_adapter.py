@@ -5,9 +5,11 @@ from models.User import User
 from models.VO import VO
 from models.MemberStatusEnum import MemberStatusEnum
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import call, patch, MagicMock
 
 from utils.ConfigStore import ConfigStore
+from utils.FacilityIndex import FacilityIndex
+from utils.VoCache import VoCache
 
 adapters_cfg = ConfigStore.get_adapters_manager_config().get('adapters')
 ldapAdapterCfg = None
@@ -285,17 +287,56 @@ def test_get_vo_by_non_existent_id(mock_request):
     assert str(error.value.args[0]) == expected_error_message
 
 
+@patch(
+    "connectors.LdapConnector.LdapConnector.search_for_entities"
+)
 @patch(
     "connectors.LdapConnector.LdapConnector.search_for_entity"
 )
-def test_get_member_groups(mock_request):
+def test_get_member_groups(mock_request, mock_request2):
     ADAPTER.connector.search_for_entity = MagicMock(
-        side_effect=[USER_DATA, GROUP_1, VO_2, GROUP_2, VO_2]
+        side_effect=[USER_DATA, VO_2]
+    )
+    ADAPTER.connector.search_for_entities = MagicMock(
+        return_value=[GROUP_2, GROUP_1]
     )
     groups = ADAPTER.get_member_groups(USER, TEST_VO)
 
-    expected_groups = [INITIALIZED_GROUP_1, INITIALIZED_GROUP_2]
-    assert expected_groups.sort(key=lambda x: x.id) == groups.sort(key=lambda x: x.id)
+    assert groups == [INITIALIZED_GROUP_1, INITIALIZED_GROUP_2]
+    # one search for membership, one for the groups and one for their VO
+    assert ADAPTER.connector.search_for_entity.call_count == 2
+    ADAPTER.connector.search_for_entities.assert_called_once_with(
+        'perunVoId=1,' + ldapAdapterCfg['base_dn'],
+        '(&(objectClass=perunGroup)(|(perunGroupId=1)(perunGroupId=2)))',
+        ['perunGroupId', 'cn', 'perunUniqueGroupName',
+         'perunVoId', 'uuid', 'description']
+    )
+
+
+@patch(
+    "connectors.LdapConnector.LdapConnector.search_for_entities"
+)
+@patch(
+    "connectors.LdapConnector.LdapConnector.search_for_entity"
+)
+def test_get_member_groups_chunked(mock_request, mock_request2):
+    group_ids = range(1, 151)
+    user_data = dict(USER_DATA, memberOf=[
+        'perunGroupId=' + str(group_id) + ',perunVoId=1,dc=perun,dc=cesnet'
+        for group_id in group_ids
+    ])
+    groups_data = [dict(GROUP_1, perunGroupId=group_id)
+                   for group_id in group_ids]
+    ADAPTER.connector.search_for_entity = MagicMock(
+        side_effect=[user_data, VO_2]
+    )
+    ADAPTER.connector.search_for_entities = MagicMock(
+        side_effect=[groups_data[:100], groups_data[100:]]
+    )
+    groups = ADAPTER.get_member_groups(USER, TEST_VO)
+
+    assert [group.id for group in groups] == list(group_ids)
+    assert ADAPTER.connector.search_for_entities.call_count == 2
 
 
 @patch(
@@ -312,31 +353,39 @@ def test_get_member_groups_empty(mock_request):
 @patch(
     "adapters.LdapAdapter.LdapAdapter.get_vo"
 )
+@patch(
+    "connectors.LdapConnector.LdapConnector.iter_entities"
+)
 @patch(
     "connectors.LdapConnector.LdapConnector.search_for_entities"
 )
 @patch(
     "connectors.LdapConnector.LdapConnector.search_for_entity"
 )
-def test_get_sp_groups(mock_request, mock_request2, mock_request3):
+def test_get_sp_groups(mock_request, mock_request2, mock_request3,
+                       mock_request4):
     ADAPTER.get_vo = MagicMock(
         return_value=TEST_VO
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES
     )
-    ADAPTER.connector.search_for_entity = MagicMock(
-        side_effect=[GROUP_1, GROUP_2, GROUP_3]
+    ADAPTER.connector.search_for_entities = MagicMock(
+        return_value=GROUPS
     )
 
     groups = ADAPTER.get_sp_groups_by_facility(FACILITY)
-    expected_groups = [INITIALIZED_GROUP_1, INITIALIZED_GROUP_2, INITIALIZED_GROUP_3]
-    assert expected_groups.sort(key=lambda x: x.id) == groups.sort(key=lambda x: x.id)
+    assert groups == INITIALIZED_GROUPS
+    ADAPTER.connector.search_for_entities.assert_called_once()
+    ADAPTER.get_vo.assert_called_once_with(vo_id=1)
 
 
 @patch(
     "adapters.LdapAdapter.LdapAdapter.get_vo"
 )
+@patch(
+    "connectors.LdapConnector.LdapConnector.iter_entities"
+)
 @patch(
     "connectors.LdapConnector.LdapConnector.search_for_entities"
 )
@@ -345,33 +394,40 @@ def test_get_sp_groups(mock_request, mock_request2, mock_request3):
 )
 def test_get_sp_groups_repeated_groups(mock_request,
                                        mock_request2,
-                                       mock_request3):
+                                       mock_request3,
+                                       mock_request4):
     ADAPTER.get_vo = MagicMock(
         return_value=TEST_VO
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_REPEATED
     )
-    ADAPTER.connector.search_for_entity = MagicMock(
-        side_effect=[GROUP_1, GROUP_1, GROUP_2, GROUP_3]
+    ADAPTER.connector.search_for_entities = MagicMock(
+        return_value=GROUPS
     )
 
     groups = ADAPTER.get_sp_groups_by_facility(FACILITY)
-    expected_groups = [INITIALIZED_GROUP_1, INITIALIZED_GROUP_2, INITIALIZED_GROUP_3]
-    assert expected_groups.sort(key=lambda x: x.id) == groups.sort(key=lambda x: x.id)
+    assert groups == INITIALIZED_GROUPS
+    ADAPTER.connector.search_for_entities.assert_called_once_with(
+        'perunVoId=1,' + ldapAdapterCfg['base_dn'],
+        '(&(objectClass=perunGroup)(|(perunGroupId=1)(perunGroupId=2)'
+        '(perunGroupId=3)))',
+        ['perunGroupId', 'cn', 'perunUniqueGroupName',
+         'perunVoId', 'uuid', 'description']
+    )
 
 
 @patch(
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_get_sp_groups_not_assigned_groups(mock_request, mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_NOT_GROUPS
     )
 
@@ -383,13 +439,13 @@ def test_get_sp_groups_not_assigned_groups(mock_request, mock_request2):
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_get_sp_groups_empty_resources(mock_request, mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_EMPTY
     )
 
@@ -441,14 +497,14 @@ def test_users_group_on_facility_facility_not_found(mock_request):
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_users_group_on_facility_resources_not_found(mock_request,
                                                      mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_EMPTY
     )
     expected_error_message = 'Service with spEntityId: ' \
@@ -464,14 +520,14 @@ def test_users_group_on_facility_resources_not_found(mock_request,
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_users_group_on_facility_groups_not_found(mock_request,
                                                   mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         side_effect=[RESOURCES_REPEATED, GROUPS_EMPTY]
     )
     groups = ADAPTER.get_users_groups_on_facility(FACILITY, USER)
@@ -483,13 +539,13 @@ def test_users_group_on_facility_groups_not_found(mock_request,
     "adapters.LdapAdapter.LdapAdapter.get_vo"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_users_group_on_facility_repeated_groups(mock_request, mock_request2):
     ADAPTER.get_vo = MagicMock(
         return_value=TEST_VO
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         side_effect=[RESOURCES_REPEATED, GROUPS_REPEATED]
     )
     groups = ADAPTER.get_users_groups_on_facility(FACILITY, USER)
@@ -501,14 +557,14 @@ def test_users_group_on_facility_repeated_groups(mock_request, mock_request2):
     "adapters.LdapAdapter.LdapAdapter.get_vo"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_users_group_on_facility_not_repeated_groups(mock_request,
                                                      mock_request2):
     ADAPTER.get_vo = MagicMock(
         return_value=TEST_VO
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         side_effect=[RESOURCES_REPEATED, GROUPS]
     )
     groups = ADAPTER.get_users_groups_on_facility(FACILITY, USER)
@@ -619,13 +675,13 @@ def test_resource_capabilities_no_facility(mock_request):
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_resource_capabilities_empty(mock_request, mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_EMPTY
     )
     resource_capabilities = \
@@ -637,13 +693,13 @@ def test_resource_capabilities_empty(mock_request, mock_request2):
     "adapters.LdapAdapter.LdapAdapter.get_facility_by_rp_identifier"
 )
 @patch(
-    "connectors.LdapConnector.LdapConnector.search_for_entities"
+    "connectors.LdapConnector.LdapConnector.iter_entities"
 )
 def test_resource_capabilities(mock_request, mock_request2):
     ADAPTER.get_facility_by_rp_identifier = MagicMock(
         return_value=FACILITY
     )
-    ADAPTER.connector.search_for_entities = MagicMock(
+    ADAPTER.connector.iter_entities = MagicMock(
         return_value=RESOURCES_REPEATED
     )
     resource_capabilities = \
@@ -673,3 +729,103 @@ def test_facility_capabilities(mock_request):
     )
     facility_capabilities = ADAPTER.get_facility_capabilities_by_facility(FACILITY)
     assert facility_capabilities == FACILITY_DATA['capabilities']
+
+
+def test_user_served_from_replica():
+    adapter = LdapAdapter(ldapAdapterCfg)
+    adapter._replica = MagicMock()
+    adapter._replica.get_user_by_eppns.return_value = USER_WITH_ALL
+    adapter.connector.search_for_entity = MagicMock()
+
+    user = adapter.get_perun_user("1", ["foe@idp.example.org"])
+
+    assert user == USER
+    adapter._replica.get_user_by_eppns.assert_called_once_with(
+        ["foe@idp.example.org"]
+    )
+    adapter.connector.search_for_entity.assert_not_called()
+
+
+def test_facility_not_in_replica_searched_in_ldap():
+    adapter = LdapAdapter(ldapAdapterCfg)
+    adapter._replica = MagicMock()
+    adapter._replica.get_facility_by_rp_id.return_value = None
+    adapter.connector.search_for_entity = MagicMock(
+        return_value=FACILITY_DATA
+    )
+
+    facility = adapter.get_facility_by_rp_identifier('1')
+
+    assert facility.id == FACILITY_DATA['perunFacilityId']
+    adapter.connector.search_for_entity.assert_called_once()
+
+
+def test_replica_entities_invalidated_from_audit_log():
+    adapter = LdapAdapter(ldapAdapterCfg)
+    adapter._replica = MagicMock()
+    consumer = MagicMock()
+    adapter.register_cache_invalidation(consumer)
+    listeners = {
+        listener_call.args[0]: listener_call.args[1]
+        for listener_call in consumer.add_listener.call_args_list
+    }
+
+    listeners["group"]("GroupDeleted", {"group": {"id": 3}})
+    listeners["member"]("DirectMemberAddedToGroup",
+                        {"member": {"id": 5, "user_id": 7}})
+    listeners["resource"]("GroupAssignedToResource",
+                          {"resource": {"id": 4, "facility_id": 2}})
+
+    adapter._replica.invalidate.assert_has_calls([
+        call("perunGroup", 3), call("perunUser", 7)
+    ])
+    adapter._replica.invalidate_resources_of_facility.assert_called_once_with(
+        2
+    )
+
+
+def test_replica_not_used_until_loaded():
+    adapter = LdapAdapter(ldapAdapterCfg)
+    adapter._replica = MagicMock()
+    adapter._replica.is_loaded.return_value = False
+    adapter.connector.search_for_entity = MagicMock(
+        return_value=USER_WITH_ALL
+    )
+
+    user = adapter.get_perun_user("1", ["foe@idp.example.org"])
+
+    assert user == USER
+    adapter._replica.get_user_by_eppns.assert_not_called()
+
+
+def test_get_vo_not_found_cached():
+    adapter = LdapAdapter(ldapAdapterCfg, VoCache({}))
+    with patch.object(adapter.connector, "search_for_entity",
+                      return_value=None) as mock_search:
+        for _ in range(2):
+            with pytest.raises(Exception, match="does not exists"):
+                adapter.get_vo('fake_short_name')
+
+    mock_search.assert_called_once()
+
+
+def test_get_facility_by_rp_id_from_index():
+    adapter = LdapAdapter(ldapAdapterCfg)
+    facilities = [{**FACILITY_DATA, 'cn': ['facility'],
+                   'description': ['this is a testing facility'],
+                   adapter._get_rp_id_attr_name(): ['1']}]
+    adapter._facility_index = FacilityIndex('ldap_adapter',
+                                            adapter._load_facilities, {})
+    with patch.object(adapter.connector, "iter_entities",
+                      return_value=iter(facilities)):
+        adapter._facility_index.reload()
+
+    with patch.object(adapter.connector, "search_for_entity",
+                      return_value=None) as mock_search:
+        assert adapter.get_facility_by_rp_identifier('1') == Facility(
+            '1', 'facility', 'this is a testing facility', '1'
+        )
+        assert adapter.get_facility_by_rp_identifier('unknown') is None
+        assert adapter.get_facility_by_rp_identifier('unknown') is None
+
+    mock_search.assert_called_once()
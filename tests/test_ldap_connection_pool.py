@@ -0,0 +1,160 @@
+import threading
+from unittest.mock import patch, MagicMock
+
+import pytest
+from ldap3 import ServerPool
+from ldap3.core.exceptions import (
+    LDAPSessionTerminatedByServerError, LDAPSocketOpenError,
+)
+
+from connectors.LdapConnectionPool import LdapConnectionPool
+
+POOL_CONFIG = {"pool_size": 2, "max_connection_lifetime_s": 600,
+               "idle_health_check_after_s": 60, "checkout_timeout_s": 0.1}
+
+
+def create_connection(*args, **kwargs):
+    connection = MagicMock()
+    connection.server.ssl = False
+    connection.closed = False
+    connection.bound = True
+    connection.bind.return_value = (True, None, None, None)
+    connection.start_tls.return_value = (True, None, None, None)
+    connection.search.return_value = (True, None, [], None)
+    return connection
+
+
+def create_pool(config=None, enable_tls=False) -> LdapConnectionPool:
+    return LdapConnectionPool(ServerPool(), "user", "password", enable_tls,
+                              config or POOL_CONFIG)
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_connection_bound_once_and_reused(mock_connection):
+    pool = create_pool(enable_tls=True)
+
+    for _ in range(3):
+        with pool.connection() as conn:
+            conn.search("base", "(filter=test)")
+
+    assert mock_connection.call_count == 1
+    conn.start_tls.assert_called_once()
+    conn.bind.assert_called_once()
+    conn.unbind.assert_not_called()
+    assert conn.search.call_count == 3
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_connection_discarded_on_error(mock_connection):
+    pool = create_pool()
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("broken socket")
+
+    conn.unbind.assert_called_once()
+    with pool.connection() as new_conn:
+        assert new_conn is not conn
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_operation_retried_on_new_connection_once(mock_connection):
+    pool = create_pool()
+    with pool.connection() as closed_conn:
+        pass
+    closed_conn.search.side_effect = LDAPSessionTerminatedByServerError(
+        "session terminated by server"
+    )
+
+    result = pool.execute(lambda conn: conn.search("base", "(filter=test)"))
+
+    assert result == (True, None, [], None)
+    closed_conn.unbind.assert_called_once()
+    assert mock_connection.call_count == 2
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_operation_failing_on_new_connection_not_retried(mock_connection):
+    pool = create_pool()
+    operation = MagicMock(side_effect=LDAPSocketOpenError("unreachable"))
+
+    with pytest.raises(LDAPSocketOpenError):
+        pool.execute(operation)
+
+    assert operation.call_count == 2
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_connection_reopened_after_max_lifetime(mock_connection):
+    pool = create_pool({**POOL_CONFIG, "max_connection_lifetime_s": 0})
+
+    with pool.connection() as conn:
+        pass
+    with pool.connection() as new_conn:
+        pass
+
+    assert new_conn is not conn
+    conn.unbind.assert_called_once()
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_idle_connection_health_checked(mock_connection):
+    pool = create_pool({**POOL_CONFIG, "idle_health_check_after_s": 0})
+
+    with pool.connection() as conn:
+        pass
+    conn.search.side_effect = Exception("connection reset by peer")
+    with pool.connection() as new_conn:
+        pass
+
+    assert new_conn is not conn
+    conn.unbind.assert_called_once()
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_checkout_limited_by_pool_size(mock_connection):
+    pool = create_pool()
+    checked_out = threading.Barrier(3, timeout=5)
+    released = threading.Event()
+
+    def hold_connection():
+        with pool.connection():
+            checked_out.wait()
+            released.wait(5)
+
+    threads = [threading.Thread(target=hold_connection) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    checked_out.wait()
+
+    with pytest.raises(Exception, match="from the pool in time"):
+        with pool.connection():
+            pass
+
+    released.set()
+    for thread in threads:
+        thread.join()
+
+    assert mock_connection.call_count == 2
+    with pool.connection():
+        pass
+    assert mock_connection.call_count == 2
+
+
+@patch("connectors.LdapConnectionPool.Connection",
+       side_effect=create_connection)
+def test_close_unbinds_idle_connections(mock_connection):
+    pool = create_pool()
+
+    with pool.connection() as conn:
+        pass
+    pool.close()
+
+    conn.unbind.assert_called_once()
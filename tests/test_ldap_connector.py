@@ -1,8 +1,11 @@
 
+from connectors.LdapConnectionPool import LdapConnectionPool
 from connectors.LdapConnector import LdapConnector
 from unittest.mock import patch, MagicMock
 
 import pytest
+from ldap3 import Server, Connection, MOCK_SYNC
+from ldap3.core.exceptions import LDAPSessionTerminatedByServerError
 
 from utils.ConfigStore import ConfigStore
 
@@ -97,3 +100,77 @@ def test_search_for_entities_found(mock_request):
     )
     result = CONNECTOR.search_for_entities(BASE, FILTERS)
     assert result == TEST_ENTRY
+
+
+def test_iter_entities_paged():
+    connection = Connection(Server("mock"), user="cn=admin,dc=muni,dc=cz",
+                            password="mypassword", client_strategy=MOCK_SYNC)
+    # return (status, result, response, request) like SAFE_SYNC does
+    connection.strategy.thread_safe = True
+    for user_id in range(1, 26):
+        connection.strategy.add_entry(
+            "perunUserId=" + str(user_id) + ",ou=People,dc=muni,dc=cz",
+            {"objectClass": ["perunUser"], "perunUserId": str(user_id)}
+        )
+    connection.bind()
+    _, _, response, _ = connection.search(
+        "ou=People,dc=muni,dc=cz", "(objectClass=perunUser)",
+        attributes=["perunUserId"]
+    )
+    server_order = [entry["attributes"]["perunUserId"] for entry in response]
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      return_value=connection), \
+            patch.object(connection, "search",
+                         wraps=connection.search) as mock_search:
+        connector = LdapConnector(loaded_config)
+        entities = connector.iter_entities(
+            "ou=People,dc=muni,dc=cz", "(objectClass=perunUser)",
+            ["perunUserId"], page_size=10
+        )
+
+        assert mock_search.call_count == 0
+        result = [entity["perunUserId"] for entity in entities]
+
+    assert result == server_order
+    assert mock_search.call_count == 3
+
+
+def test_iter_entities_simplified_like_search():
+    connector = LdapConnector(loaded_config)
+    connection = MagicMock()
+    connection.search.return_value = (
+        True, {"controls": {}},
+        [{"type": "searchResEntry", "attributes": TEST_DATA},
+         {"type": "searchResRef", "uri": ["ldap://other"]}], None
+    )
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      return_value=connection), \
+            patch.object(LdapConnector, "_get_simplified_entries",
+                         side_effect=lambda result: [
+                             {**entry["attributes"], "simplified": True}
+                             for entry in result
+                         ]):
+        result = list(connector.iter_entities(BASE, FILTERS))
+
+    assert result == [{**TEST_DATA, "simplified": True}]
+
+
+def test_iter_entities_retried_on_new_connection():
+    connector = LdapConnector(loaded_config)
+    closed_connection = MagicMock()
+    closed_connection.search.side_effect = \
+        LDAPSessionTerminatedByServerError("session terminated by server")
+    new_connection = MagicMock()
+    new_connection.search.return_value = (
+        True, {"controls": {}},
+        [{"type": "searchResEntry", "attributes": TEST_DATA}], None
+    )
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      side_effect=[closed_connection, new_connection]):
+        result = list(connector.iter_entities(BASE, FILTERS))
+
+    assert result == [TEST_DATA]
+    closed_connection.unbind.assert_called_once()
@@ -0,0 +1,155 @@
+from unittest.mock import patch
+
+import pytest
+from ldap3 import Server, Connection, MOCK_SYNC, MODIFY_REPLACE
+
+from connectors.LdapConnectionPool import LdapConnectionPool
+from connectors.LdapConnector import LdapConnector
+from connectors.LdapReplica import LdapReplica
+
+BASE_DN = "dc=perun,dc=cesnet,dc=cz"
+CONNECTOR_CONFIG = {"username": "cn=admin," + BASE_DN,
+                    "password": "mypassword", "start_tls": False,
+                    "servers": [{"hostname": "ldap://openldap",
+                                 "port": 389}]}
+USER_DN = "perunUserId=1,ou=People," + BASE_DN
+FACILITY_DN = "perunFacilityId=1," + BASE_DN
+
+
+@pytest.fixture
+def directory():
+    connection = Connection(Server("mock"),
+                            user=CONNECTOR_CONFIG["username"],
+                            password=CONNECTOR_CONFIG["password"],
+                            client_strategy=MOCK_SYNC)
+    # return (status, result, response, request) like SAFE_SYNC does
+    connection.strategy.thread_safe = True
+    connection.strategy.add_entry(CONNECTOR_CONFIG["username"], {
+        "userPassword": CONNECTOR_CONFIG["password"], "sn": "admin"
+    })
+    connection.strategy.add_entry(USER_DN, {
+        "objectClass": ["perunUser"], "perunUserId": "1",
+        "displayName": "Foe Toe", "cn": "Foe Toe",
+        "eduPersonPrincipalNames": ["foe@idp.example.org"],
+        "memberOf": ["perunGroupId=1,perunVoId=1," + BASE_DN],
+        "modifyTimestamp": "20260101000000Z",
+    })
+    connection.strategy.add_entry("perunVoId=1," + BASE_DN, {
+        "objectClass": ["perunVo"], "perunVoId": "1", "o": "org",
+        "description": "organization", "modifyTimestamp": "20260101000000Z",
+    })
+    connection.strategy.add_entry("perunGroupId=1,perunVoId=1," + BASE_DN, {
+        "objectClass": ["perunGroup"], "perunGroupId": "1",
+        "perunVoId": "1", "cn": "group1", "perunUniqueGroupName": "grp1",
+        "uuid": "uuid", "description": "this group1",
+        "modifyTimestamp": "20260101000000Z",
+    })
+    connection.strategy.add_entry(FACILITY_DN, {
+        "objectClass": ["perunFacility"], "perunFacilityId": "1",
+        "cn": "facility", "description": "this is a testing facility",
+        "entityID": "https://sp.example.org",
+        "modifyTimestamp": "20260101000000Z",
+    })
+    connection.strategy.add_entry("perunResourceId=1,perunVoId=1," + BASE_DN,
+                                  {"objectClass": ["perunResource"],
+                                   "perunResourceId": "1", "perunVoId": "1",
+                                   "perunFacilityDn": FACILITY_DN,
+                                   "assignedGroupId": ["1"],
+                                   "capabilities": ["capability1"],
+                                   "modifyTimestamp": "20260101000000Z"})
+    connection.bind()
+
+    with patch.object(LdapConnectionPool, "_connect",
+                      return_value=connection):
+        yield connection
+
+
+def create_replica() -> LdapReplica:
+    return LdapReplica(LdapConnector(CONNECTOR_CONFIG), BASE_DN, "entityID",
+                       {})
+
+
+def test_reload(directory):
+    replica = create_replica()
+    assert not replica.is_loaded()
+
+    replica.reload()
+
+    assert replica.is_loaded()
+    assert replica.get_user_by_eppns(
+        ["unknown@idp.example.org", "foe@idp.example.org"]
+    )["perunUserId"] == ["1"]
+    assert replica.get_user(1)["memberOf"] == [
+        "perunGroupId=1,perunVoId=1," + BASE_DN
+    ]
+    assert replica.get_vo(short_name="org")["perunVoId"] == ["1"]
+    assert replica.get_vo(vo_id=1)["o"] == ["org"]
+    assert replica.get_group(1)["perunUniqueGroupName"] == ["grp1"]
+    assert replica.get_facility_by_rp_id(
+        "https://sp.example.org")["perunFacilityId"] == ["1"]
+    assert [resource["capabilities"] for resource in
+            replica.get_resources_by_facility(1)] == [["capability1"]]
+    assert replica.get_user_by_eppns(["unknown@idp.example.org"]) is None
+
+
+def test_invalidated_entries_dropped(directory):
+    replica = create_replica()
+    replica.reload()
+
+    replica.invalidate("perunUser", 1)
+    replica.invalidate("perunVo", 1)
+    replica.invalidate("perunGroup", 1)
+    replica.invalidate("perunFacility", 1)
+    replica.invalidate_resources_of_facility(1)
+
+    assert replica.get_user(1) is None
+    assert replica.get_user_by_eppns(["foe@idp.example.org"]) is None
+    assert replica.get_vo(short_name="org") is None
+    assert replica.get_group(1) is None
+    assert replica.get_facility_by_rp_id("https://sp.example.org") is None
+    assert replica.get_resources_by_facility(1) == []
+
+
+def test_sync_changed_entries(directory):
+    replica = create_replica()
+    replica.reload()
+
+    directory.modify(USER_DN, {
+        "eduPersonPrincipalNames": [(MODIFY_REPLACE,
+                                     ["toe@idp.example.org"])],
+        "modifyTimestamp": [(MODIFY_REPLACE, ["20260102000000Z"])],
+    })
+    directory.strategy.add_entry("perunUserId=2,ou=People," + BASE_DN, {
+        "objectClass": ["perunUser"], "perunUserId": "2",
+        "eduPersonPrincipalNames": ["joe@idp.example.org"],
+        "modifyTimestamp": "20260102000000Z",
+    })
+
+    with patch.object(LdapConnector, "iter_entities",
+                      wraps=replica._connector.iter_entities) as mock_iter:
+        replica.sync()
+
+    assert "(modifyTimestamp>=20260101000000Z)" in \
+           mock_iter.call_args_list[0].args[1]
+    assert replica.get_user_by_eppns(["foe@idp.example.org"]) is None
+    assert replica.get_user_by_eppns(
+        ["toe@idp.example.org"])["perunUserId"] == ["1"]
+    assert replica.get_user_by_eppns(
+        ["joe@idp.example.org"])["perunUserId"] == ["2"]
+
+
+def test_sync_deleted_entries(directory):
+    replica = create_replica()
+    replica.reload()
+
+    directory.delete("perunResourceId=1,perunVoId=1," + BASE_DN)
+    directory.delete("perunGroupId=1,perunVoId=1," + BASE_DN)
+    directory.delete(FACILITY_DN)
+
+    replica.sync()
+
+    assert replica.get_resources_by_facility(1) == []
+    assert replica.get_group(1) is None
+    assert replica.get_facility_by_rp_id("https://sp.example.org") is None
+    assert replica.get_user(1)["perunUserId"] == ["1"]
+    assert replica.get_vo(short_name="org")["perunVoId"] == ["1"]
@@ -0,0 +1,33 @@
+import io
+
+import pytest
+import urllib3
+
+from utils.RawResponse import RawRecord, decode_raw_response
+
+
+def create_response(body: bytes) -> urllib3.HTTPResponse:
+    return urllib3.HTTPResponse(body=io.BytesIO(body), status=200,
+                                preload_content=False)
+
+
+def test_decode_raw_response_snake_cases_keys():
+    response = create_response(
+        b'[{"id": 1, "voId": 2, "parentGroupId": null, '
+        b'"attributes": [{"friendlyName": "groupId", "value": "g1"}]}]'
+    )
+
+    groups = decode_raw_response(response)
+
+    assert groups == [{"id": 1, "vo_id": 2, "parent_group_id": None,
+                       "attributes": [{"friendly_name": "groupId",
+                                       "value": "g1"}]}]
+    assert isinstance(groups[0], RawRecord)
+    assert groups[0].vo_id == groups[0]["vo_id"] == 2
+    assert groups[0].attributes[0].friendly_name == "groupId"
+    with pytest.raises(AttributeError):
+        groups[0].short_name
+
+
+def test_decode_raw_response_empty_body():
+    assert decode_raw_response(create_response(b"")) is None
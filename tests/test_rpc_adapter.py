@@ -1,8 +1,11 @@
 import copy
+import io
 import logging
+import time
 from unittest.mock import patch, MagicMock
 
 import pytest
+import urllib3
 
 import perun_openapi
 from adapters.PerunRpcAdapter import PerunRpcAdapter
@@ -14,8 +17,9 @@ from models.Resource import Resource
 from models.User import User
 from models.UserExtSource import UserExtSource
 from models.VO import VO
-from perun_openapi import ApiException
+from perun_openapi import ApiException, ApiValueError
 from utils.ConfigStore import ConfigStore
+from utils.VoCache import VoCache
 
 
 class HttpResponse:
@@ -30,10 +34,12 @@ class HttpResponse:
 
 ADAPTER = PerunRpcAdapter(ConfigStore.get_openapi_config())
 
+TEST_VO = VO(62, "CESNET e-infrastruktura", "einfra")
+
 # sample groups - external representation (Devel)
 TEST_GROUP_EXTERNAL_REPRESENTATION_1 = {
     "id": 1,
-    "vo_id": 10,
+    "vo_id": TEST_VO.id,
     "uuid": "sample-uuid-value",
     "name": "sample:group:name",
     "description": "This is a sample group",
@@ -41,7 +47,7 @@ TEST_GROUP_EXTERNAL_REPRESENTATION_1 = {
 
 TEST_GROUP_EXTERNAL_REPRESENTATION_2 = {
     "id": 2,
-    "vo_id": 10,
+    "vo_id": TEST_VO.id,
     "uuid": "sample-uuid-value-2",
     "name": "sample:group:name:specific",
     "description": "This is a sample sub-group",
@@ -49,18 +55,16 @@ TEST_GROUP_EXTERNAL_REPRESENTATION_2 = {
 
 # sample groups - internal representation
 
-TEST_VO = VO(62, "CESNET e-infrastruktura", "einfra")
 TEST_MEMBER_INTERNAL_REPRESENTATION = Member(5, TEST_VO, "VALID")
 TEST_MEMBER_EXTERNAL_REPRESENTATION = {"id": 5, "vo_id": 1, "status": "VALID"}
 TEST_USER = User(10, "John Doe")
-SAMPLE_SHORT_GROUP_NAME = "short_name"
 
 TEST_GROUP_INTERNAL_REPRESENTATION_1 = Group(
     TEST_GROUP_EXTERNAL_REPRESENTATION_1["id"],
     TEST_VO,
     TEST_GROUP_EXTERNAL_REPRESENTATION_1["uuid"],
     TEST_GROUP_EXTERNAL_REPRESENTATION_1["name"],
-    f"{SAMPLE_SHORT_GROUP_NAME}:"
+    f"{TEST_VO.short_name}:"
     f'{TEST_GROUP_EXTERNAL_REPRESENTATION_1["name"]}',
     TEST_GROUP_EXTERNAL_REPRESENTATION_1["description"],
 )
@@ -70,7 +74,7 @@ TEST_GROUP_INTERNAL_REPRESENTATION_2 = Group(
     TEST_VO,
     TEST_GROUP_EXTERNAL_REPRESENTATION_2["uuid"],
     TEST_GROUP_EXTERNAL_REPRESENTATION_2["name"],
-    f"{SAMPLE_SHORT_GROUP_NAME}:"
+    f"{TEST_VO.short_name}:"
     f'{TEST_GROUP_EXTERNAL_REPRESENTATION_2["name"]}',
     TEST_GROUP_EXTERNAL_REPRESENTATION_2["description"],
 )
@@ -298,11 +302,70 @@ def test_user_without_middle_name_and_titles(mock_request_1):
     assert result_user == expected_user
 
 
-# get_get_member_groups tests
+def get_user_by_uid(users_by_uid: dict, delays_by_uid: dict):
+    def get_user(ext_login, ext_source_name):
+        time.sleep(delays_by_uid.get(ext_login, 0))
+        if ext_login not in users_by_uid:
+            raise ApiException(
+                http_resp=HttpResponse(
+                    '"name":"UserExtSourceNotExistsException"'
+                )
+            )
+        return users_by_uid[ext_login]
+
+    return get_user
+
+
 @patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".get_user_by_ext_source_name_and_ext_login"
+)
+def test_get_perun_user_concurrent_lookup_keeps_uids_order(mock_request_1):
+    config = copy.deepcopy(ConfigStore.get_openapi_config())
+    config["concurrent_user_lookup"] = True
+    adapter = PerunRpcAdapter(config)
+
+    user_template = {
+        "title_before": None,
+        "middle_name": None,
+        "last_name": "Doe",
+        "title_after": None,
+    }
+    users_by_uid = {
+        "eppn": {**user_template, "id": 10, "first_name": "John"},
+        "targeted_id": {**user_template, "id": 20, "first_name": "Jane"},
+    }
+    # the less preferred identifier is resolved first
+    delays_by_uid = {"eppn": 0.1}
+    mock_request_1.side_effect = get_user_by_uid(users_by_uid, delays_by_uid)
+
+    result_user = adapter.get_perun_user(
+        "idp", ["unknown", "eppn", "targeted_id"]
+    )
+    adapter.close()
+
+    assert result_user == User(10, "John Doe")
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".get_user_by_ext_source_name_and_ext_login"
 )
+def test_get_perun_user_concurrent_lookup_no_user_found(mock_request_1):
+    config = copy.deepcopy(ConfigStore.get_openapi_config())
+    config["concurrent_user_lookup"] = True
+    adapter = PerunRpcAdapter(config)
+
+    mock_request_1.side_effect = get_user_by_uid({}, {})
+
+    result_user = adapter.get_perun_user("idp", ["unknown", "unknown 2"])
+    adapter.close()
+
+    assert result_user is None
+    assert mock_request_1.call_count == 2
+
+
+# get_get_member_groups tests
 @patch(
     "perun_openapi.api.groups_manager_api.GroupsManagerApi"
     ".get_all_member_groups"
@@ -311,16 +374,12 @@ def test_user_without_middle_name_and_titles(mock_request_1):
     "perun_openapi.api.members_manager_api.MembersManagerApi"
     ".get_member_by_user"
 )
-@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
 def test_get_member_groups_found_member_groups(
-    mock_request_1, mock_request_2, mock_request_3, mock_request_4
+    mock_request_1, mock_request_2, mock_request_3
 ):
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        return_value={"value": SAMPLE_SHORT_GROUP_NAME}
-    )
-
-    perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id = MagicMock(  # noqa E501
-        return_value=TEST_VO
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
     )
 
     perun_openapi.api.groups_manager_api.GroupsManagerApi.get_all_member_groups = MagicMock(  # noqa E501
@@ -356,8 +415,35 @@ def test_get_member_groups_member_not_found(mock_request_1):
 
 
 @patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
+    "perun_openapi.api.facilities_manager_api.FacilitiesManagerApi"
+    ".get_allowed_rich_groups_with_attributes"
+)
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
+def test_get_sp_groups_found_sp_groups(mock_request_1, mock_request_2):
+    perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_allowed_rich_groups_with_attributes = MagicMock(  # noqa E501
+        return_value=[
+            TEST_GROUP_EXTERNAL_REPRESENTATION_1,
+            TEST_GROUP_EXTERNAL_REPRESENTATION_1,
+            TEST_GROUP_EXTERNAL_REPRESENTATION_2,
+            TEST_GROUP_EXTERNAL_REPRESENTATION_2,
+        ]
+    )
+
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
+    )
+
+    result_groups = ADAPTER.get_sp_groups_by_facility(TEST_INTERNAL_FACILITY_1)
+
+    assert [
+        TEST_GROUP_INTERNAL_REPRESENTATION_1,
+        TEST_GROUP_INTERNAL_REPRESENTATION_2,
+    ] == result_groups
+
+
+@patch(
+    "perun_openapi.api.facilities_manager_api.FacilitiesManagerApi"
+    ".get_allowed_rich_groups_with_attributes"
 )
 @patch(
     "perun_openapi.api.facilities_manager_api.FacilitiesManagerApi"
@@ -367,17 +453,22 @@ def test_get_member_groups_member_not_found(mock_request_1):
     "perun_openapi.api.resources_manager_api.ResourcesManagerApi"
     ".get_assigned_groups"
 )
-@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
-def test_get_sp_groups_found_sp_groups(
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
+def test_get_sp_groups_fallback_to_groups_per_resource(
     mock_request_1,
     mock_request_2,
     mock_request_3,
     mock_request_4,
 ):
-    test_resources = [Resource(1, None, None, None)]
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config())
+    test_resources = [Resource(1, None, None, None),
+                      Resource(2, None, None, None)]
 
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        return_value={"value": SAMPLE_SHORT_GROUP_NAME}
+    perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_allowed_rich_groups_with_attributes = MagicMock(  # noqa E501
+        side_effect=ApiException(
+            http_resp=HttpResponse('"name":"RpcException",'
+                                   '"type":"UNKNOWN_METHOD"')
+        )
     )
 
     perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_assigned_resources_for_facility = MagicMock(  # noqa E501
@@ -385,24 +476,52 @@ def test_get_sp_groups_found_sp_groups(
     )
 
     perun_openapi.api.resources_manager_api.ResourcesManagerApi.get_assigned_groups = MagicMock(  # noqa E501
-        return_value=[
-            TEST_GROUP_EXTERNAL_REPRESENTATION_1,
-            TEST_GROUP_EXTERNAL_REPRESENTATION_1,
-            TEST_GROUP_EXTERNAL_REPRESENTATION_2,
-            TEST_GROUP_EXTERNAL_REPRESENTATION_2,
+        side_effect=[
+            [TEST_GROUP_EXTERNAL_REPRESENTATION_1],
+            [TEST_GROUP_EXTERNAL_REPRESENTATION_1,
+             TEST_GROUP_EXTERNAL_REPRESENTATION_2],
         ]
     )
 
-    perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id = MagicMock(  # noqa E501
-        return_value=TEST_VO
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
     )
 
-    result_groups = ADAPTER.get_sp_groups_by_facility(TEST_INTERNAL_FACILITY_1)
+    result_groups = adapter.get_sp_groups_by_facility(TEST_INTERNAL_FACILITY_1)
+    adapter.close()
 
     assert [
         TEST_GROUP_INTERNAL_REPRESENTATION_1,
         TEST_GROUP_INTERNAL_REPRESENTATION_2,
     ] == result_groups
+    assert not adapter._allowed_rich_groups_supported
+
+
+def test_create_internal_representation_groups_rpc_calls_count():
+    test_vos = [VO(vo_id, f"vo {vo_id}", f"vo_{vo_id}") for vo_id in range(5)]
+    test_groups = [
+        {
+            "id": group_id,
+            "vo_id": test_vos[group_id % len(test_vos)].id,
+            "uuid": f"uuid-{group_id}",
+            "name": f"group:{group_id}",
+            "description": "",
+        }
+        for group_id in range(100)
+    ]
+
+    with patch(
+        "perun_openapi.api_client.ApiClient.call_api", return_value=test_vos
+    ) as mock_call_api:
+        converted_groups = []
+        ADAPTER._create_internal_representation_groups(
+            test_groups + test_groups, converted_groups
+        )
+
+    assert mock_call_api.call_count == 1
+    assert mock_call_api.call_args[0][0] == "/json/vosManager/getVosByIds"
+    assert len(converted_groups) == len(test_groups)
+    assert converted_groups[7].unique_name == "vo_2:group:7"
 
 
 def test_get_sp_groups_no_input_facility():
@@ -412,10 +531,10 @@ def test_get_sp_groups_no_input_facility():
 
 @patch(
     "perun_openapi.api.facilities_manager_api.FacilitiesManagerApi"
-    ".get_assigned_resources_for_facility"
+    ".get_allowed_rich_groups_with_attributes"
 )
-def test_get_sp_groups_no_resources_found(mock_request_1):
-    perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_assigned_resources_for_facility = MagicMock(  # noqa E501
+def test_get_sp_groups_no_groups_found(mock_request_1):
+    perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_allowed_rich_groups_with_attributes = MagicMock(  # noqa E501
         return_value=[]
     )
 
@@ -423,21 +542,13 @@ def test_get_sp_groups_no_resources_found(mock_request_1):
     assert result_groups == []
 
 
-@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
-@patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
-)
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
 @patch(
     "perun_openapi.api.groups_manager_api.GroupsManagerApi.get_group_by_name"
 )
-def test_get_group_by_name(mock_request_1, mock_request_2, mock_request_3):
-    perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id = MagicMock(  # noqa E501
-        return_value=TEST_VO
-    )
-
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        return_value={"value": SAMPLE_SHORT_GROUP_NAME}
+def test_get_group_by_name(mock_request_1, mock_request_2):
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
     )
 
     perun_openapi.api.groups_manager_api.GroupsManagerApi.get_group_by_name = (
@@ -448,6 +559,18 @@ def test_get_group_by_name(mock_request_1, mock_request_2, mock_request_3):
     assert result == TEST_GROUP_INTERNAL_REPRESENTATION_1
 
 
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
+@patch("perun_openapi.api.groups_manager_api.GroupsManagerApi"
+       ".get_group_by_name")
+def test_get_group_by_name_vo_not_found(mock_request_1, mock_request_2):
+    mock_request_1.return_value = TEST_GROUP_EXTERNAL_REPRESENTATION_1
+    mock_request_2.return_value = []
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config())
+
+    assert adapter.get_group_by_name(TEST_VO, "sample name") is None
+    adapter.close()
+
+
 @patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
 @patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_short_name")
 def test_get_vo_correct_arguments(mock_request_1, mock_request_2):
@@ -550,13 +673,9 @@ def test_get_facility_by_rp_identifier_multiple_perun_attrs_found(
     "perun_openapi.api.users_manager_api.UsersManagerApi"
     ".get_groups_for_facility_where_user_is_active"
 )
-@patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
-)
-@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
 def test_get_users_groups_on_facility_multiple_groups_found(
-    mock_request_1, mock_request_2, mock_request_3
+    mock_request_1, mock_request_2
 ):
     perun_openapi.api.users_manager_api.UsersManagerApi.get_groups_for_facility_where_user_is_active = MagicMock(  # noqa E501
         return_value=[
@@ -568,12 +687,8 @@ def test_get_users_groups_on_facility_multiple_groups_found(
         ]
     )
 
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        return_value={"value": SAMPLE_SHORT_GROUP_NAME}
-    )
-
-    perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id = MagicMock(  # noqa E501
-        return_value=TEST_VO
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
     )
 
     result_groups = ADAPTER.get_users_groups_on_facility(
@@ -599,24 +714,16 @@ def test_get_users_groups_on_facility_no_input_facility():
     "perun_openapi.api.users_manager_api.UsersManagerApi"
     ".get_groups_for_facility_where_user_is_active"
 )
-@patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
-)
-@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id")
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
 def test_get_users_groups_on_facility_no_groups_found(
-    mock_request_1, mock_request_2, mock_request_3
+    mock_request_1, mock_request_2
 ):
     perun_openapi.api.users_manager_api.UsersManagerApi.get_groups_for_facility_where_user_is_active = MagicMock(  # noqa E501
         return_value=[]
     )
 
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        return_value={"value": SAMPLE_SHORT_GROUP_NAME}
-    )
-
-    perun_openapi.api.vos_manager_api.VosManagerApi.get_vo_by_id = MagicMock(  # noqa E501
-        return_value=TEST_VO
+    perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids = MagicMock(  # noqa E501
+        return_value=[TEST_VO]
     )
 
     result_groups = ADAPTER.get_users_groups_on_facility(
@@ -660,6 +767,30 @@ def test_get_facilities_by_attribute_value_correct_attribute(
     assert result_facilities == [TEST_INTERNAL_FACILITY_1]
 
 
+@patch(
+    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
+    ".get_facility_attributes_by_names"
+)
+@patch("perun_openapi.api.searcher_api.SearcherApi" ".get_facilities")
+def test_get_facilities_by_attribute_value_rp_id_attribute(
+    mock_request_1, mock_request_2
+):
+    perun_openapi.api.searcher_api.SearcherApi.get_facilities = MagicMock(  # noqa E501
+        return_value=TEST_SINGLE_PERUN_FACILITY
+    )
+
+    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_facility_attributes_by_names = MagicMock()  # noqa E501
+
+    attribute = {
+        "urn:perun:facility:attribute-def:def:OIDCClientID":
+            TEST_INTERNAL_FACILITY_1.rp_id
+    }
+    result_facilities = ADAPTER.get_facilities_by_attribute_value(attribute)
+
+    assert result_facilities == [TEST_INTERNAL_FACILITY_1]
+    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_facility_attributes_by_names.assert_not_called()  # noqa E501
+
+
 def test_get_facilities_by_attribute_value_empty_attribute(caplog):
     empty_attribute = {}
     wrong_number_of_attrs_error_text = (
@@ -1024,21 +1155,28 @@ def test_get_member_by_user_user_not_member_in_vo(mock_request_1, caplog):
         assert invalid_vo_error_msg in caplog.text
 
 
+def get_enriched_resource(resource_id: int, capabilities):
+    return {
+        "resource": {"id": resource_id},
+        "attributes": [
+            {
+                "namespace": "urn:perun:resource:attribute-def:def",
+                "friendly_name": "capabilities",
+                "value": capabilities,
+            }
+        ],
+    }
+
+
 @patch(
-    "perun_openapi.api.facilities_manager_api.FacilitiesManagerApi"
-    ".get_assigned_resources_for_facility"
+    "perun_openapi.api.resources_manager_api.ResourcesManagerApi"
+    ".get_enriched_resources_for_facility"
 )
 @patch(
     "perun_openapi.api.resources_manager_api.ResourcesManagerApi"
     ".get_assigned_groups"
 )
-@patch(
-    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
-    ".get_attribute"
-)
-def test_get_resource_capabilities(
-    mock_request_1, mock_request_2, mock_request_3
-):
+def test_get_resource_capabilities(mock_request_1, mock_request_2):
     group_without_resource = Group(-2, None, "", "", "", "")
     test_user_groups = [
         TEST_GROUP_INTERNAL_REPRESENTATION_1,
@@ -1049,21 +1187,11 @@ def test_get_resource_capabilities(
     resource_without_group = {"id": -1}
     resource_of_group_1 = {"id": test_user_groups[0].id}
     resource_of_group_2 = {"id": test_user_groups[1].id}
-    test_resource_groups = [
-        [resource_of_group_1, resource_of_group_2],
-        [resource_without_group],
-        [],
-    ]
-
-    test_facility_resources = [{"id": 5}, {"id": 6}, {"id": 7}]
-
-    perun_openapi.api.facilities_manager_api.FacilitiesManagerApi.get_assigned_resources_for_facility = MagicMock(  # noqa E501
-        return_value=test_facility_resources
-    )
-
-    perun_openapi.api.resources_manager_api.ResourcesManagerApi.get_assigned_groups = MagicMock(  # noqa E501
-        side_effect=test_resource_groups
-    )
+    test_resource_groups = {
+        5: [resource_of_group_1, resource_of_group_2],
+        6: [resource_without_group],
+        7: [],
+    }
 
     resource_capabilities_of_groups = [
         "test capability 1",
@@ -1071,14 +1199,18 @@ def test_get_resource_capabilities(
     ]
     resource_capabilities_without_group = ["test capability 3"]
     absent_capabilities = None
-    external_capabilities = [
-        {"value": resource_capabilities_of_groups},
-        {"value": resource_capabilities_without_group},
-        {"value": absent_capabilities},
+    test_enriched_resources = [
+        get_enriched_resource(5, resource_capabilities_of_groups),
+        get_enriched_resource(6, resource_capabilities_without_group),
+        get_enriched_resource(7, absent_capabilities),
     ]
 
-    perun_openapi.api.attributes_manager_api.AttributesManagerApi.get_attribute = MagicMock(  # noqa E501
-        side_effect=external_capabilities
+    perun_openapi.api.resources_manager_api.ResourcesManagerApi.get_enriched_resources_for_facility = MagicMock(  # noqa E501
+        return_value=test_enriched_resources
+    )
+
+    perun_openapi.api.resources_manager_api.ResourcesManagerApi.get_assigned_groups = MagicMock(  # noqa E501
+        side_effect=lambda resource_id: test_resource_groups[resource_id]
     )
 
     expected_capabilities = ["test capability 1", "test capability 2"]
@@ -1087,6 +1219,8 @@ def test_get_resource_capabilities(
     )
 
     assert sorted(result_capabilities) == sorted(expected_capabilities)
+    # resource without capabilities does not need its groups
+    assert perun_openapi.api.resources_manager_api.ResourcesManagerApi.get_assigned_groups.call_count == 2  # noqa E501
 
 
 def test_get_resource_capabilities_no_input_facility():
@@ -1311,3 +1445,331 @@ def test_get_attributes_multiple_attributes():
 def test_get_attributes_empty_attributes():
     result_attributes = ADAPTER._get_attributes([], {})
     assert result_attributes == {}
+
+
+def test_api_client_pool_size_from_config():
+    config = copy.deepcopy(ConfigStore.get_openapi_config())
+    config["connection_pool_maxsize"] = 7
+
+    adapter = PerunRpcAdapter(config)
+    pool_manager = adapter._api_client.rest_client.pool_manager
+
+    assert pool_manager.connection_pool_kw["maxsize"] == 7
+    adapter.close()
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".get_user_by_ext_source_name_and_ext_login"
+)
+def test_api_client_shared_across_calls(mock_request_1):
+    mock_request_1.return_value = {
+        "id": 10,
+        "title_before": None,
+        "first_name": "John",
+        "middle_name": None,
+        "last_name": "Doe",
+        "title_after": None,
+    }
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config())
+    api_client = adapter._api_client
+
+    adapter.get_perun_user("10", ["John Doe"])
+    adapter.get_perun_user("10", ["John Doe"])
+
+    assert adapter._api_client is api_client
+    adapter.close()
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".get_user_by_ext_source_name_and_ext_login"
+)
+def test_apis_not_constructed_per_call(mock_request_1):
+    mock_request_1.return_value = {
+        "id": 10,
+        "title_before": None,
+        "first_name": "John",
+        "middle_name": None,
+        "last_name": "Doe",
+        "title_after": None,
+    }
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config())
+
+    with patch("adapters.PerunRpcAdapter.UsersManagerApi") as api_class:
+        adapter.get_perun_user("10", ["John Doe"])
+        adapter.get_perun_user("10", ["John Doe"])
+
+    api_class.assert_not_called()
+    assert mock_request_1.call_count == 2
+    adapter.close()
+
+
+@patch("perun_openapi.api.vos_manager_api.VosManagerApi.get_vos_by_ids")
+def test_get_vos_by_ids_fetches_only_uncached(mock_request):
+    vo_cache = VoCache({})
+    vo_cache.put(TEST_VO)
+    vo_cache.put_missing(vo_id=3)
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config(), vo_cache)
+    mock_request.return_value = [VO(2, "Second VO", "second")]
+
+    vos = adapter._get_vos_by_ids({TEST_VO.id, 2, 3, 4})
+
+    mock_request.assert_called_once_with([2, 4])
+    assert vos == {TEST_VO.id: TEST_VO, 2: VO(2, "Second VO", "second")}
+    assert vo_cache.get(vo_id=4) == (True, None)
+    assert adapter.get_vo(short_name="second") == VO(2, "Second VO",
+                                                     "second")
+
+
+def test_facility_index_invalidated_by_rp_id_changes_only():
+    adapter = PerunRpcAdapter(ConfigStore.get_openapi_config())
+    adapter._facility_index = MagicMock()
+    consumer = MagicMock()
+    adapter.register_cache_invalidation(consumer)
+    listener = consumer.add_listener.call_args.args[1]
+    rp_id_attr = adapter._ATTRIBUTE_UTILS.get_rpc_attr_name(
+        adapter._RP_ID_ATTR
+    )
+    namespace, friendly_name = rp_id_attr.rsplit(":", 1)
+
+    listener("AttributeSetForFacility", {
+        "facility": {"id": 1},
+        "attribute": {"namespace": namespace, "friendly_name": "other"},
+    })
+    adapter._facility_index.invalidate.assert_not_called()
+
+    listener("AttributeSetForFacility", {
+        "facility": {"id": 1},
+        "attribute": {"namespace": namespace,
+                      "friendly_name": friendly_name},
+    })
+    adapter._facility_index.invalidate.assert_called_once_with(1)
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".update_user_ext_source_last_access"
+)
+def test_update_user_ext_source_last_access_written_behind(mock_request):
+    config = {**ConfigStore.get_openapi_config(),
+              "last_access_write_behind": {"enabled": True,
+                                           "flush_interval_s": 60}}
+    adapter = PerunRpcAdapter(config)
+
+    for _ in range(3):
+        adapter.update_user_ext_source_last_access(5)
+    adapter.update_user_ext_source_last_access(6)
+    mock_request.assert_not_called()
+
+    adapter.close()
+
+    assert sorted(call.args for call in mock_request.call_args_list) == [
+        (5,), (6,)
+    ]
+    assert adapter.get_last_access_write_behind_stats()["merged"] == 2
+
+
+@patch("adapters.PerunRpcAdapter.InputSetUserExtSourceAttributes")
+@patch(
+    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
+    ".set_user_ext_source_attributes"
+)
+def test_set_user_ext_source_attributes_sends_changed_only(mock_request,
+                                                           mock_input):
+    config = {**ConfigStore.get_openapi_config(),
+              "ues_attributes_write_suppression": {"enabled": True}}
+    adapter = PerunRpcAdapter(config)
+    namespace = "urn:perun:ues:attribute-def:def"
+    mail = {"namespace": namespace, "friendly_name": "mail",
+            "value": "john@example.org"}
+    affiliation = {"namespace": namespace, "friendly_name": "affiliation",
+                   "value": ["member@example.org"]}
+
+    adapter.set_user_ext_source_attributes(5, [mail, affiliation])
+    adapter.set_user_ext_source_attributes(5, [mail, affiliation])
+    changed_affiliation = {**affiliation, "value": ["staff@example.org"]}
+    adapter.set_user_ext_source_attributes(5, [mail, changed_affiliation])
+
+    assert mock_request.call_count == 2
+    sent_attributes = [call.args[1] for call in mock_input.call_args_list]
+    assert sent_attributes == [[mail, affiliation], [changed_affiliation]]
+    assert adapter.get_ues_attributes_write_stats() == {
+        "writes": 2, "skipped_writes": 1, "written_attributes": 3,
+        "skipped_attributes": 3, "size": 2
+    }
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".update_user_ext_source_last_access"
+)
+def test_journaled_write_retried_until_perun_available(mock_request,
+                                                       tmp_path):
+    config = {**ConfigStore.get_openapi_config(),
+              "write_journal": {"enabled": True,
+                                "directory": str(tmp_path),
+                                "initial_backoff_s": 0.01}}
+    mock_request.side_effect = [ApiException(status=503), None]
+    adapter = PerunRpcAdapter(config)
+
+    adapter.update_user_ext_source_last_access(5)
+
+    deadline = time.monotonic() + 5
+    while adapter.get_write_journal_stats()["pending"] > 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    adapter.close()
+
+    assert [call.args for call in mock_request.call_args_list] == [
+        (5,), (5,)
+    ]
+    assert adapter.get_write_journal_stats()["retries"] == 1
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".update_user_ext_source_last_access"
+)
+def test_throttled_journaled_write_retried(mock_request, tmp_path):
+    config = {**ConfigStore.get_openapi_config(),
+              "write_journal": {"enabled": True,
+                                "directory": str(tmp_path),
+                                "initial_backoff_s": 0.01}}
+    mock_request.side_effect = [ApiException(status=429),
+                                ApiException(status=408),
+                                ApiException(status=0), None]
+    adapter = PerunRpcAdapter(config)
+
+    adapter.update_user_ext_source_last_access(5)
+
+    deadline = time.monotonic() + 5
+    while adapter.get_write_journal_stats()["pending"] > 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    adapter.close()
+
+    assert mock_request.call_count == 4
+    assert adapter.get_write_journal_stats()["retries"] == 3
+
+
+def test_raw_responses_decoded_into_records():
+    config = {**ConfigStore.get_openapi_config(), "raw_responses": True}
+    adapter = PerunRpcAdapter(config)
+    responses = {
+        "/getGroupsWhereUserIsActive/facility":
+            b'[{"id": 1, "beanName": "Group", "voId": 62, '
+            b'"name": "sample:group:name", "shortName": "name", '
+            b'"description": "This is a sample group", '
+            b'"uuid": "sample-uuid-value", "parentGroupId": null}]',
+        "/getVosByIds":
+            b'[{"id": 62, "beanName": "Vo", '
+            b'"name": "CESNET e-infrastruktura", "shortName": "einfra"}]',
+    }
+
+    def request(method, url, **kwargs):
+        assert kwargs["preload_content"] is False
+        body = next(body for path, body in responses.items() if path in url)
+        return urllib3.HTTPResponse(body=io.BytesIO(body), status=200,
+                                    preload_content=False)
+
+    adapter._api_client.rest_client.pool_manager.request = request
+
+    result_groups = adapter.get_users_groups_on_facility(
+        TEST_INTERNAL_FACILITY_1, TEST_USER
+    )
+    adapter.close()
+
+    assert result_groups == [TEST_GROUP_INTERNAL_REPRESENTATION_1]
+
+
+def test_facilities_loaded_from_raw_responses():
+    config = {**ConfigStore.get_openapi_config(), "raw_responses": True}
+    adapter = PerunRpcAdapter(config)
+
+    def request(method, url, **kwargs):
+        assert kwargs["preload_content"] is False
+        assert "/getFacilities" in url
+        body = (b'[{"id": 1, "beanName": "Facility", "name": "facility", '
+                b'"description": "this is a testing facility"}]')
+        return urllib3.HTTPResponse(body=io.BytesIO(body), status=200,
+                                    preload_content=False)
+
+    adapter._api_client.rest_client.pool_manager.request = request
+
+    with patch.object(adapter, "_get_rp_id",
+                      return_value=TEST_RP_IDENTIFIER_1):
+        result_facilities = adapter._load_facilities()
+    adapter.close()
+
+    assert result_facilities == [
+        Facility(1, "facility", "this is a testing facility",
+                 TEST_RP_IDENTIFIER_1)
+    ]
+
+
+@patch(
+    "perun_openapi.api.users_manager_api.UsersManagerApi"
+    ".update_user_ext_source_last_access"
+)
+def test_invalid_journaled_write_dropped(mock_request, tmp_path):
+    config = {**ConfigStore.get_openapi_config(),
+              "write_journal": {"enabled": True,
+                                "directory": str(tmp_path),
+                                "initial_backoff_s": 0.01}}
+    adapter = PerunRpcAdapter(config)
+
+    with pytest.raises(ApiValueError):
+        adapter.set_user_ext_source_attributes(5, [{"foo": 1}])
+    adapter._write_journal.append({
+        "method": "set_user_ext_source_attributes",
+        "user_ext_source": 5,
+        "attributes": [{"foo": 1}],
+    })
+    adapter._write_journal.append({"user_ext_source": 5})
+    adapter.update_user_ext_source_last_access(6)
+
+    deadline = time.monotonic() + 5
+    while adapter.get_write_journal_stats()["pending"] > 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    adapter.close()
+
+    mock_request.assert_called_once_with(6)
+    assert adapter.get_write_journal_stats() == {
+        "appended": 3, "replayed": 3, "retries": 0, "pending": 0
+    }
+
+
+@patch(
+    "perun_openapi.api.attributes_manager_api.AttributesManagerApi"
+    ".set_user_ext_source_attributes"
+)
+def test_journaled_attributes_fingerprinted_once_accepted(mock_request,
+                                                          tmp_path):
+    config = {**ConfigStore.get_openapi_config(),
+              "ues_attributes_write_suppression": {"enabled": True},
+              "write_journal": {"enabled": True,
+                                "directory": str(tmp_path)}}
+    mock_request.side_effect = [ApiException(status=400), None]
+    adapter = PerunRpcAdapter(config)
+    mail = {"id": 1, "bean_name": "Attribute",
+            "namespace": "urn:perun:ues:attribute-def:def",
+            "friendly_name": "mail", "value": "john@example.org"}
+
+    def wait_for_replay():
+        deadline = time.monotonic() + 5
+        while adapter.get_write_journal_stats()["pending"] > 0:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    # refused by Perun, so the same value is written again
+    adapter.set_user_ext_source_attributes(5, [mail])
+    wait_for_replay()
+    adapter.set_user_ext_source_attributes(5, [mail])
+    wait_for_replay()
+    adapter.set_user_ext_source_attributes(5, [mail])
+    adapter.close()
+
+    assert mock_request.call_count == 2
+    assert adapter.get_ues_attributes_write_stats()["skipped_writes"] == 1
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from models.User import User
+from utils.SingleFlight import SingleFlight
+
+
+def run_concurrently(single_flight: SingleFlight, function, args_list):
+    started = threading.Event()
+    released = threading.Event()
+    results = []
+
+    def blocking_function(*args):
+        started.set()
+        released.wait(5)
+        return function(*args)
+
+    def call(args):
+        try:
+            results.append(
+                single_flight.execute("get_user", blocking_function, *args)
+            )
+        except Exception as ex:
+            results.append(ex)
+
+    threads = [threading.Thread(target=call, args=(args,))
+               for args in args_list]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    while single_flight.get_stats()["get_user"]["calls"] < len(args_list):
+        time.sleep(0.01)
+    released.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_equal_models_share_execution():
+    single_flight = SingleFlight(["get_user"])
+    calls = []
+
+    def get_user(user, attr_names):
+        calls.append(user)
+        return user.name
+
+    results = run_concurrently(single_flight, get_user, [
+        (User(1, "John Doe"), ["mail"]),
+        (User(1, "John Doe"), ["mail"]),
+        (User(2, "Jane Doe"), ["mail"]),
+    ])
+
+    assert len(calls) == 2
+    assert sorted(results) == ["Jane Doe", "John Doe", "John Doe"]
+    assert single_flight.get_stats() == {
+        "get_user": {"calls": 3, "collapsed": 1}
+    }
+
+
+def test_exception_shared_by_waiting_calls():
+    single_flight = SingleFlight(["get_user"])
+
+    def get_user(user_id):
+        raise ValueError("Perun unavailable")
+
+    results = run_concurrently(single_flight, get_user, [(1,), (1,)])
+
+    assert all(isinstance(result, ValueError) for result in results)
+    with pytest.raises(ValueError):
+        single_flight.execute("get_user", get_user, 1)
@@ -0,0 +1,60 @@
+from unittest.mock import MagicMock, patch
+
+from models.VO import VO
+from utils.VoCache import VoCache
+
+TEST_VO = VO(1, "Virtual Organization", "vo1")
+
+
+def test_vo_cached_by_id_and_short_name():
+    cache = VoCache({})
+    load = MagicMock(return_value=TEST_VO)
+
+    assert cache.get_or_load(load, vo_id=1) == TEST_VO
+    assert cache.get_or_load(load, vo_id=1) == TEST_VO
+    assert cache.get_or_load(load, short_name="vo1") == TEST_VO
+
+    load.assert_called_once()
+    assert cache.get_stats() == {"hits": 2, "negative_hits": 0,
+                                 "misses": 1, "evictions": 0, "size": 2}
+
+
+def test_missing_vo_cached_for_negative_ttl():
+    cache = VoCache({"ttl_s": 300, "negative_ttl_s": 60})
+    load = MagicMock(return_value=None)
+
+    with patch("utils.VoCache.time.monotonic", return_value=1000):
+        assert cache.get_or_load(load, short_name="unknown") is None
+        assert cache.get_or_load(load, short_name="unknown") is None
+    assert load.call_count == 1
+    assert cache.get_stats()["negative_hits"] == 1
+
+    with patch("utils.VoCache.time.monotonic", return_value=1061):
+        assert cache.get_or_load(load, short_name="unknown") is None
+    assert load.call_count == 2
+
+
+def test_least_recently_used_vo_evicted():
+    cache = VoCache({"max_size": 2})
+    cache.put(VO(1, "First", None))
+    cache.put(VO(2, "Second", None))
+    cache.get(vo_id=1)
+    cache.put(VO(3, "Third", None))
+
+    vos, missing_ids = cache.get_many([1, 2, 3])
+
+    assert sorted(vos) == [1, 3]
+    assert missing_ids == {2}
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_invalidated_vo_dropped_under_both_keys():
+    cache = VoCache({})
+    cache.put(TEST_VO)
+    cache.put_missing(short_name="renamed")
+
+    cache.invalidate(vo_id=TEST_VO.id, short_name="renamed")
+
+    assert cache.get(vo_id=TEST_VO.id) == (False, None)
+    assert cache.get(short_name=TEST_VO.short_name) == (False, None)
+    assert cache.get(short_name="renamed") == (False, None)
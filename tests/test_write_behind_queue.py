@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock
+
+from utils.WriteBehindQueue import WriteBehindQueue
+
+
+def test_writes_of_same_key_merged():
+    write = MagicMock()
+    queue = WriteBehindQueue("test", write, {})
+
+    assert queue.put(1, "first")
+    assert queue.put(1, "second")
+    assert queue.put(2, "third")
+    queue.flush()
+
+    assert sorted(call.args for call in write.call_args_list) == [
+        (1, "second"), (2, "third")
+    ]
+    assert queue.get_stats() == {"queued": 2, "merged": 1, "rejected": 0,
+                                 "written": 2, "failed": 0, "pending": 0}
+
+
+def test_write_rejected_when_queue_full():
+    queue = WriteBehindQueue("test", MagicMock(), {"max_pending": 1})
+
+    assert queue.put(1, "first")
+    assert queue.put(1, "merged")
+    assert not queue.put(2, "rejected")
+
+
+def test_pending_writes_flushed_on_stop():
+    write = MagicMock(side_effect=[Exception("Perun unavailable"), None])
+    queue = WriteBehindQueue("test", write,
+                             {"flush_interval_s": 60, "batch_size": 1,
+                              "max_parallel_writes": 1})
+    queue.start()
+
+    queue.put(1, "first")
+    queue.put(2, "second")
+    queue.stop()
+
+    assert write.call_count == 2
+    assert queue.get_stats()["written"] == 1
+    assert queue.get_stats()["failed"] == 1
@@ -0,0 +1,180 @@
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+from utils.WriteJournal import WriteJournal
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def create_journal(directory, replay, **config) -> WriteJournal:
+    return WriteJournal("test", replay, {"directory": str(directory),
+                                         "initial_backoff_s": 0.01,
+                                         **config})
+
+
+def start_process(script: str) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-c", textwrap.dedent(script)],
+                            cwd=REPOSITORY_DIR, stdout=subprocess.PIPE,
+                            text=True)
+
+
+def read_replayed(path) -> list[int]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [int(line) for line in f.read().split()]
+
+
+def test_records_replayed_in_order_with_retries(tmp_path):
+    replayed = []
+    failures = [Exception("Perun unavailable")] * 2
+
+    def replay(record):
+        if record["index"] == 2 and failures:
+            raise failures.pop()
+        replayed.append(record["index"])
+
+    journal = create_journal(tmp_path, replay, segment_size_bytes=64)
+    journal.start()
+    for index in range(1, 6):
+        journal.append({"index": index})
+    wait_until(lambda: journal.get_stats()["pending"] == 0)
+    journal.stop()
+
+    assert replayed == [1, 2, 3, 4, 5]
+    assert journal.get_stats() == {"appended": 5, "replayed": 5,
+                                   "retries": 2, "pending": 0}
+    # replayed segments are removed, the one appended to is kept
+    assert len([name for name in os.listdir(tmp_path)
+                if name.endswith(".log")]) == 1
+
+
+def test_concurrent_appends_acknowledged(tmp_path):
+    journal = create_journal(tmp_path, lambda record: None)
+    threads = [
+        threading.Thread(target=lambda: [journal.append({"index": index})
+                                         for index in range(50)])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    journal.stop()
+
+    replayed = []
+    reopened_journal = create_journal(tmp_path, replayed.append)
+    reopened_journal.start()
+    wait_until(lambda: len(replayed) == 200)
+    reopened_journal.stop()
+
+
+def test_incomplete_record_cut_off_after_crash(tmp_path):
+    journal = create_journal(tmp_path, lambda record: None)
+    journal.append({"index": 1})
+    journal.stop()
+    [segment] = [name for name in os.listdir(tmp_path)
+                 if name.endswith(".log")]
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b'2 0badc0de {"index"')
+
+    replayed = []
+    reopened_journal = create_journal(tmp_path, replayed.append)
+    assert reopened_journal.append({"index": 2}) == 2
+    reopened_journal.start()
+    wait_until(lambda: len(replayed) == 2)
+    reopened_journal.stop()
+
+    assert replayed == [{"index": 1}, {"index": 2}]
+
+
+def test_acknowledged_records_survive_kill_during_appends(tmp_path):
+    process = start_process(f"""
+        from utils.WriteJournal import WriteJournal
+        journal = WriteJournal("test", None, {{
+            "directory": {str(tmp_path)!r}, "segment_size_bytes": 512
+        }})
+        index = 0
+        while True:
+            index += 1
+            journal.append({{"index": index}})
+            print(index, flush=True)
+    """)
+    acknowledged = 0
+    while acknowledged < 200:
+        acknowledged = int(process.stdout.readline())
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+
+    replayed = []
+    journal = create_journal(tmp_path, lambda record: replayed.append(
+        record["index"]
+    ))
+    journal.start()
+    wait_until(lambda: journal.get_stats()["pending"] == 0)
+    journal.stop()
+
+    assert replayed[:acknowledged] == list(range(1, acknowledged + 1))
+    assert replayed == list(range(1, len(replayed) + 1))
+
+
+def test_replay_continues_after_kill_during_replay(tmp_path):
+    journal_dir = tmp_path / "journal"
+    replayed_path = tmp_path / "replayed"
+    journal = create_journal(journal_dir, None, segment_size_bytes=256)
+    for index in range(1, 51):
+        journal.append({"index": index})
+    journal.stop()
+
+    process = start_process(f"""
+        import os
+        import threading
+        import time
+        from utils.WriteJournal import WriteJournal
+
+        def replay(record):
+            with open({str(replayed_path)!r}, "a") as f:
+                f.write(str(record["index"]) + " ")
+                f.flush()
+                os.fsync(f.fileno())
+            time.sleep(0.01)
+
+        WriteJournal("test", replay, {{
+            "directory": {str(journal_dir)!r}, "segment_size_bytes": 256
+        }}).start()
+        threading.Event().wait()
+    """)
+    wait_until(lambda: len(read_replayed(replayed_path)) >= 10)
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+    replayed_before_kill = read_replayed(replayed_path)
+
+    replayed_after_restart = []
+    journal = create_journal(journal_dir, lambda record: (
+        replayed_after_restart.append(record["index"])
+    ), segment_size_bytes=256)
+    journal.start()
+    wait_until(lambda: journal.get_stats()["pending"] == 0)
+    journal.stop()
+
+    assert replayed_before_kill == list(
+        range(1, len(replayed_before_kill) + 1)
+    )
+    # the record replayed at the time of the kill may be replayed again
+    assert replayed_after_restart[0] in (replayed_before_kill[-1],
+                                         replayed_before_kill[-1] + 1)
+    assert replayed_after_restart == list(
+        range(replayed_after_restart[0], 51)
+    )
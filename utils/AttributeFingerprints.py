@@ -0,0 +1,83 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List
+
+
+class AttributeFingerprints:
+    """Remembers a hash of the last written value of attributes of an
+    entity, so that writes of unchanged values can be left out. Values are
+    written again once they are older than the refresh interval, in case
+    they were changed in Perun in the meantime."""
+
+    def __init__(self, config: dict):
+        self._refresh_interval = float(config.get("refresh_interval_s", 3600))
+        self._max_entries = int(config.get("max_entries", 100000))
+
+        self._lock = threading.Lock()
+        # (entity id, attribute name) -> (hash of value, written at)
+        self._fingerprints = OrderedDict()
+        self._stats = {"writes": 0, "skipped_writes": 0,
+                       "written_attributes": 0, "skipped_attributes": 0}
+
+    @staticmethod
+    def _get_name(attribute) -> str:
+        return f'{attribute["namespace"]}:{attribute["friendly_name"]}'
+
+    @staticmethod
+    def _get_fingerprint(attribute) -> bytes:
+        value = json.dumps(attribute.get("value"), sort_keys=True,
+                           default=str)
+        return hashlib.blake2b(value.encode(), digest_size=16).digest()
+
+    def get_changed(self, entity_id: Hashable, attributes: List) -> List:
+        """Get attributes whose value differs from the last written one,
+        or which were not written within the refresh interval"""
+        now = time.monotonic()
+        changed_attributes = []
+        with self._lock:
+            for attribute in attributes:
+                fingerprint = self._fingerprints.get(
+                    (entity_id, self._get_name(attribute))
+                )
+                if (
+                    fingerprint is None
+                    or fingerprint[0] != self._get_fingerprint(attribute)
+                    or now - fingerprint[1] >= self._refresh_interval
+                ):
+                    changed_attributes.append(attribute)
+
+            skipped_attributes = len(attributes) - len(changed_attributes)
+            self._stats["skipped_attributes"] += skipped_attributes
+            self._stats["written_attributes"] += len(changed_attributes)
+            self._stats[
+                "writes" if changed_attributes else "skipped_writes"
+            ] += 1
+        return changed_attributes
+
+    def record_written(self, entity_id: Hashable, attributes: List) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for attribute in attributes:
+                key = (entity_id, self._get_name(attribute))
+                self._fingerprints[key] = (
+                    self._get_fingerprint(attribute), now
+                )
+                self._fingerprints.move_to_end(key)
+            while len(self._fingerprints) > self._max_entries:
+                self._fingerprints.popitem(last=False)
+
+    def invalidate(self, entity_id: Hashable, attributes: List) -> None:
+        """Forgets the last written values, so that the attributes are
+        written again even if unchanged"""
+        with self._lock:
+            for attribute in attributes:
+                self._fingerprints.pop(
+                    (entity_id, self._get_name(attribute)), None
+                )
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats, "size": len(self._fingerprints)}
@@ -0,0 +1,180 @@
+import os
+import threading
+from typing import Callable, Optional
+
+from perun_openapi import ApiException
+from perun_openapi.api.audit_messages_manager_api import (
+    AuditMessagesManagerApi,
+)
+from utils.Logger import Logger
+
+
+class AuditLogConsumer:
+    """Polls the Perun auditer and notifies listeners about changed entities,
+    so that caches in front of Perun drop exactly the changed entries. The id
+    of the last processed message is stored in a file, so that after a
+    restart the consumer continues where it stopped."""
+
+    ENTITY_TYPES = ("vo", "facility", "resource", "group", "member", "user",
+                    "attribute")
+
+    # name of an audit event -> types of the entities it changes, each of
+    # them is in the event under the name of its type
+    EVENT_ENTITY_TYPES = {
+        "VoCreated": ("vo",),
+        "VoUpdated": ("vo",),
+        "VoDeleted": ("vo",),
+        "FacilityCreated": ("facility",),
+        "FacilityUpdated": ("facility",),
+        "FacilityDeleted": ("facility",),
+        "ResourceCreated": ("resource",),
+        "ResourceUpdated": ("resource",),
+        "ResourceDeleted": ("resource",),
+        "GroupAssignedToResource": ("resource", "group"),
+        "GroupRemovedFromResource": ("resource", "group"),
+        "GroupCreatedInVo": ("group",),
+        "GroupCreatedAsSubgroup": ("group",),
+        "GroupUpdated": ("group",),
+        "GroupMoved": ("group",),
+        "GroupDeleted": ("group",),
+        "DirectMemberAddedToGroup": ("member", "group"),
+        "IndirectMemberAddedToGroup": ("member", "group"),
+        "DirectMemberRemovedFromGroup": ("member", "group"),
+        "IndirectMemberRemovedFromGroup": ("member", "group"),
+        "MemberRemovedFromGroupTotally": ("member", "group"),
+        "MemberCreated": ("member",),
+        "MemberValidated": ("member",),
+        "MemberSuspended": ("member",),
+        "MemberExpired": ("member",),
+        "MemberDisabled": ("member",),
+        "MemberInvalidated": ("member",),
+        "MemberDeleted": ("member",),
+        "UserCreated": ("user",),
+        "UserUpdated": ("user",),
+        "UserDeleted": ("user",),
+        "UserExtSourceAddedToUser": ("user",),
+        "UserExtSourceRemovedFromUser": ("user",),
+        **{
+            event_name + type_name: ("attribute", entity_type)
+            for event_name in ("AttributeSetFor", "AttributeRemovedFor",
+                               "AllAttributesRemovedFor")
+            for entity_type, type_name in (
+                ("vo", "Vo"), ("facility", "Facility"),
+                ("resource", "Resource"), ("group", "Group"),
+                ("member", "Member"), ("user", "User"),
+            )
+        },
+    }
+
+    def __init__(self, api_instance: AuditMessagesManagerApi, config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._api_instance = api_instance
+        self._consumer_name = config.get("consumer_name",
+                                         "perun_connection_manager")
+        self._poll_interval = float(config.get("poll_interval_s", 5))
+        self._state_file = config.get("state_file")
+
+        self._listeners = {entity_type: [] for entity_type in self.ENTITY_TYPES}
+        self._last_processed_id = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def add_listener(self, entity_type: str,
+                     listener: Callable[[str, dict], None]) -> None:
+        """Calls the listener with the name and the event of each audit
+        message which changes an entity of the given type"""
+        self._listeners[entity_type].append(listener)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=self.__class__.__name__)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        registered = False
+        while not self._stop_event.is_set():
+            try:
+                if not registered:
+                    self.register()
+                    registered = True
+                self.poll()
+            except Exception as ex:
+                self._logger.warning(f"audit_log_consumer - Unable to read "
+                                     f"the Perun audit log: {ex}")
+            if self._stop_event.wait(self._poll_interval):
+                return
+
+    def register(self) -> None:
+        """Creates the auditer consumer in Perun and moves it to the last
+        message processed before the restart"""
+        try:
+            self._api_instance.create_auditer_consumer(self._consumer_name)
+        except ApiException as ex:
+            # the consumer is kept by Perun from the previous run
+            self._logger.debug(f"audit_log_consumer.register - Consumer "
+                               f"{self._consumer_name} not created: {ex}")
+
+        self._last_processed_id = self._load_last_processed_id()
+        if self._last_processed_id is not None:
+            self._api_instance.set_last_processed_id(
+                self._consumer_name, self._last_processed_id
+            )
+
+    def poll(self) -> None:
+        messages = self._api_instance.poll_consumer_messages(
+            self._consumer_name
+        )
+        if not messages:
+            return
+
+        for message in messages:
+            self._process(message)
+            if (
+                self._last_processed_id is None
+                or message["id"] > self._last_processed_id
+            ):
+                self._last_processed_id = message["id"]
+        self._save_last_processed_id()
+        self._logger.debug(f"audit_log_consumer.poll - Processed "
+                           f"{len(messages)} messages up to id "
+                           f"{self._last_processed_id}")
+
+    def _process(self, message) -> None:
+        event = message.get("event")
+        if event is None:
+            return
+
+        # names are qualified by the package of the event class in Perun
+        event_name = (event.get("name") or "").rsplit(".", 1)[-1]
+        for entity_type in self.EVENT_ENTITY_TYPES.get(event_name, ()):
+            if event.get(entity_type) is None:
+                continue
+            for listener in self._listeners[entity_type]:
+                try:
+                    listener(event_name, event)
+                except Exception as ex:
+                    self._logger.warning(
+                        f"audit_log_consumer - Processing of {event_name} "
+                        f"message with id {message['id']} failed: {ex}"
+                    )
+
+    def _load_last_processed_id(self) -> Optional[int]:
+        if not self._state_file or not os.path.exists(self._state_file):
+            return None
+        with open(self._state_file, "r") as f:
+            content = f.read().strip()
+        return int(content) if content else None
+
+    def _save_last_processed_id(self) -> None:
+        if not self._state_file:
+            return
+        # replace the file at once, so that a crash can't leave it empty
+        temp_file = self._state_file + ".tmp"
+        with open(temp_file, "w") as f:
+            f.write(str(self._last_processed_id))
+        os.replace(temp_file, self._state_file)
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+
+from utils.Logger import Logger
+
+
+class CircuitBreaker:
+    """Stops calls to an adapter which keeps failing or answering slowly,
+    until a probe call succeeds again"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self.name = name
+        self._failure_rate_threshold = float(
+            config.get("failure_rate_threshold", 0.5)
+        )
+        self._slow_call_threshold = (
+            float(config.get("slow_call_threshold_ms", 2000)) / 1000
+        )
+        self._min_calls = int(config.get("min_calls", 10))
+        self._open_timeout = float(config.get("open_timeout_s", 30))
+        self._probe_timeout = float(config.get("probe_timeout_s", 10))
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = None
+        self._probe_started_at = None
+        self._outcomes = deque(maxlen=int(config.get("window_size", 20)))
+        self._rejected_calls = 0
+        self._transitions = deque(
+            maxlen=int(config.get("transitions_history_size", 20))
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allows_calls(self) -> bool:
+        """Whether calls may be executed on the adapter, counts them as
+        rejected otherwise"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            self._rejected_calls += 1
+            return False
+
+    def try_acquire_probe(self) -> bool:
+        """Switches the open breaker to half-open once its timeout elapses,
+        the caller which gets True is responsible for executing the probe.
+        Another probe is let through when the result of the previous one
+        is not recorded within the probe timeout."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                if now - self._probe_started_at < self._probe_timeout:
+                    return False
+                self._logger.warning(
+                    f'Probe of circuit breaker of {self.name} did not '
+                    f'finish in time, letting another probe through'
+                )
+            elif (
+                self._state != self.OPEN
+                or now - self._opened_at < self._open_timeout
+            ):
+                return False
+            else:
+                self._transition(self.HALF_OPEN)
+            self._probe_started_at = now
+            return True
+
+    def record_success(self, latency: float) -> None:
+        self._record_outcome(latency <= self._slow_call_threshold)
+
+    def record_failure(self) -> None:
+        self._record_outcome(False)
+
+    def _record_outcome(self, is_success: bool) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.CLOSED if is_success else self.OPEN)
+                return
+            if self._state == self.OPEN:
+                return
+
+            self._outcomes.append(is_success)
+            if len(self._outcomes) < self._min_calls:
+                return
+            failure_rate = self._outcomes.count(False) / len(self._outcomes)
+            if failure_rate >= self._failure_rate_threshold:
+                self._transition(self.OPEN)
+
+    def _transition(self, new_state: str) -> None:
+        self._logger.warning(
+            f'Circuit breaker of {self.name} changed state from '
+            f'"{self._state}" to "{new_state}"'
+        )
+        self._transitions.append(
+            {"time": time.time(), "from": self._state, "to": new_state}
+        )
+        self._state = new_state
+        self._outcomes.clear()
+        if new_state == self.OPEN:
+            self._opened_at = time.monotonic()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "rejected_calls": self._rejected_calls,
+                "transitions": list(self._transitions),
+            }
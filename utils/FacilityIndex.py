@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from models.Facility import Facility
+from utils.Logger import Logger
+
+
+class FacilityIndex:
+    """Facilities indexed by their rpID. All facilities are loaded at once
+    and reloaded in the background. rpIDs which are not indexed are looked
+    up by the adapter and the result is remembered: facilities created since
+    the last reload are added to the index, unknown rpIDs go to a bounded
+    negative cache, so that they don't reach the backend on every request."""
+
+    def __init__(self, name: str,
+                 load_facilities: Callable[[], Iterable[Facility]],
+                 config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._name = name
+        self._load_facilities = load_facilities
+        self._refresh_interval = float(config.get("refresh_interval_s", 300))
+        self._negative_ttl = float(config.get("negative_ttl_s", 60))
+        self._negative_cache_size = int(
+            config.get("negative_cache_size", 10000)
+        )
+
+        self._lock = threading.Lock()
+        # rpID -> Facility, or None for rpIDs shared by more facilities
+        self._facilities = None
+        # rpID -> expires_at
+        self._missing_rp_ids = OrderedDict()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        """Loads the index and keeps reloading it in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, daemon=True,
+            name=f"{self.__class__.__name__}-{self._name}"
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def is_loaded(self) -> bool:
+        return self._facilities is not None
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.reload()
+            except Exception as ex:
+                self._logger.warning(f"facility_index - Unable to load "
+                                     f"facilities of {self._name}: {ex}")
+            if self._stop_event.wait(self._refresh_interval):
+                return
+
+    def reload(self) -> None:
+        facilities = {}
+        for facility in self._load_facilities():
+            if not facility.rp_id:
+                continue
+            if facility.rp_id in facilities:
+                self._logger.warning(f"There is more than one facility with "
+                                     f"rpID '{facility.rp_id}'.")
+                facilities[facility.rp_id] = None
+            else:
+                facilities[facility.rp_id] = facility
+
+        with self._lock:
+            self._facilities = facilities
+        self._logger.debug(f"facility_index.reload - Loaded "
+                           f"{len(facilities)} rpIDs of {self._name}")
+
+    def get(self, rp_id: str) -> tuple[bool, Optional[Facility]]:
+        """Get (True, Facility) for an indexed rpID, (True, None) for an rpID
+        known not to identify a single facility and (False, None) when the
+        rpID has to be looked up"""
+        with self._lock:
+            if self._facilities is not None and rp_id in self._facilities:
+                facility = self._facilities[rp_id]
+                self._stats[
+                    "hits" if facility is not None else "negative_hits"
+                ] += 1
+                return True, facility
+
+            expires_at = self._missing_rp_ids.get(rp_id)
+            if expires_at is not None and expires_at > time.monotonic():
+                self._stats["negative_hits"] += 1
+                return True, None
+            if expires_at is not None:
+                del self._missing_rp_ids[rp_id]
+
+            self._stats["misses"] += 1
+            return False, None
+
+    def put(self, rp_id: str, facility: Optional[Facility]) -> None:
+        """Remembers the result of looking up the rpID by the adapter"""
+        with self._lock:
+            if facility is not None:
+                if self._facilities is not None:
+                    self._facilities[rp_id] = facility
+                return
+
+            self._missing_rp_ids[rp_id] = (
+                time.monotonic() + self._negative_ttl
+            )
+            self._missing_rp_ids.move_to_end(rp_id)
+            while len(self._missing_rp_ids) > self._negative_cache_size:
+                self._missing_rp_ids.popitem(last=False)
+
+    def invalidate(self, facility_id) -> None:
+        """Drops rpIDs of the changed facility. Its new rpID may be cached
+        as unknown, so the negative cache is dropped too."""
+        with self._lock:
+            if self._facilities is not None:
+                for rp_id, facility in list(self._facilities.items()):
+                    if facility is not None and \
+                            str(facility.id) == str(facility_id):
+                        del self._facilities[rp_id]
+            self._missing_rp_ids.clear()
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                **self._stats,
+                "size": len(self._facilities or ()),
+                "negative_cache_size": len(self._missing_rp_ids),
+            }
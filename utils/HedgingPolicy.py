@@ -0,0 +1,71 @@
+import math
+import threading
+from collections import deque
+
+
+class HedgingPolicy:
+    """Decides when a call of a method is hedged, i.e. started also on the
+    next adapter, and keeps statistics of the hedges"""
+
+    def __init__(self, config: dict):
+        self.methods = frozenset(config.get("methods") or [])
+        self._percentile = float(config.get("latency_percentile", 95))
+        self._initial_delay = float(config.get("initial_delay_ms", 100)) / 1000
+        self._min_delay = float(config.get("min_delay_ms", 10)) / 1000
+        self._min_samples = int(config.get("min_samples", 20))
+        self._window_size = int(config.get("window_size", 200))
+        self._max_hedge_ratio = float(config.get("max_hedge_ratio", 0.1))
+
+        self._lock = threading.Lock()
+        self._latencies = {
+            method_name: deque(maxlen=self._window_size)
+            for method_name in self.methods
+        }
+        self._stats = {
+            method_name: {"calls": 0, "fired": 0, "won": 0}
+            for method_name in self.methods
+        }
+
+    def is_hedged(self, method_name: str) -> bool:
+        return method_name in self.methods
+
+    def record_latency(self, method_name: str, latency: float) -> None:
+        """Remembers how long the primary adapter took to answer"""
+        with self._lock:
+            self._latencies[method_name].append(latency)
+
+    def get_delay(self, method_name: str) -> float:
+        """Seconds to wait for the primary adapter before hedging, the
+        configured percentile of its recent response times"""
+        with self._lock:
+            latencies = sorted(self._latencies[method_name])
+        if len(latencies) < self._min_samples:
+            return max(self._initial_delay, self._min_delay)
+
+        index = math.ceil(self._percentile / 100 * len(latencies)) - 1
+        return max(latencies[max(index, 0)], self._min_delay)
+
+    def record_call(self, method_name: str) -> None:
+        with self._lock:
+            self._stats[method_name]["calls"] += 1
+
+    def acquire_hedge(self, method_name: str) -> bool:
+        """Counts a hedge of the method, unless hedges would exceed the
+        allowed share of its calls"""
+        with self._lock:
+            stats = self._stats[method_name]
+            if stats["fired"] + 1 > self._max_hedge_ratio * stats["calls"]:
+                return False
+            stats["fired"] += 1
+            return True
+
+    def record_win(self, method_name: str) -> None:
+        with self._lock:
+            self._stats[method_name]["won"] += 1
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {
+                method_name: stats.copy()
+                for method_name, stats in self._stats.items()
+            }
@@ -0,0 +1,42 @@
+import functools
+import json
+import re
+
+_CAMEL_CASE_BOUNDARY = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+class RawRecord(dict):
+    """JSON object of a Perun response accessed the way openapi models are,
+    by item or attribute with snake_case names, without the type checks and
+    conversions of the models"""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+@functools.lru_cache(maxsize=1024)
+def _to_snake_case(name: str) -> str:
+    return _CAMEL_CASE_BOUNDARY.sub("_", name).lower()
+
+
+def _to_record(json_object: dict) -> RawRecord:
+    return RawRecord(
+        (_to_snake_case(key), value) for key, value in json_object.items()
+    )
+
+
+def decode_raw_response(response):
+    """Decodes body of the urllib3 response of an API call made with
+    _preload_content=False into RawRecords"""
+    try:
+        data = response.data
+    finally:
+        response.release_conn()
+    if not data:
+        return None
+    return json.loads(data, object_hook=_to_record)
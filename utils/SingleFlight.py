@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Iterable
+
+
+class SingleFlight:
+    """Lets concurrent calls of a method with equal arguments share one
+    execution, the calls which come while it is in flight wait for it and
+    get the same result, or exception, as the call which started it"""
+
+    def __init__(self, methods: Iterable[str]):
+        self.methods = frozenset(methods)
+
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {
+            method_name: {"calls": 0, "collapsed": 0}
+            for method_name in self.methods
+        }
+
+    def is_coalesced(self, method_name: str) -> bool:
+        return method_name in self.methods
+
+    @staticmethod
+    def _get_key(value):
+        """Get hashable value equal for equal arguments, models are compared
+        by their attributes"""
+        if isinstance(value, (list, tuple)):
+            return tuple(SingleFlight._get_key(item) for item in value)
+        if isinstance(value, dict):
+            return tuple(sorted(
+                (key, SingleFlight._get_key(item))
+                for key, item in value.items()
+            ))
+        if isinstance(value, (set, frozenset)):
+            return frozenset(SingleFlight._get_key(item) for item in value)
+        if hasattr(value, "__dict__"):
+            return type(value).__name__, SingleFlight._get_key(vars(value))
+        return value
+
+    def execute(self, method_name: str, function: Callable, *args):
+        key = (method_name, self._get_key(args))
+        with self._lock:
+            self._stats[method_name]["calls"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._stats[method_name]["collapsed"] += 1
+                started = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                started = True
+
+        if not started:
+            return future.result()
+
+        try:
+            result = function(*args)
+        except BaseException as ex:
+            future.set_exception(ex)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def get_stats(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {
+                method_name: dict(stats)
+                for method_name, stats in self._stats.items()
+            }
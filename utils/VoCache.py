@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+from models.VO import VO
+
+
+class VoCache:
+    """Thread-safe cache of VOs shared by the adapters. A VO is kept under
+    both its id and short name, so a lookup by either one fills the cache
+    for the other. VOs which don't exist are remembered for a shorter time,
+    least recently used entries are evicted when the cache is full."""
+
+    def __init__(self, config: dict):
+        self._ttl = float(config.get("ttl_s", 300))
+        self._negative_ttl = float(config.get("negative_ttl_s", 60))
+        self._max_size = int(config.get("max_size", 1000))
+
+        self._lock = threading.Lock()
+        # key -> (expires_at, VO or None for VOs which don't exist)
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0,
+                       "evictions": 0}
+
+    @staticmethod
+    def _get_key(vo_id=None, short_name=None) -> tuple:
+        if vo_id:
+            return "id", int(vo_id)
+        return "short_name", short_name
+
+    def get(self, vo_id=None, short_name=None) -> tuple[bool, Optional[VO]]:
+        """Get (True, VO) for a cached VO, (True, None) for a VO cached as
+        not existing and (False, None) when the VO is not cached"""
+        key = self._get_key(vo_id, short_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            vo = entry[1]
+            self._stats["hits" if vo is not None else "negative_hits"] += 1
+            return True, vo
+
+    def put(self, vo: VO) -> None:
+        expires_at = time.monotonic() + self._ttl
+        with self._lock:
+            self._set(self._get_key(vo_id=vo.id), expires_at, vo)
+            if vo.short_name:
+                self._set(self._get_key(short_name=vo.short_name),
+                          expires_at, vo)
+
+    def put_missing(self, vo_id=None, short_name=None) -> None:
+        """Remembers that the VO does not exist"""
+        expires_at = time.monotonic() + self._negative_ttl
+        with self._lock:
+            self._set(self._get_key(vo_id, short_name), expires_at, None)
+
+    def _set(self, key: tuple, expires_at: float, vo: Optional[VO]) -> None:
+        self._entries[key] = (expires_at, vo)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_or_load(self, load: Callable[[], Optional[VO]], vo_id=None,
+                    short_name=None) -> Optional[VO]:
+        """Get the VO from the cache, or load it and cache the result, load
+        returns None when the VO does not exist"""
+        cached, vo = self.get(vo_id, short_name)
+        if cached:
+            return vo
+
+        vo = load()
+        if vo is not None:
+            self.put(vo)
+        else:
+            self.put_missing(vo_id, short_name)
+        return vo
+
+    def invalidate(self, vo_id=None, short_name=None) -> None:
+        """Drops the VO under both its id and short name, even the ones it
+        was cached under before it was changed"""
+        keys = set()
+        if vo_id:
+            keys.add(self._get_key(vo_id=vo_id))
+        if short_name:
+            keys.add(self._get_key(short_name=short_name))
+        with self._lock:
+            for key in list(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] is not None:
+                    keys.add(self._get_key(vo_id=entry[1].id))
+                    keys.add(self._get_key(short_name=entry[1].short_name))
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def get_many(self, vo_ids: Iterable[int]) -> tuple[dict[int, VO], set]:
+        """Get cached VOs by ids and ids of VOs which are not cached, VOs
+        cached as not existing are left out of both"""
+        vos = {}
+        missing_ids = set()
+        for vo_id in vo_ids:
+            cached, vo = self.get(vo_id=vo_id)
+            if not cached:
+                missing_ids.add(vo_id)
+            elif vo is not None:
+                vos[vo_id] = vo
+        return vos, missing_ids
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats, "size": len(self._entries)}
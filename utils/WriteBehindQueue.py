@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable
+
+from utils.Logger import Logger
+
+
+class WriteBehindQueue:
+    """Collects writes in memory and executes them in the background. Writes
+    of the same key waiting for the next flush are merged into one, the last
+    value wins. Pending writes are flushed in batches executed by a bounded
+    number of threads and when the queue is stopped."""
+
+    def __init__(self, name: str, write: Callable[[Hashable, object], None],
+                 config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._name = name
+        self._write = write
+        self._flush_interval = float(config.get("flush_interval_s", 5))
+        self._batch_size = int(config.get("batch_size", 100))
+        self._max_pending = int(config.get("max_pending", 10000))
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._stats = {"queued": 0, "merged": 0, "rejected": 0,
+                       "written": 0, "failed": 0}
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.get("max_parallel_writes", 4)),
+            thread_name_prefix=f"{self.__class__.__name__}-{name}",
+        )
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, daemon=True,
+            name=f"{self.__class__.__name__}-{self._name}"
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background flushes and writes all pending writes"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        self._executor.shutdown()
+
+    def put(self, key: Hashable, value) -> bool:
+        """Queues the write, returns False when the queue is full and the
+        write has to be executed by the caller"""
+        with self._lock:
+            if key in self._pending:
+                self._stats["merged"] += 1
+            elif len(self._pending) >= self._max_pending:
+                self._stats["rejected"] += 1
+                return False
+            else:
+                self._stats["queued"] += 1
+            self._pending[key] = value
+            return True
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self._flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._pending.items())
+                self._pending = {}
+            if not pending:
+                return
+
+            start = time.perf_counter()
+            for batch_start in range(0, len(pending), self._batch_size):
+                batch = pending[batch_start:batch_start + self._batch_size]
+                futures = [
+                    (key, self._executor.submit(self._write, key, value))
+                    for key, value in batch
+                ]
+                for key, future in futures:
+                    self._record_result(key, future.exception())
+
+            self._logger.debug(
+                f"write_behind_queue.flush - Flushed {len(pending)} writes "
+                f"of {self._name} in {time.perf_counter() - start:.3f}s"
+            )
+
+    def _record_result(self, key: Hashable, ex) -> None:
+        with self._lock:
+            self._stats["failed" if ex is not None else "written"] += 1
+        if ex is not None:
+            self._logger.warning(f"write_behind_queue - Write of {self._name}"
+                                 f" for {key} failed: {ex}")
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import zlib
+from typing import Callable, Optional
+
+from utils.Logger import Logger
+
+
+class WriteJournal:
+    """Append-only journal of writes kept in segment files of a directory.
+    A write is acknowledged once it is synced to the disk, concurrent
+    appends share one fsync. A background thread replays the writes in the
+    order they were appended, retrying failed ones with exponential backoff.
+    The last replayed write is kept in a checkpoint file, so that after a
+    crash the replay continues from it, the write replayed at the time of
+    the crash is replayed again."""
+
+    _SEGMENT_PREFIX = "segment-"
+    _SEGMENT_SUFFIX = ".log"
+    _CHECKPOINT_FILE = "checkpoint"
+
+    def __init__(self, name: str, replay: Callable[[dict], None],
+                 config: dict):
+        self._logger = Logger.get_logger(self.__class__.__name__)
+        self._name = name
+        self._replay = replay
+        self._directory = config["directory"]
+        self._max_segment_size = int(
+            config.get("segment_size_bytes", 16 * 1024 * 1024)
+        )
+        self._initial_backoff = float(config.get("initial_backoff_s", 0.5))
+        self._max_backoff = float(config.get("max_backoff_s", 30))
+
+        # lock order is _sync_lock, then _lock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._records_appended = threading.Condition(self._lock)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats = {"appended": 0, "replayed": 0, "retries": 0}
+
+        os.makedirs(self._directory, exist_ok=True)
+        self._replayed_seq = self._load_checkpoint()
+        self._last_seq = self._recover()
+        self._synced_seq = self._last_seq
+        # next record to be replayed, as (segment path, offset)
+        self._read_position = None
+
+        segments = self._get_segments()
+        if segments:
+            self._segment_path = segments[-1][1]
+        else:
+            self._segment_path = self._get_segment_path(self._last_seq + 1)
+        self._file = open(self._segment_path, "ab")
+        self._segment_size = self._file.tell()
+
+    def _get_segment_path(self, first_seq: int) -> str:
+        return os.path.join(
+            self._directory,
+            f"{self._SEGMENT_PREFIX}{first_seq:020d}{self._SEGMENT_SUFFIX}"
+        )
+
+    def _get_segments(self) -> list[tuple[int, str]]:
+        """Get (first seq, path) of segments, the oldest first"""
+        segments = []
+        for file_name in os.listdir(self._directory):
+            if file_name.startswith(self._SEGMENT_PREFIX) and \
+                    file_name.endswith(self._SEGMENT_SUFFIX):
+                first_seq = int(
+                    file_name[len(self._SEGMENT_PREFIX):
+                              -len(self._SEGMENT_SUFFIX)]
+                )
+                segments.append(
+                    (first_seq, os.path.join(self._directory, file_name))
+                )
+        return sorted(segments)
+
+    @staticmethod
+    def _parse_line(line: bytes) -> Optional[tuple[int, dict]]:
+        """Get seq and record of a journal line, None for a line not written
+        completely"""
+        if not line.endswith(b"\n"):
+            return None
+        try:
+            seq, checksum, data = line[:-1].split(b" ", 2)
+            if int(checksum, 16) != zlib.crc32(data):
+                return None
+            return int(seq), json.loads(data)
+        except ValueError:
+            return None
+
+    def _recover(self) -> int:
+        """Cuts off the record the process was killed while writing, returns
+        seq of the last complete record"""
+        last_seq = self._replayed_seq
+        segments = self._get_segments()
+        for index, (_, path) in enumerate(segments):
+            with open(path, "rb") as f:
+                offset = 0
+                for line in f:
+                    parsed_line = self._parse_line(line)
+                    if parsed_line is None:
+                        break
+                    last_seq = max(last_seq, parsed_line[0])
+                    offset += len(line)
+                else:
+                    continue
+
+            if index != len(segments) - 1:
+                raise Exception(f"Journal segment {path} is corrupted at "
+                                f"offset {offset}")
+            self._logger.warning(f"write_journal - Cutting off incomplete "
+                                 f"record at offset {offset} of {path}")
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+        return last_seq
+
+    def _load_checkpoint(self) -> int:
+        path = os.path.join(self._directory, self._CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r") as f:
+            content = f.read().strip()
+        return int(content) if content else 0
+
+    def _save_checkpoint(self) -> None:
+        path = os.path.join(self._directory, self._CHECKPOINT_FILE)
+        # replace the file at once, so that a crash can't leave it empty
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(str(self._replayed_seq))
+        os.replace(temp_path, path)
+
+    def append(self, record: dict) -> int:
+        """Appends the record and returns once it is synced to the disk"""
+        data = json.dumps(record, separators=(",", ":")).encode()
+
+        with self._lock:
+            needs_rotation = self._segment_size >= self._max_segment_size
+        if needs_rotation:
+            with self._sync_lock, self._lock:
+                if self._segment_size >= self._max_segment_size:
+                    self._rotate()
+
+        with self._lock:
+            seq = self._last_seq + 1
+            line = b"%d %08x %s\n" % (seq, zlib.crc32(data), data)
+            self._file.write(line)
+            self._file.flush()
+            self._segment_size += len(line)
+            self._last_seq = seq
+            self._stats["appended"] += 1
+
+        self._sync(seq)
+        with self._lock:
+            self._records_appended.notify_all()
+        return seq
+
+    def _sync(self, seq: int) -> None:
+        with self._sync_lock:
+            # synced by an append which came later, but synced sooner
+            if self._synced_seq >= seq:
+                return
+            with self._lock:
+                file = self._file
+                last_seq = self._last_seq
+            os.fsync(file.fileno())
+            self._synced_seq = last_seq
+
+    def _rotate(self) -> None:
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._synced_seq = self._last_seq
+        self._segment_path = self._get_segment_path(self._last_seq + 1)
+        self._file = open(self._segment_path, "ab")
+        self._segment_size = 0
+
+    def start(self) -> None:
+        """Starts replaying the journal in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, daemon=True,
+            name=f"{self.__class__.__name__}-{self._name}"
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the replay, writes which were not replayed yet are kept in
+        the journal for the next start"""
+        self._stop_event.set()
+        with self._lock:
+            self._records_appended.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        with self._sync_lock, self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while (
+                    self._last_seq <= self._replayed_seq
+                    and not self._stop_event.is_set()
+                ):
+                    self._records_appended.wait()
+            if self._stop_event.is_set():
+                return
+
+            for seq, record in self._read_records():
+                if not self._replay_record(seq, record):
+                    return
+            self._delete_replayed_segments()
+
+    def _read_records(self) -> list[tuple[int, dict]]:
+        """Reads records which were not replayed yet, continues where the
+        previous read stopped"""
+        segments = self._get_segments()
+        if self._read_position is None:
+            self._read_position = (segments[0][1], 0)
+
+        records = []
+        path, offset = self._read_position
+        for _, segment_path in segments:
+            if segment_path < path:
+                continue
+            if segment_path > path:
+                path, offset = segment_path, 0
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    parsed_line = self._parse_line(line)
+                    # the rest of the line is being appended right now
+                    if parsed_line is None:
+                        break
+                    offset += len(line)
+                    if parsed_line[0] > self._replayed_seq:
+                        records.append(parsed_line)
+
+        self._read_position = (path, offset)
+        return records
+
+    def _replay_record(self, seq: int, record: dict) -> bool:
+        """Replays the record until it succeeds, returns False when the
+        journal was stopped meanwhile. Every exception of the replay is
+        retried, so the replay has to return for a write which can't
+        succeed, otherwise it holds up all records after it."""
+        backoff = self._initial_backoff
+        while True:
+            try:
+                self._replay(record)
+                break
+            except Exception as ex:
+                self._logger.warning(f"write_journal - Replay of record "
+                                     f"{seq} of {self._name} failed, "
+                                     f"retrying in {backoff}s: {ex}")
+                with self._lock:
+                    self._stats["retries"] += 1
+                if self._stop_event.wait(backoff):
+                    return False
+                backoff = min(backoff * 2, self._max_backoff)
+
+        with self._lock:
+            self._replayed_seq = seq
+            self._stats["replayed"] += 1
+        self._save_checkpoint()
+        return True
+
+    def _delete_replayed_segments(self) -> None:
+        segments = self._get_segments()
+        # a segment is replayed when the following one starts after the
+        # last replayed record, the segment being appended to is kept
+        for (_, path), (next_first_seq, _) in zip(segments, segments[1:]):
+            if next_first_seq > self._replayed_seq + 1:
+                break
+            os.remove(path)
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats,
+                    "pending": self._last_seq - self._replayed_seq}